@@ -0,0 +1,64 @@
+import sys
+import time
+
+import utils.airports as airports
+
+# What the hardcoded table in get_airport_code used to return
+LEGACY_CODES = {
+    "malaga": "AGP",
+    "riga": "RIX",
+    "new york": "NYC",
+    "los angeles": "LAX",
+    "london": "LON",
+    "paris": "PAR",
+    "tokyo": "TYO",
+    "sydney": "SYD",
+    "berlin": "BER",
+    "madrid": "MAD",
+}
+
+QUERIES = {
+    "exact": ["Barcelona", "Málaga", "LHR", "New York", "St. Petersburg"],
+    "prefix": ["barcel", "Amster", "Copenh", "Thessal", "Johannes"],
+    "fuzzy": ["Barclona", "Amsterdm", "Copenhagn", "Frankfrt", "Lisbn"],
+}
+
+
+def per_lookup(function, queries, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for query in queries:
+            function(query)
+    return (time.perf_counter() - started) / (rounds * len(queries)) * 1e6
+
+
+def main(rounds=2000):
+    started = time.perf_counter()
+    airports.get_index()
+    print(
+        f"index: {len(airports.get_index().keys)} keys, "
+        f"built in {(time.perf_counter() - started) * 1000:.1f} ms"
+    )
+
+    def uncached(query):
+        airports._match.cache_clear()
+        airports.find_airports(query)
+
+    for kind, queries in QUERIES.items():
+        print(
+            f"{kind:>6}: {per_lookup(uncached, queries, rounds // 10):8.1f} us "
+            f"uncached, {per_lookup(airports.find_airports, queries, rounds):6.2f} "
+            "us cached"
+        )
+
+    wrong = {
+        city: airports.get_airport_code(city)
+        for city, code in LEGACY_CODES.items()
+        if airports.get_airport_code(city) != code
+    }
+    print("legacy cities:", "same codes" if not wrong else f"CHANGED {wrong}")
+    sys.exit(1 if wrong else 0)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,93 @@
+import sys
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+from benchmarks.suite import synthetic_flights_html
+from scrappers.esky_scraper import parse_flight_prices
+from scrappers.eventbrite_scraper import parse_events_json
+from utils.metrics import enable_metrics, metrics, span, timed
+
+# Disabled instrumentation must stay below this share of a parser call
+MAX_DISABLED_OVERHEAD = 0.01
+
+
+def per_call(function, argument, rounds):
+    timings = []
+    with redirect_stdout(StringIO()):
+        for _ in range(rounds):
+            started = time.perf_counter()
+            function(argument)
+            timings.append(time.perf_counter() - started)
+    # Median, a single GC pause should not decide the comparison
+    return sorted(timings)[rounds // 2]
+
+
+def _noop(value):
+    return value
+
+
+def wrapper_cost(rounds):
+    # Nanoseconds a @timed wrapper adds to every call
+    wrapped = timed("benchmark.call")(_noop)
+    costs = []
+    for function in (_noop, wrapped):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            function(None)
+        costs.append((time.perf_counter() - started) / rounds * 1e9)
+    return costs[1] - costs[0]
+
+
+def hook_cost(rounds):
+    # Nanoseconds per span and per counter call in the current state
+    started = time.perf_counter()
+    for _ in range(rounds):
+        with span("benchmark.span"):
+            pass
+    span_ns = (time.perf_counter() - started) / rounds * 1e9
+    started = time.perf_counter()
+    for _ in range(rounds):
+        metrics.count("benchmark.counter")
+    return span_ns, (time.perf_counter() - started) / rounds * 1e9
+
+
+def main(path="page.html", rounds=200):
+    with open(path, encoding="utf-8") as file:
+        events_html = file.read()
+    cases = [
+        ("parse_events_json", parse_events_json, events_html),
+        ("parse_flight_prices", parse_flight_prices, synthetic_flights_html()),
+    ]
+
+    ok = True
+    for name, parser, html in cases:
+        enable_metrics(False)
+        bare = per_call(parser.__wrapped__, html, rounds)
+        disabled = per_call(parser, html, rounds)
+        enable_metrics(True)
+        enabled = per_call(parser, html, rounds)
+        # Both sides are noisy at this scale, so compare the absolute cost
+        # of the disabled wrapper with the work it wraps
+        enable_metrics(False)
+        share = wrapper_cost(rounds * 500) / 1e9 / bare
+        ok = ok and share < MAX_DISABLED_OVERHEAD
+        print(
+            f"{name:>20}: bare {bare * 1000:7.3f} ms, disabled "
+            f"{disabled * 1000:7.3f} ms, enabled {enabled * 1000:7.3f} ms, "
+            f"disabled wrapper {share:.4%} of a call"
+        )
+
+    for state in (False, True):
+        enable_metrics(state)
+        span_ns, count_ns = hook_cost(rounds * 500)
+        print(
+            f"{'enabled' if state else 'disabled':>20}: wrapper "
+            f"{wrapper_cost(rounds * 500):6.0f} ns, span {span_ns:6.0f} ns, "
+            f"counter {count_ns:6.0f} ns"
+        )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
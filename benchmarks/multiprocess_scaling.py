@@ -0,0 +1,95 @@
+import argparse
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+from scrappers.engine import ScrapeEngine, SearchTask
+from scrappers.esky_scraper import parse_flights
+from scrappers.eventbrite_scraper import parse_events
+from scrappers.fixtures import latest_snapshots
+from scrappers.multiprocess import FETCH_BATCH, ScrapePipeline
+
+PARSERS = {"eventbrite": parse_events, "esky": parse_flights}
+
+
+def replay_tasks(copies):
+    # Every stored page, `copies` times over; replay never calls fetch
+    tasks = [
+        SearchTask(site=site, url=entry["url"], fetch=None, parse=parse)
+        for site, parse in PARSERS.items()
+        for entry in latest_snapshots(site)
+    ]
+    return tasks * copies
+
+
+def run_single(tasks):
+    engine = ScrapeEngine(replay=True, cache=False)
+    try:
+        with redirect_stdout(StringIO()):
+            started = time.perf_counter()
+            results = engine.run_many(tasks)
+            return time.perf_counter() - started, results
+    finally:
+        engine.close()
+
+
+def run_processes(tasks, processes):
+    with ScrapePipeline(processes, processes, replay=True, quiet=True) as pipeline:
+        # Warm-up round so every process is started and has imported the parsers
+        list(pipeline.iter_results(tasks[: processes * FETCH_BATCH * 2]))
+        started = time.perf_counter()
+        results = list(pipeline.iter_results(tasks))
+        return time.perf_counter() - started, results
+
+
+def same_items(expected, actual):
+    by_url = {}
+    for result in expected:
+        by_url.setdefault(result.url, result.items)
+    return all(result.ok and by_url[result.url] == result.items for result in actual)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--copies", type=int, default=40, help="Replays per page")
+    parser.add_argument(
+        "--max-processes", type=int, default=os.cpu_count() or 1, help="Largest pool"
+    )
+    args = parser.parse_args()
+
+    tasks = replay_tasks(args.copies)
+    if not tasks:
+        print("No fixtures stored, capture some with TRAVEL_PLANNER_CAPTURE=1")
+        sys.exit(1)
+
+    print(f"{len(tasks)} replayed pages, {os.cpu_count()} CPUs")
+    seconds, expected = run_single(tasks)
+    print(f"single process: {seconds:6.2f}s {len(tasks) / seconds:7.1f} pages/s")
+
+    counts = [1]
+    while counts[-1] * 2 <= args.max_processes:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != args.max_processes:
+        counts.append(args.max_processes)
+
+    ok = True
+    base = None
+    for processes in counts:
+        seconds, results = run_processes(tasks, processes)
+        base = base or seconds
+        speedup = base / seconds
+        identical = len(results) == len(tasks) and same_items(expected, results)
+        ok = ok and identical
+        print(
+            f"{processes:>3} x fetch + {processes:>3} x parse: {seconds:6.2f}s "
+            f"{len(tasks) / seconds:7.1f} pages/s, {speedup:4.2f}x "
+            f"({speedup / processes:.0%} efficiency), "
+            f"{'same items' if identical else 'ITEMS DIFFER'}"
+        )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
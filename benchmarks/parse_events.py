@@ -0,0 +1,36 @@
+import sys
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+from scrappers.eventbrite_scraper import parse_event_cards, parse_events_json
+
+
+def time_parser(parser, html, rounds):
+    timings = []
+    with redirect_stdout(StringIO()):
+        for _ in range(rounds):
+            started = time.perf_counter()
+            events = parser(html)
+            timings.append(time.perf_counter() - started)
+    return min(timings), sum(timings) / rounds, len(events)
+
+
+def main(path="page.html", rounds=20):
+    with open(path, encoding="utf-8") as file:
+        html = file.read()
+
+    print(f"Parsing {path} ({len(html) / 1024:.0f} KiB), {rounds} rounds")
+    results = {}
+    for name, parser in (("json", parse_events_json), ("dom", parse_event_cards)):
+        best, mean, count = time_parser(parser, html, rounds)
+        results[name] = mean
+        print(
+            f"{name:>5}: best {best * 1000:.1f} ms, mean {mean * 1000:.1f} ms, {count} events"
+        )
+
+    print(f"JSON path is {results['dom'] / results['json']:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
@@ -0,0 +1,57 @@
+import sys
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+from scrappers.esky_scraper import parse_flight_prices
+from scrappers.eventbrite_scraper import parse_event_cards
+from scrappers.html_backend import available_backends
+
+FLIGHTS_HTML = (
+    "<html><body><main>"
+    '<so-fsr-flight-block><span class="amount">1 234</span>'
+    '<span class="currency">EUR</span></so-fsr-flight-block>'
+    '<so-fsr-flight-block><span class="price amount"> 99 </span>'
+    '<span class="currency">€</span></so-fsr-flight-block>'
+    '<so-fsr-flight-block><span class="amount">5</span></so-fsr-flight-block>'
+    "</main></body></html>"
+)
+
+
+def check_parity(events_html):
+    # Every backend has to produce exactly what html.parser produces
+    with redirect_stdout(StringIO()):
+        expected_events = parse_event_cards(events_html, backend="html.parser")
+    expected_flights = parse_flight_prices(FLIGHTS_HTML, backend="html.parser")
+
+    for backend in available_backends():
+        with redirect_stdout(StringIO()):
+            events = parse_event_cards(events_html, backend=backend)
+        flights = parse_flight_prices(FLIGHTS_HTML, backend=backend)
+
+        if events != expected_events or flights != expected_flights:
+            raise AssertionError(f"{backend} output differs from html.parser")
+        print(f"{backend}: identical output ({len(events)} events)")
+
+
+def main(path="page.html", rounds=10):
+    with open(path, encoding="utf-8") as file:
+        html = file.read()
+
+    check_parity(html)
+
+    for backend in available_backends():
+        timings = []
+        with redirect_stdout(StringIO()):
+            for _ in range(rounds):
+                started = time.perf_counter()
+                parse_event_cards(html, backend=backend)
+                timings.append(time.perf_counter() - started)
+        print(
+            f"{backend:>12}: best {min(timings) * 1000:.1f} ms, "
+            f"mean {sum(timings) / rounds * 1000:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
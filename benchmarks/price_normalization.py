@@ -0,0 +1,55 @@
+import random
+import sys
+import time
+
+import pandas as pd
+
+from utils.data_processing import normalize_price, normalize_price_series
+
+SAMPLES = [
+    "123 EUR",
+    "1 099 EUR",
+    "1\xa0234,50 zł",
+    "From $30.44",
+    "$25",
+    "US$ 1,234.56",
+    "12,5 €",
+    "£ 45",
+    "Free",
+    "",
+    None,
+]
+
+
+def main(size=100_000):
+    random.seed(1)
+    # Mostly unique strings, like a database backfill rather than one scrape
+    texts = [
+        f"{random.randint(1, 5000)} EUR" if index % 2 else random.choice(SAMPLES)
+        for index in range(size)
+    ]
+
+    started = time.perf_counter()
+    scalar = [normalize_price(text) for text in texts]
+    scalar_seconds = time.perf_counter() - started
+
+    series = pd.Series(texts, dtype=object)
+    started = time.perf_counter()
+    frame = normalize_price_series(series)
+    vector_seconds = time.perf_counter() - started
+
+    vector = [
+        (None if pd.isna(amount) else amount, currency)
+        for amount, currency in frame.itertuples(index=False)
+    ]
+    mismatches = sum(left != right for left, right in zip(scalar, vector))
+
+    print(f"{size} prices")
+    print(f"per string: {scalar_seconds * 1000:.0f} ms")
+    print(f"    series: {vector_seconds * 1000:.0f} ms")
+    print(f"speedup {scalar_seconds / vector_seconds:.1f}x, {mismatches} mismatches")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
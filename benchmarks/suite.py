@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from io import StringIO
+
+from scrappers.esky_scraper import API_SOURCE, parse_flight_prices, parse_flights
+from scrappers.eventbrite_scraper import parse_events
+from scrappers.fixtures import latest_snapshots, read_snapshot
+from utils.data_processing import process_flight_prices
+
+THRESHOLDS_FILE = os.path.join(os.path.dirname(__file__), "thresholds.json")
+
+
+def synthetic_flights_html(blocks=200, seed=1):
+    # No eSky capture is stored yet, so the flight parser runs on generated blocks
+    rng = random.Random(seed)
+    rows = [
+        f'<so-fsr-flight-block><div class="price"><span class="amount">'
+        f'{rng.randint(40, 2400):,}</span> <span class="currency">EUR</span>'
+        f"</div></so-fsr-flight-block>"
+        for _ in range(blocks)
+    ]
+    return "<html><body><main>" + "".join(rows) + "</main></body></html>"
+
+
+def synthetic_search_results(offers=200, seed=1):
+    # Search API capture in the shape fetch_search_results stores
+    rng = random.Random(seed)
+    results = [
+        {
+            "totalPrice": {"amount": rng.randint(40, 2400), "currency": "EUR"},
+            "airlineName": rng.choice(["airBaltic", "Lufthansa", "LOT"]),
+            "segments": [
+                {
+                    "departureDateTime": f"2025-05-01T{rng.randint(6, 12):02d}:05",
+                    "arrivalDateTime": f"2025-05-01T{rng.randint(13, 23):02d}:40",
+                    "duration": f"PT{rng.randint(1, 9)}H{rng.randint(0, 59)}M",
+                }
+                for _ in range(rng.randint(1, 3))
+            ],
+        }
+        for _ in range(offers)
+    ]
+    return json.dumps(
+        {
+            "source": API_SOURCE,
+            "url": "https://www.esky.com/flights/search",
+            "responses": [{"status": "Completed", "results": results}],
+        }
+    )
+
+
+def synthetic_price_list(count=5000, seed=1):
+    rng = random.Random(seed)
+    formats = ("{} EUR", "€{}", "${}", "{} USD", "£{}")
+    return [
+        rng.choice(formats).format(f"{rng.uniform(20, 3000):,.2f}")
+        for _ in range(count)
+    ]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def measure(fn, payload, rounds):
+    timings = []
+    items = 0
+    with redirect_stdout(StringIO()):
+        fn(payload)
+        for _ in range(rounds):
+            started = time.perf_counter()
+            items = len(fn(payload))
+            timings.append(time.perf_counter() - started)
+
+        tracemalloc.start()
+        fn(payload)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    total = sum(timings)
+    return {
+        "p50_ms": percentile(timings, 0.50) * 1000,
+        "p95_ms": percentile(timings, 0.95) * 1000,
+        "p99_ms": percentile(timings, 0.99) * 1000,
+        "peak_mib": peak / 1024 / 1024,
+        "items": items,
+        "items_per_second": items * rounds / total if total else 0.0,
+    }
+
+
+def benchmark_cases():
+    cases = []
+    for entry in latest_snapshots("eventbrite"):
+        cases.append(("parse_events", parse_events, read_snapshot(entry)))
+    for entry in latest_snapshots("esky"):
+        cases.append(("parse_flights", parse_flights, read_snapshot(entry)))
+    cases.append(("parse_flight_prices", parse_flight_prices, synthetic_flights_html()))
+    cases.append(("parse_flights", parse_flights, synthetic_search_results()))
+    cases.append(
+        ("process_flight_prices", process_flight_prices, synthetic_price_list())
+    )
+    return cases
+
+
+def check_thresholds(name, stats, thresholds):
+    failures = []
+    for metric, limit in thresholds.get(name, {}).items():
+        if metric.startswith("min_"):
+            value = stats[metric[4:]]
+            if value < limit:
+                failures.append(f"{name} {metric[4:]} {value:.1f} < {limit}")
+        elif stats[metric] > limit:
+            failures.append(f"{name} {metric} {stats[metric]:.1f} > {limit}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parser benchmark suite")
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args(argv)
+
+    with open(THRESHOLDS_FILE, encoding="utf-8") as file:
+        thresholds = json.load(file)
+
+    results = []
+    failures = []
+    for name, fn, payload in benchmark_cases():
+        stats = measure(fn, payload, args.rounds)
+        results.append({"name": name, **stats})
+        failures += check_thresholds(name, stats, thresholds)
+        print(
+            f"{name:<22} p50 {stats['p50_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms  "
+            f"p99 {stats['p99_ms']:8.2f} ms  peak {stats['peak_mib']:6.1f} MiB  "
+            f"{stats['items_per_second']:10.0f} items/s"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
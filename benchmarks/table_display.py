@@ -0,0 +1,119 @@
+import random
+import sys
+import time
+
+import pandas as pd
+
+from utils.table_display import format_events, format_flights
+
+
+def legacy_format_flights(df):
+    # The per-row formatting get_flights_table used before, kept as reference
+    df["return_date"] = df["return_date"].fillna("One-way")
+    df["price"] = df["price"].map(lambda x: f"{x:,.2f}")
+    df["full_price"] = df.apply(lambda row: f"{row['price']} {row['currency']}", axis=1)
+    df["departure_date"] = pd.to_datetime(df["departure_date"]).dt.strftime("%b %d, %Y")
+    df["search_date"] = pd.to_datetime(df["search_date"]).dt.strftime("%b %d, %Y %H:%M")
+    mask = df["return_date"] != "One-way"
+    if mask.any():
+        df.loc[mask, "return_date"] = pd.to_datetime(
+            df.loc[mask, "return_date"]
+        ).dt.strftime("%b %d, %Y")
+    return df
+
+
+def legacy_format_events(df):
+    df["search_date"] = pd.to_datetime(df["search_date"]).dt.strftime("%b %d, %Y %H:%M")
+    df["title"] = df["title"].apply(lambda x: x[:50] + "..." if len(x) > 50 else x)
+    df["location"] = df["location"].apply(
+        lambda x: x[:30] + "..." if len(x) > 30 else x
+    )
+    return df
+
+
+def flight_frame(size):
+    random.seed(1)
+    prices = [round(random.uniform(0, 3_000_000), random.choice([0, 1, 2, 3]))]
+    prices += [random.choice([9.995, 0.005, -12.5, 1e9]) for _ in range(10)]
+    prices += [round(random.lognormvariate(5, 2), 2) for _ in range(size - 11)]
+    return pd.DataFrame(
+        {
+            "departure_city": "Riga",
+            "departure_code": "RIX",
+            "destination_city": "New York",
+            "destination_code": "JFK",
+            "departure_date": "2025-05-01",
+            "return_date": [
+                None if index % 3 else "2025-05-08" for index in range(size)
+            ],
+            "price": prices,
+            "currency": [
+                random.choice(["EUR", "USD", "PLN", None]) for _ in range(size)
+            ],
+            "seats": 1,
+            "search_date": [
+                f"2025-04-{random.randint(1, 30):02d} "
+                f"{random.randint(0, 23):02d}:{random.randint(0, 59):02d}:00"
+                for _ in range(size)
+            ],
+        }
+    )
+
+
+def event_frame(size):
+    random.seed(2)
+    words = ["Jazz", "Night", "Brooklyn", "Rooftop", "Party", "Festival", "Ñandú"]
+    return pd.DataFrame(
+        {
+            "city": "New York",
+            "title": [
+                " ".join(random.choices(words, k=random.randint(1, 12)))
+                for _ in range(size)
+            ],
+            "datetime": "Sat, Apr 19 • 10:30 PM",
+            "location": [
+                " ".join(random.choices(words, k=random.randint(1, 7)))
+                for _ in range(size)
+            ],
+            "price": "$25",
+            "url": "https://www.eventbrite.com/e/1",
+            "search_date": "2025-04-11 11:28:59",
+        }
+    )
+
+
+def compare(name, frame, legacy, vectorized):
+    started = time.perf_counter()
+    expected = legacy(frame.copy())
+    legacy_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    actual = vectorized(frame.copy())
+    vectorized_seconds = time.perf_counter() - started
+
+    same = list(expected.columns) == list(actual.columns) and all(
+        expected[column].astype(object).tolist()
+        == actual[column].astype(object).tolist()
+        for column in expected.columns
+    )
+    same = same and expected.head(200).to_string() == actual.head(200).to_string()
+    print(
+        f"{name:>7}: per row {legacy_seconds * 1000:.0f} ms, "
+        f"vectorized {vectorized_seconds * 1000:.0f} ms "
+        f"({legacy_seconds / vectorized_seconds:.1f}x), "
+        f"{'identical' if same else 'OUTPUT DIFFERS'}"
+    )
+    return same
+
+
+def main(size=100_000):
+    print(f"{size} rows")
+    results = [
+        compare("flights", flight_frame(size), legacy_format_flights, format_flights),
+        compare("events", event_frame(size), legacy_format_events, format_events),
+    ]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
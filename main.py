@@ -1,12 +1,33 @@
-import threading
+import argparse
+from functools import partial
 
-from scrappers.esky_scraper import get_flight_prices
-from scrappers.eventbrite_scraper import get_events
+from scrappers.engine import DEFAULT_SESSION_TABS, get_engine
+from scrappers.esky_scraper import flight_search_task
+from scrappers.eventbrite_scraper import event_search_task
+from utils.airports import get_airport_code
+from utils.batch_search import (
+    dedupe_queries,
+    load_queries,
+    run_batch,
+    run_event_batch,
+)
 from utils.database import (
+    get_known_event_ids,
     initialize_db,
-    save_events,
-    save_flight_prices,
+    save_fetched_events,
+    save_fetched_flights,
+)
+from utils.export import CHUNK_ROWS, available_formats, export_data
+from utils.flex_search import display_price_calendar, flexible_search
+from utils.job_queue import (
+    LEASE_SECONDS,
+    describe_job,
+    display_queue_status,
+    get_queue_status,
+    submit_job,
 )
+from utils.metrics import enable_metrics, metrics_dir, serve_metrics, write_metrics
+from utils.monitor import HOURLY_BUDGET, display_monitor_status, run_monitor
 from utils.table_display import (
     display_combined_table,
     display_event_table,
@@ -14,48 +35,7 @@ from utils.table_display import (
     get_events_table,
     get_flights_table,
 )
-
-
-def get_airport_code(city):
-    airport_codes = {
-        "malaga": "AGP",
-        "riga": "RIX",
-        "new york": "NYC",
-        "los angeles": "LAX",
-        "london": "LON",
-        "paris": "PAR",
-        "tokyo": "TYO",
-        "sydney": "SYD",
-        "berlin": "BER",
-        "madrid": "MAD",
-    }
-    return airport_codes.get(city.lower(), city.upper()[:3])
-
-
-# Run eSky scraper
-def scrape_esky(
-    departure_code, destination_code, departure_date, return_date, seats, results
-):
-    print("\nSearching for flights...")
-    prices, search_url = get_flight_prices(
-        departure_code,
-        destination_code,
-        departure_date,
-        return_date or "",
-        seats,
-    )
-
-    results["flight_prices"] = prices
-    results["flight_url"] = search_url
-
-
-# Run Eventbrite scraper
-def scrape_eventbrite(destination_city, departure_date, results):
-    print(f"\nSearching for events in {destination_city}...")
-    events, events_url = get_events(destination_city, departure_date)
-
-    results["events"] = events
-    results["events_url"] = events_url
+from utils.worker import DEFAULT_SLOTS, run_worker
 
 
 def main():
@@ -81,62 +61,55 @@ def main():
     )
     print(f"Passengers: {user_data['seats']}")
 
-    results = {"flight_prices": [], "flight_url": "", "events": [], "events_url": ""}
-
-    # Start scrapers in parallel threads
-    flight_thread = threading.Thread(
-        target=scrape_esky,
-        args=(
-            departure_code,
-            destination_code,
-            user_data["departure_date"],
-            user_data["return_date"],
-            user_data["seats"],
-            results,
+    # Run both scrapers concurrently on the shared engine
+    print("\nSearching for flights...")
+    print(f"\nSearching for events in {user_data['destination_city']}...")
+    flight_task = flight_search_task(
+        departure_code,
+        destination_code,
+        user_data["departure_date"],
+        user_data["return_date"] or "",
+        user_data["seats"],
+    )
+    # The engine saves every live result, background cache refreshes included
+    flight_task.on_fetched = partial(
+        save_fetched_flights,
+        dict(
+            user_data, departure_code=departure_code, destination_code=destination_code
         ),
     )
-
-    event_thread = threading.Thread(
-        target=scrape_eventbrite,
-        args=(user_data["destination_city"], user_data["departure_date"], results),
+    event_task = event_search_task(
+        user_data["destination_city"],
+        user_data["departure_date"],
+        known_ids=get_known_event_ids(user_data["destination_city"]),
     )
-
-    flight_thread.start()
-    event_thread.start()
-
-    flight_thread.join()
-    event_thread.join()
+    event_task.on_fetched = partial(save_fetched_events, user_data["destination_city"])
+    flight_result, event_result = get_engine().run_many([flight_task, event_task])
 
     # Process flight results
-    prices = results["flight_prices"]
-    if prices:
+    prices = flight_result.items
+    if flight_result.cached:
+        print(f"\n{len(prices)} flight prices served from cache")
+    elif prices:
         # print("\nPrices found:")
         # for i, price in enumerate(prices, 1):
         #     print(f"{i}. {price}")
         #
-        save_flight_prices(
-            user_data["departure_city"],
-            departure_code,
-            user_data["destination_city"],
-            destination_code,
-            user_data["departure_date"],
-            user_data["return_date"],
-            prices,
-            user_data["seats"],
-        )
+        print(f"\n{len(prices)} flight prices saved")
     else:
         print("\nNo flights found")
 
     # Process event results
-    events = results["events"]
-    if events:
+    events = event_result.items
+    if event_result.cached:
+        print(f"\n{len(events)} events served from cache")
+    elif events:
         print(f"\nFound {len(events)} events in {user_data['destination_city']}:")
         # for i, event in enumerate(events[:5], 1):  # Limit to first 5 events for display
         # print(f"\n{i}. {event.get('title', 'No title')}")
         # print(f"   When: {event.get('datetime', 'No date')}")
         # print(f"   Where: {event.get('location', 'No location')}")
         # print(f"   Price: {event.get('price', 'No price')}")
-        save_events(user_data["destination_city"], events)
     else:
         print(f"\nNo events found in {user_data['destination_city']}")
 
@@ -161,5 +134,268 @@ def main():
     print("\nDone!")
 
 
+def batch_command(args):
+    initialize_db()
+    queries = load_queries(args.spec)
+    run_batch(
+        queries,
+        max_parallel=args.parallel,
+        processes=args.processes,
+        parse_processes=args.parse_processes,
+    )
+
+
+def events_command(args):
+    initialize_db()
+    run_event_batch(
+        args.cities,
+        args.start_date,
+        args.end_date,
+        max_parallel=args.parallel,
+        processes=args.processes,
+        parse_processes=args.parse_processes,
+    )
+
+
+def flex_command(args):
+    initialize_db()
+    calendar = flexible_search(
+        args.departure_city,
+        args.destination_city,
+        args.departure_date,
+        args.return_date,
+        days=args.days,
+        seats=args.seats,
+        tabs=args.tabs,
+    )
+    display_price_calendar(calendar)
+
+
+def submit_command(args):
+    initialize_db()
+    if args.kind == "events":
+        jobs = [
+            (
+                "events",
+                {
+                    "city": " ".join(city.split()),
+                    "start_date": args.start_date,
+                    "end_date": args.end_date,
+                },
+            )
+            for city in args.cities
+        ]
+    else:
+        if args.kind == "batch":
+            queries = load_queries(args.spec)
+        else:
+            queries = [
+                {
+                    "departure_city": args.departure_city,
+                    "destination_city": args.destination_city,
+                    "departure_date": args.departure_date,
+                    "return_date": args.return_date,
+                    "seats": args.seats,
+                }
+            ]
+        jobs = [("flights", query) for query in dedupe_queries(queries)]
+
+    created = 0
+    for kind, params in jobs:
+        job_id, new = submit_job(kind, params, priority=args.priority)
+        created += new
+        print(f"Job #{job_id}: {describe_job({'kind': kind, 'params': params})}")
+    print(f"Queued {created} jobs, {len(jobs) - created} were already pending")
+
+
+def worker_command(args):
+    run_worker(slots=args.slots, lease_seconds=args.lease, once=args.once)
+
+
+def jobs_command(args):
+    initialize_db()
+    display_queue_status(get_queue_status(limit=args.limit))
+
+
+def monitor_command(args):
+    initialize_db()
+    if args.status:
+        display_monitor_status()
+    else:
+        run_monitor(budget=args.budget, enqueue=args.queue, max_parallel=args.parallel)
+
+
+def export_command(args):
+    initialize_db()
+    export_data(
+        args.dataset,
+        args.output,
+        export_format=args.format,
+        chunk_size=args.chunk_size,
+        origin=args.origin,
+        destination=args.destination,
+        city=args.city,
+        departure_from=args.departure_from,
+        departure_to=args.departure_to,
+        searched_from=args.searched_from,
+        searched_to=args.searched_to,
+    )
+
+
+def add_process_arguments(parser):
+    parser.add_argument(
+        "--processes",
+        type=int,
+        help="Fetch in this many processes, each with its own browser",
+    )
+    parser.add_argument(
+        "--parse-processes",
+        type=int,
+        help="Parser processes with --processes (default: one per CPU)",
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Plan your travels")
+    parser.add_argument(
+        "--metrics",
+        metavar="DIR",
+        default=metrics_dir(),
+        help="Time the scrapes and database writes, writing a JSON summary "
+        "and a Prometheus text file to DIR at exit",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve the metrics on http://127.0.0.1:PORT/metrics while running",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    batch = subparsers.add_parser("batch", help="Run many flight searches at once")
+    batch.add_argument("spec", help="CSV/JSON list of searches or a JSON grid spec")
+    batch.add_argument(
+        "--parallel", type=int, default=16, help="Maximum searches in flight"
+    )
+    add_process_arguments(batch)
+
+    events = subparsers.add_parser("events", help="Search events in many cities")
+    events.add_argument("cities", nargs="+", help="City names")
+    events.add_argument("--start-date", required=True, help="YYYY-MM-DD")
+    events.add_argument("--end-date", help="YYYY-MM-DD, end of the date window")
+    events.add_argument(
+        "--parallel", type=int, default=8, help="Maximum cities in flight"
+    )
+    add_process_arguments(events)
+
+    flex = subparsers.add_parser("flex", help="Flight prices for nearby dates")
+    flex.add_argument("departure_city")
+    flex.add_argument("destination_city")
+    flex.add_argument("departure_date", help="YYYY-MM-DD")
+    flex.add_argument("return_date", nargs="?", help="YYYY-MM-DD, omit for one-way")
+    flex.add_argument(
+        "--days", type=int, default=3, help="Days searched either side of each date"
+    )
+    flex.add_argument("--seats", type=int, default=1)
+    flex.add_argument(
+        "--tabs", type=int, default=DEFAULT_SESSION_TABS, help="Parallel tabs"
+    )
+
+    submit = subparsers.add_parser("submit", help="Queue searches for the worker")
+    submit.add_argument("--priority", type=int, default=0, help="Higher runs first")
+    kinds = submit.add_subparsers(dest="kind", required=True)
+    flights = kinds.add_parser("flights", help="One flight search")
+    flights.add_argument("departure_city")
+    flights.add_argument("destination_city")
+    flights.add_argument("departure_date", help="YYYY-MM-DD")
+    flights.add_argument("return_date", nargs="?", help="YYYY-MM-DD, omit for one-way")
+    flights.add_argument("--seats", type=int, default=1)
+    submit_batch = kinds.add_parser("batch", help="Flight searches from a spec")
+    submit_batch.add_argument("spec", help="CSV/JSON list of searches or a grid spec")
+    submit_events = kinds.add_parser("events", help="Event searches")
+    submit_events.add_argument("cities", nargs="+", help="City names")
+    submit_events.add_argument("--start-date", required=True, help="YYYY-MM-DD")
+    submit_events.add_argument("--end-date", help="YYYY-MM-DD")
+
+    worker = subparsers.add_parser("worker", help="Run queued searches")
+    worker.add_argument(
+        "--slots", type=int, default=DEFAULT_SLOTS, help="Jobs running at once"
+    )
+    worker.add_argument(
+        "--lease", type=int, default=LEASE_SECONDS, help="Job lease in seconds"
+    )
+    worker.add_argument(
+        "--once", action="store_true", help="Exit when the queue is empty"
+    )
+
+    jobs = subparsers.add_parser("jobs", help="Show the job queue")
+    jobs.add_argument("--limit", type=int, default=10, help="Recent jobs listed")
+
+    monitor = subparsers.add_parser(
+        "monitor", help="Re-check the saved routes that most need it"
+    )
+    monitor.add_argument(
+        "--budget", type=int, default=HOURLY_BUDGET, help="Searches per hour"
+    )
+    monitor.add_argument(
+        "--queue", action="store_true", help="Submit to the job queue instead"
+    )
+    monitor.add_argument(
+        "--parallel", type=int, default=8, help="Maximum searches in flight"
+    )
+    monitor.add_argument(
+        "--status", action="store_true", help="Show freshness and budget use"
+    )
+
+    export = subparsers.add_parser("export", help="Export saved flights or events")
+    export.add_argument("dataset", choices=["flights", "events"])
+    export.add_argument("output", help="Output file, .csv, .jsonl or .parquet")
+    export.add_argument(
+        "--format", choices=available_formats(), help="Override the file extension"
+    )
+    export.add_argument("--origin", help="Departure city or airport code")
+    export.add_argument("--destination", help="Destination city or airport code")
+    export.add_argument("--city", help="Event city")
+    export.add_argument("--departure-from", help="First departure date, YYYY-MM-DD")
+    export.add_argument("--departure-to", help="Last departure date, YYYY-MM-DD")
+    export.add_argument("--searched-from", help="First search date, YYYY-MM-DD")
+    export.add_argument("--searched-to", help="Last search date, YYYY-MM-DD")
+    export.add_argument(
+        "--chunk-size", type=int, default=CHUNK_ROWS, help="Rows fetched at a time"
+    )
+
+    return parser.parse_args(argv)
+
+
+def run_command(args):
+    if args.command == "batch":
+        batch_command(args)
+    elif args.command == "events":
+        events_command(args)
+    elif args.command == "flex":
+        flex_command(args)
+    elif args.command == "submit":
+        submit_command(args)
+    elif args.command == "worker":
+        worker_command(args)
+    elif args.command == "jobs":
+        jobs_command(args)
+    elif args.command == "monitor":
+        monitor_command(args)
+    elif args.command == "export":
+        export_command(args)
+    else:
+        main()
+
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.metrics or args.metrics_port:
+        enable_metrics()
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    try:
+        run_command(args)
+    finally:
+        if args.metrics:
+            summary = write_metrics(args.metrics, args.command)
+            print(f"Metrics written to {summary}")
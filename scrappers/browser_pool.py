@@ -0,0 +1,103 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from playwright.async_api import async_playwright
+
+from utils.metrics import metrics
+
+POOL_SIZE = 2
+MAX_PAGES_PER_BROWSER = 50
+
+
+class _Slot:
+    def __init__(self):
+        self.browser = None
+        self.pages_served = 0
+
+
+class BrowserPool:
+    # Keeps `size` warm Chromium instances on one event loop. Every page is
+    # opened in a fresh, isolated context; many contexts share a browser.
+    def __init__(self, size=POOL_SIZE, max_pages=MAX_PAGES_PER_BROWSER, headless=True):
+        self.size = size
+        self.max_pages = max_pages
+        self.headless = headless
+        self._slots = [_Slot() for _ in range(size)]
+        self._active = {}
+        self._playwright = None
+        self._lock = None
+
+    async def start(self):
+        if self._playwright is None:
+            self._lock = asyncio.Lock()
+            self._playwright = await async_playwright().start()
+
+    async def close(self):
+        for slot in self._slots:
+            if slot.browser:
+                await _close_quietly(slot.browser)
+                slot.browser = None
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+
+    @asynccontextmanager
+    async def context(self):
+        # For several tabs that should share cookies, e.g. paginated listings
+        browser = await self._acquire()
+        try:
+            with metrics.span("browser.new_context"):
+                context = await browser.new_context()
+            try:
+                yield context
+            finally:
+                await _close_quietly(context)
+        finally:
+            await self._release(browser)
+
+    @asynccontextmanager
+    async def page(self):
+        async with self.context() as context:
+            yield await context.new_page()
+
+    async def _acquire(self):
+        await self.start()
+        async with self._lock:
+            slot = min(self._slots, key=lambda s: self._active.get(s.browser, 0))
+
+            # Recycle after a number of pages or when the browser died
+            if slot.browser and (
+                slot.pages_served >= self.max_pages or not slot.browser.is_connected()
+            ):
+                retired = slot.browser
+                slot.browser = None
+                if not self._active.get(retired):
+                    self._active.pop(retired, None)
+                    await _close_quietly(retired)
+
+            if slot.browser is None:
+                with metrics.span("browser.launch"):
+                    slot.browser = await self._playwright.chromium.launch(
+                        headless=self.headless
+                    )
+                slot.pages_served = 0
+
+            slot.pages_served += 1
+            self._active[slot.browser] = self._active.get(slot.browser, 0) + 1
+            return slot.browser
+
+    async def _release(self, browser):
+        self._active[browser] -= 1
+        if self._active[browser] == 0 and all(
+            slot.browser is not browser for slot in self._slots
+        ):
+            # Retired browser finished its last page
+            del self._active[browser]
+            await _close_quietly(browser)
+
+
+async def _close_quietly(resource):
+    try:
+        await resource.close()
+    except Exception:
+        pass
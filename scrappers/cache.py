@@ -0,0 +1,184 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import replace
+
+from utils.db_connection import get_connection
+from utils.migrations import migrate
+
+# How long results count as fresh, then how much longer a stale copy may be
+# served while it is refreshed in the background
+CACHE_TTLS = {"esky": 15 * 60, "eventbrite": 6 * 60 * 60}
+STALE_TTLS = {"esky": 45 * 60, "eventbrite": 18 * 60 * 60}
+DEFAULT_TTL = 15 * 60
+DEFAULT_STALE_TTL = 15 * 60
+MEMORY_ENTRIES = 1024
+
+CACHE_ENABLED = os.environ.get("TRAVEL_PLANNER_CACHE", "1") != "0"
+
+
+def cache_key(site, *parts):
+    normalized = [" ".join(str(part).split()).casefold() for part in parts]
+    return site + ":" + json.dumps(normalized, ensure_ascii=False)
+
+
+class SearchCache:
+    # Memory LRU in front of the search_cache table. Lives on the engine loop,
+    # so only database calls leave the loop thread.
+    def __init__(self, ttls=None, stale_ttls=None, memory_entries=MEMORY_ENTRIES):
+        self.ttls = dict(CACHE_TTLS, **(ttls or {}))
+        self.stale_ttls = dict(STALE_TTLS, **(stale_ttls or {}))
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self._refreshing = {}
+        self._migrated = False
+        self.metrics = {
+            "hits": 0,
+            "memory_hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "shared": 0,
+            "refreshes": 0,
+            "stores": 0,
+        }
+
+    async def lookup(self, task):
+        # (items, age, stale) for a usable entry, None on a miss
+        entry = await self._lookup(task.cache_key)
+        if entry:
+            items, fetched_at = entry
+            age = time.time() - fetched_at
+            ttl = self.ttls.get(task.site, DEFAULT_TTL)
+
+            if age < ttl:
+                self.metrics["hits"] += 1
+                return items, age, False
+
+            if age < ttl + self.stale_ttls.get(task.site, DEFAULT_STALE_TTL):
+                self.metrics["stale_hits"] += 1
+                return items, age, True
+
+        self.metrics["misses"] += 1
+        return None
+
+    async def single_flight(self, task, fetch):
+        # Concurrent identical searches wait on the one page load in progress
+        key = task.cache_key
+        if key in self._inflight:
+            self.metrics["shared"] += 1
+            result = await asyncio.shield(self._inflight[key])
+            return replace(result, task=task)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await fetch(task)
+            if result.ok and result.items:
+                await self._store(task, result.items)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody else may be waiting, don't log "exception never retrieved"
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def refresh(self, task, fetch):
+        # True when this call started a background fetch
+        key = task.cache_key
+        if key in self._refreshing or key in self._inflight:
+            return False
+        self.metrics["refreshes"] += 1
+
+        async def run():
+            try:
+                await self.single_flight(task, fetch)
+            except Exception as e:
+                print(f"Refreshing {task.url} failed: {e}")
+            finally:
+                del self._refreshing[key]
+
+        self._refreshing[key] = asyncio.ensure_future(run())
+        return True
+
+    async def wait_refreshes(self, timeout):
+        # Lets refreshes started by a short-lived command save their results
+        if not self._refreshing:
+            return
+        print(f"Waiting for {len(self._refreshing)} background cache refreshes...")
+        await asyncio.wait(list(self._refreshing.values()), timeout=timeout)
+
+    async def _lookup(self, key):
+        entry = self._memory.get(key)
+        if entry:
+            self._memory.move_to_end(key)
+            self.metrics["memory_hits"] += 1
+            return entry
+
+        loop = asyncio.get_running_loop()
+        entry = await loop.run_in_executor(None, self._load_persistent, key)
+        if entry:
+            self._remember(key, entry)
+        return entry
+
+    async def _store(self, task, items):
+        entry = (items, time.time())
+        self._remember(task.cache_key, entry)
+        self.metrics["stores"] += 1
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._save_persistent, task, entry)
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _connection(self):
+        conn = get_connection()
+        if not self._migrated:
+            migrate(conn)
+            self._migrated = True
+        return conn
+
+    def _load_persistent(self, key):
+        row = (
+            self._connection()
+            .execute(
+                "SELECT items, fetched_at FROM search_cache WHERE cache_key = ?",
+                (key,),
+            )
+            .fetchone()
+        )
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def _save_persistent(self, task, entry):
+        items, fetched_at = entry
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO search_cache (cache_key, site, url, items, fetched_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (cache_key) DO UPDATE SET
+                    url = excluded.url,
+                    items = excluded.items,
+                    fetched_at = excluded.fetched_at
+                """,
+                (task.cache_key, task.site, task.url, json.dumps(items), fetched_at),
+            )
+
+    def stats(self):
+        served = self.metrics["hits"] + self.metrics["stale_hits"]
+        lookups = served + self.metrics["misses"]
+        return dict(
+            self.metrics,
+            lookups=lookups,
+            hit_rate=served / lookups if lookups else 0.0,
+        )
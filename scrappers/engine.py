@@ -0,0 +1,421 @@
+import asyncio
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+
+from scrappers.browser_pool import BrowserPool
+from scrappers.cache import CACHE_ENABLED, SearchCache
+from scrappers.fixtures import load_snapshot, save_snapshot
+from scrappers.interception import (
+    install_context_interception,
+    install_interception,
+)
+from scrappers.rate_limit import (
+    DEFAULT_RETRIES,
+    SITE_RETRIES,
+    RateLimiter,
+    backoff_delay,
+)
+from utils.metrics import metrics
+
+SITE_CONCURRENCY = {"esky": 8, "eventbrite": 8}
+SITE_TIMEOUTS = {"esky": 90, "eventbrite": 90}
+DEFAULT_CONCURRENCY = 4
+DEFAULT_TIMEOUT = 90
+DEFAULT_MAX_PARALLEL = 16
+DEFAULT_SESSION_TABS = 4
+# How long shutdown waits for background cache refreshes to finish and save
+REFRESH_GRACE = 60
+
+# Replay serves pages from the fixtures store, capture records live pages into it
+REPLAY = os.environ.get("TRAVEL_PLANNER_REPLAY") == "1"
+CAPTURE = os.environ.get("TRAVEL_PLANNER_CAPTURE") == "1"
+
+_DONE = object()
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+@dataclass
+class Pagination:
+    # page_url(url, number) -> url of that listing page, item_id(item) -> key
+    page_url: object
+    item_id: object
+    max_pages: int = 1
+    parallel: int = 3
+    known_ids: set = field(default_factory=set)
+
+
+@dataclass
+class SearchTask:
+    site: str
+    url: str
+    fetch: object
+    parse: object
+    params: dict = field(default_factory=dict)
+    cache_key: str = None
+    pagination: Pagination = None
+    # on_fetched(result) saves a live result that found items, background
+    # refreshes of stale cache entries included, and its return value is
+    # kept as result.saved. It must be picklable for the process pipeline.
+    on_fetched: object = None
+
+
+@dataclass
+class ScrapeResult:
+    task: SearchTask
+    items: list = field(default_factory=list)
+    ok: bool = True
+    error: str = None
+    elapsed: float = 0.0
+    traffic: dict = None
+    cached: bool = False
+    age: float = None
+    attempts: int = 1
+    # A stale cache hit whose background refresh was started
+    refreshing: bool = False
+    saved: object = None
+
+    @property
+    def url(self):
+        return self.task.url
+
+
+def persist(result):
+    # A result that could not be saved counts as failed, so it is neither
+    # cached nor reported as done
+    hook = result.task.on_fetched
+    if hook is None or not result.ok or not result.items:
+        return result
+    try:
+        result.saved = hook(result)
+    except Exception as e:
+        result.ok = False
+        result.error = f"Saving failed: {e}"
+    return result
+
+
+class ScrapeEngine:
+    # Runs every search on a single background event loop so the browser pool
+    # stays warm between calls and any thread can submit work to it.
+    def __init__(
+        self,
+        pool=None,
+        site_concurrency=None,
+        site_timeouts=None,
+        intercept=True,
+        replay=REPLAY,
+        capture=CAPTURE,
+        cache=None,
+        rate_limits=None,
+        retries=None,
+    ):
+        self.pool = pool or BrowserPool()
+        # Replayed pages cost nothing, caching them would only hide the store.
+        # cache=False turns it off explicitly.
+        if cache is None and CACHE_ENABLED and not replay:
+            cache = SearchCache()
+        self.cache = cache
+        self.intercept = intercept
+        self.replay = replay
+        self.capture = capture
+        self.site_concurrency = dict(SITE_CONCURRENCY, **(site_concurrency or {}))
+        self.site_timeouts = dict(SITE_TIMEOUTS, **(site_timeouts or {}))
+        self.site_retries = dict(SITE_RETRIES, **(retries or {}))
+        self.rate_limiter = RateLimiter(rate_limits)
+        # One thread does every save, so writes stay serialized as they were
+        # when callers saved from their own thread
+        self._saver = ThreadPoolExecutor(1, thread_name_prefix="scrape-save")
+        self._semaphores = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="scrape-engine", daemon=True
+        )
+        self._thread.start()
+
+    def _semaphore(self, site):
+        if site not in self._semaphores:
+            limit = self.site_concurrency.get(site, DEFAULT_CONCURRENCY)
+            self._semaphores[site] = asyncio.Semaphore(limit)
+        return self._semaphores[site]
+
+    async def run_task(self, task, context=None):
+        # context: a shared browser context to open the page in, see run_session
+        if not self.cache or task.cache_key is None:
+            return await self._run_uncached(task, context)
+
+        hit = await self.cache.lookup(task)
+        if hit is None:
+            return await self.cache.single_flight(
+                task, lambda task: self._run_uncached(task, context)
+            )
+
+        items, age, stale = hit
+        refreshing = stale and self.cache.refresh(task, self._run_uncached)
+        metrics.count("scrape.results", site=task.site, outcome="cached")
+        return ScrapeResult(
+            task, items=items, cached=True, age=age, refreshing=refreshing
+        )
+
+    async def _run_uncached(self, task, context=None):
+        started = time.perf_counter()
+        # A missing snapshot will still be missing on the next try
+        retries = (
+            0 if self.replay else self.site_retries.get(task.site, DEFAULT_RETRIES)
+        )
+
+        for attempt in range(retries + 1):
+            result = await self._attempt(task, context)
+            result.attempts = attempt + 1
+            if result.ok or attempt == retries:
+                break
+            # Back off outside the semaphore so other tasks can use the slot
+            delay = backoff_delay(attempt)
+            print(f"Retrying {task.url} in {delay:.1f}s: {result.error}")
+            metrics.count("scrape.retries", site=task.site)
+            await asyncio.sleep(delay)
+
+        if task.on_fetched and result.ok and result.items:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._saver, persist, result)
+
+        result.elapsed = time.perf_counter() - started
+        if not result.ok:
+            print(f"Error fetching {task.url}: {result.error}")
+        metrics.observe("scrape.search", result.elapsed, site=task.site)
+        metrics.count(
+            "scrape.results", site=task.site, outcome="ok" if result.ok else "failed"
+        )
+        metrics.count("scrape.items", len(result.items), site=task.site)
+        return result
+
+    async def _attempt(self, task, context=None):
+        timeout = self.site_timeouts.get(task.site, DEFAULT_TIMEOUT)
+        result = ScrapeResult(task)
+
+        async with self._semaphore(task.site):
+            try:
+                if task.pagination:
+                    result.items = await self._crawl(task, result, timeout)
+                else:
+                    result.items = await self._load(
+                        task, task.url, result, timeout, context
+                    )
+            except asyncio.TimeoutError:
+                result.ok = False
+                result.error = f"Timed out after {timeout}s"
+            except Exception as e:
+                result.ok = False
+                result.error = str(e)
+
+        return result
+
+    async def _load(self, task, url, result, timeout, context=None):
+        # Waiting for a token does not count against the page timeout
+        if not self.replay:
+            with metrics.span("scrape.rate_limit_wait", site=task.site):
+                await self.rate_limiter.acquire(url)
+        html = await asyncio.wait_for(self._fetch(task, url, result, context), timeout)
+        if not html:
+            raise ValueError("Empty page")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, task.parse, html)
+
+    async def _crawl(self, task, result, timeout):
+        # Page 1 alone, then `parallel` pages at a time on one browser context.
+        # Each page is parsed as soon as it arrives; the crawl stops after a
+        # round that found nothing new or ran past the last page.
+        pagination = task.pagination
+        pages = {}
+        seen = set()
+
+        async def load(number, context):
+            url = pagination.page_url(task.url, number)
+            return number, await self._load(task, url, result, timeout, context)
+
+        async with self._shared_context(task.site, result) as context:
+            number = 1
+            batch_size = 1
+            while number <= pagination.max_pages:
+                numbers = range(
+                    number, min(number + batch_size, pagination.max_pages + 1)
+                )
+                number = numbers[-1] + 1
+                batch_size = pagination.parallel
+                new_ids = 0
+                exhausted = False
+
+                for loaded in asyncio.as_completed([load(n, context) for n in numbers]):
+                    try:
+                        page_number, items = await loaded
+                    except Exception as e:
+                        # Page 1 decides whether the search worked at all
+                        if numbers[0] == 1:
+                            raise
+                        print(f"Stopping at a failed page of {task.url}: {e}")
+                        exhausted = True
+                        continue
+
+                    pages[page_number] = items
+                    exhausted = exhausted or not items
+                    for item in items:
+                        item_id = pagination.item_id(item)
+                        if item_id not in seen:
+                            seen.add(item_id)
+                            new_ids += item_id not in pagination.known_ids
+
+                if exhausted or not new_ids:
+                    break
+
+        print(f"Crawled {len(pages)} pages, {len(seen)} items: {task.url}")
+        items = []
+        seen.clear()
+        for page_number in sorted(pages):
+            for item in pages[page_number]:
+                item_id = pagination.item_id(item)
+                if item_id not in seen:
+                    seen.add(item_id)
+                    items.append(item)
+        return items
+
+    @asynccontextmanager
+    async def _shared_context(self, site, result=None):
+        if self.replay:
+            yield None
+            return
+
+        async with self.pool.context() as context:
+            stats = None
+            if self.intercept:
+                stats = await install_context_interception(context, site)
+            try:
+                yield context
+            finally:
+                if stats and result is not None:
+                    result.traffic = stats.as_dict()
+
+    async def _fetch(self, task, url, result, context=None):
+        if self.replay:
+            html = load_snapshot(task.site, url)
+            if html is None:
+                raise LookupError("No snapshot in the fixtures store")
+            return html
+
+        html = await self._fetch_live(task, url, result, context)
+        if html and self.capture:
+            save_snapshot(task.site, url, html)
+        return html
+
+    async def _fetch_live(self, task, url, result, context=None):
+        if context is not None:
+            page = await context.new_page()
+            try:
+                return await task.fetch(page, url)
+            finally:
+                await page.close()
+
+        async with self.pool.page() as page:
+            stats = None
+            if self.intercept:
+                stats = await install_interception(page, task.site)
+            try:
+                return await task.fetch(page, url)
+            finally:
+                if stats:
+                    result.traffic = stats.as_dict()
+
+    async def run_tasks(self, tasks):
+        return await asyncio.gather(*(self.run_task(task) for task in tasks))
+
+    async def run_session(self, tasks, tabs=DEFAULT_SESSION_TABS):
+        # Related searches on one site share a browser context and run as
+        # `tabs` parallel tabs, paying the context setup and cookies once
+        if not tasks:
+            return []
+        slots = asyncio.Semaphore(tabs)
+
+        async def run(task, context):
+            async with slots:
+                return await self.run_task(task, context)
+
+        async with self._shared_context(tasks[0].site) as context:
+            return await asyncio.gather(*(run(task, context) for task in tasks))
+
+    async def _stream_tasks(self, tasks, max_parallel, results):
+        # Tasks are pulled lazily so huge sweeps never sit in memory at once
+        slots = asyncio.Semaphore(max_parallel)
+        pending = set()
+
+        async def run(task):
+            try:
+                results.put(await self.run_task(task))
+            finally:
+                slots.release()
+
+        for task in tasks:
+            await slots.acquire()
+            future = asyncio.ensure_future(run(task))
+            pending.add(future)
+            future.add_done_callback(pending.discard)
+
+        if pending:
+            await asyncio.gather(*pending)
+
+    def iter_results(self, tasks, max_parallel=DEFAULT_MAX_PARALLEL):
+        results = queue.Queue()
+        future = self.submit(self._stream_tasks(tasks, max_parallel, results))
+        future.add_done_callback(lambda _: results.put(_DONE))
+
+        while True:
+            result = results.get()
+            if result is _DONE:
+                break
+            yield result
+
+        future.result()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run_many(self, tasks):
+        return self.submit(self.run_tasks(tasks)).result()
+
+    def run_many_in_session(self, tasks, tabs=DEFAULT_SESSION_TABS):
+        return self.submit(self.run_session(tasks, tabs)).result()
+
+    def run_one(self, task):
+        return self.submit(self.run_task(task)).result()
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+        if self.cache:
+            self.submit(self.cache.wait_refreshes(REFRESH_GRACE)).result()
+        self.submit(self.pool.close()).result(timeout=30)
+        self._saver.shutdown()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=10)
+        self._loop.close()
+
+
+def get_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = ScrapeEngine()
+            atexit.register(shutdown_engine)
+        return _engine
+
+
+def shutdown_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.close()
+            _engine = None
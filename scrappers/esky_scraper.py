@@ -1,31 +1,265 @@
-from bs4 import BeautifulSoup
-from playwright.sync_api import sync_playwright
+import asyncio
+import json
+import re
 
+from scrappers.cache import cache_key
+from scrappers.engine import SearchTask, get_engine
+from scrappers.html_backend import parse_html
+from utils.metrics import metrics, timed
 
-def fetch_page_content(url):
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context()
-        page = context.new_page()
+# XHRs the results page makes to the flight search API
+SEARCH_API_PATTERN = re.compile(r"esky\.[a-z.]+/api/.*(?:search|offer|flight)", re.I)
+FIRST_RESPONSE_DEADLINE = 10
+RESULTS_DEADLINE = 30
+# Without an explicit "finished" flag, results are complete once the API
+# has been quiet this long
+RESULTS_QUIET = 2.0
+# How long a page that went network idle may still start the search API call
+IDLE_GRACE = 0.5
+# How long the flight blocks may keep rendering once the API is done, the
+# page is kept with the capture in case its offers cannot be parsed
+RENDER_GRACE = 2.0
+API_SOURCE = "esky-api"
+
+# Candidate API field names, first match wins. No eSky capture is stored yet,
+# tests/test_esky_api.py checks the parser against any that gets imported
+PRICE_KEYS = ("totalPrice", "price", "priceAmount", "amount")
+CURRENCY_KEYS = ("currency", "currencyCode")
+CARRIER_KEYS = ("airlineName", "carrierName", "marketingCarrier", "airline", "carrier")
+DEPARTURE_KEYS = ("departureDateTime", "departureTime", "departureDate", "departure")
+ARRIVAL_KEYS = ("arrivalDateTime", "arrivalTime", "arrivalDate", "arrival")
+STOPS_KEYS = ("stops", "stopsCount", "numberOfStops", "transfers")
+TIME_KEYS = ("dateTime", "localDateTime", "time", "date")
+TIME_PATTERN = re.compile(r"\d{1,2}:\d{2}")
+DURATION_KEYS = ("durationMinutes", "duration", "flightTime", "travelTime")
+SEGMENT_KEYS = ("segments", "legs", "flights")
+FINAL_FLAGS = ("isCompleted", "completed", "isFinished", "finished", "searchCompleted")
+
+
+def _is_final(payload):
+    if not isinstance(payload, dict):
+        return False
+    if any(payload.get(flag) is True for flag in FINAL_FLAGS):
+        return True
+    return str(payload.get("status", "")).lower() in ("completed", "finished", "done")
+
+
+@timed("esky.fetch")
+async def fetch_search_results(page, url):
+    # Collects the search API responses while the results page loads and
+    # returns them as one JSON document together with the page rendered so far
+    responses = []
+    final = asyncio.Event()
+    arrived = asyncio.Event()
+
+    async def on_response(response):
+        if not SEARCH_API_PATTERN.search(response.url):
+            return
+        if "json" not in (response.headers.get("content-type") or ""):
+            return
         try:
-            page.goto(url, timeout=60000)
-            page.wait_for_load_state("networkidle")
-            return page.content()
-        except Exception as e:
-            print(f"Error fetching page content: {e}")
-            return None
-        finally:
-            browser.close()
-
-
-def parse_flight_prices(html):
-    soup = BeautifulSoup(html, "html.parser")
-    flight_blocks = soup.find_all("so-fsr-flight-block")
+            payload = await response.json()
+        except Exception:
+            return
+        responses.append(payload)
+        arrived.set()
+        if _is_final(payload):
+            final.set()
+
+    page.on("response", on_response)
+    with metrics.span("esky.goto"):
+        await page.goto(url, timeout=60000, wait_until="domcontentloaded")
+
+    # The rendered page is the fallback, so it keeps loading alongside the API
+    # wait. A page that goes idle without any API response is read after
+    # IDLE_GRACE instead of after FIRST_RESPONSE_DEADLINE.
+    idle = asyncio.ensure_future(page.wait_for_load_state("networkidle"))
+    try:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        first_deadline = started + FIRST_RESPONSE_DEADLINE
+        while not final.is_set():
+            if responses:
+                wait = min(RESULTS_QUIET, started + RESULTS_DEADLINE - loop.time())
+            else:
+                wait = first_deadline - loop.time()
+            if wait <= 0:
+                break
+            arrived.clear()
+            waiter = asyncio.ensure_future(arrived.wait())
+            watched = {waiter} if responses or idle.done() else {waiter, idle}
+            done, _ = await asyncio.wait(
+                watched, timeout=wait, return_when=asyncio.FIRST_COMPLETED
+            )
+            waiter.cancel()
+            if not done:
+                break
+            if idle in done and not responses:
+                first_deadline = min(first_deadline, loop.time() + IDLE_GRACE)
+        metrics.observe("esky.api_wait", loop.time() - started)
+        metrics.count("esky.api_responses", len(responses))
+
+        if responses:
+            await asyncio.wait({idle}, timeout=RENDER_GRACE)
+            return json.dumps(
+                {
+                    "source": API_SOURCE,
+                    "url": url,
+                    "responses": responses,
+                    "html": await page.content(),
+                }
+            )
+
+        # The API was not recognised, fall back to the rendered flight blocks
+        print(f"No search API responses captured, reading the page instead: {url}")
+        metrics.count("esky.page_fallbacks")
+        with metrics.span("esky.networkidle"):
+            await idle
+        return await page.content()
+    finally:
+        if not idle.done():
+            idle.cancel()
+        elif not idle.cancelled():
+            # Retrieved so a failed idle wait is not reported as unhandled
+            idle.exception()
+
+
+def _first(data, keys):
+    for key in keys:
+        value = data.get(key)
+        if value not in (None, "", [], {}):
+            return value
+    return None
+
+
+def _duration_minutes(value):
+    # 330, "PT5H30M", "5h 30m" or "05:30"
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value)
+    match = re.fullmatch(r"P?T?(?:(\d+)\s*[Hh])?\s*(?:(\d+)\s*[Mm])?", text.strip())
+    if match and any(match.groups()):
+        return int(match.group(1) or 0) * 60 + int(match.group(2) or 0)
+    match = re.fullmatch(r"(\d+):(\d{2})", text.strip())
+    if match:
+        return int(match.group(1)) * 60 + int(match.group(2))
+    return None
+
+
+def _time(data, keys):
+    # "departure" and "arrival" are often the airport objects, only a date
+    # time or a clock time is taken
+    for key in keys:
+        value = data.get(key)
+        if isinstance(value, dict):
+            value = _first(value, TIME_KEYS)
+        if isinstance(value, str) and TIME_PATTERN.search(value):
+            return value
+    return None
+
+
+def _name(value):
+    if isinstance(value, dict):
+        return _first(value, ("name", "code", "iataCode"))
+    return value
+
+
+def _offer(data):
+    price = _first(data, PRICE_KEYS)
+    currency = _first(data, CURRENCY_KEYS)
+    if isinstance(price, dict):
+        currency = currency or _first(price, CURRENCY_KEYS)
+        price = _first(price, ("amount", "value", "total"))
+    if not isinstance(price, (int, float)) or isinstance(price, bool):
+        return None
+
+    segments = _first(data, SEGMENT_KEYS)
+    segments = [s for s in segments if isinstance(s, dict)] if segments else []
+    first = segments[0] if segments else data
+    last = segments[-1] if segments else data
+
+    stops = _first(data, STOPS_KEYS)
+    if isinstance(stops, list):
+        stops = len(stops)
+    if stops is None and segments:
+        stops = len(segments) - 1
+
+    duration = _duration_minutes(_first(data, DURATION_KEYS))
+    if duration is None and segments:
+        durations = [_duration_minutes(_first(s, DURATION_KEYS)) for s in segments]
+        if all(d is not None for d in durations):
+            duration = sum(durations)
+
+    return {
+        # amount is stored as is, price is only for display
+        "price": f"{price} {currency or ''}".strip(),
+        "amount": price,
+        "currency": currency,
+        "carrier": _name(_first(data, CARRIER_KEYS) or _first(first, CARRIER_KEYS)),
+        "departure_time": _time(first, DEPARTURE_KEYS),
+        "arrival_time": _time(last, ARRIVAL_KEYS),
+        "stops": stops if isinstance(stops, int) else None,
+        "duration_minutes": duration,
+    }
+
+
+def _find_offers(node, offers):
+    # Offers are the dicts with a price next to flight details, wherever the
+    # API nests them
+    if isinstance(node, list):
+        for value in node:
+            _find_offers(value, offers)
+    elif isinstance(node, dict):
+        if _first(node, PRICE_KEYS) is not None and (
+            _first(node, SEGMENT_KEYS)
+            or _first(node, DEPARTURE_KEYS)
+            or _first(node, CARRIER_KEYS)
+        ):
+            offer = _offer(node)
+            if offer:
+                offers.append(offer)
+                return
+        for value in node.values():
+            _find_offers(value, offers)
+
+
+@timed("esky.parse_api")
+def parse_search_results(document):
+    data = json.loads(document)
+    offers = []
+    _find_offers(data["responses"], offers)
+
+    # Polling responses repeat earlier offers
+    unique = {}
+    for offer in offers:
+        key = tuple(offer.values())
+        unique.setdefault(key, offer)
+    return list(unique.values())
+
+
+def parse_flights(document, backend=None):
+    # API capture when the fetcher got one and its offers parse, flight block
+    # DOM otherwise
+    if document.lstrip().startswith("{") and API_SOURCE in document[:200]:
+        offers = parse_search_results(document)
+        if offers:
+            return offers
+        metrics.count("esky.api_unparsed")
+        document = json.loads(document).get("html") or ""
+    return parse_flight_prices(document, backend=backend)
+
+
+@timed("esky.parse_page")
+def parse_flight_prices(html, backend=None):
+    soup = parse_html(html, tag="so-fsr-flight-block", backend=backend)
+    flight_blocks = soup.select("so-fsr-flight-block")
     prices = []
 
     for block in flight_blocks:
-        price_element = block.find("span", class_="amount")
-        currency_element = block.find("span", class_="currency")
+        price_element = block.select_one("span.amount")
+        currency_element = block.select_one("span.currency")
 
         if price_element and currency_element:
             price = price_element.text.strip()
@@ -35,14 +269,37 @@ def parse_flight_prices(html):
     return prices
 
 
-def get_flight_prices(departure, destination, departure_date, return_date, seats):
-    url = (
+def build_flights_url(departure, destination, departure_date, return_date, seats):
+    return (
         f"https://www.esky.com/flights/search/ap/{departure}/ap/{destination}"
         f"?departureDate={departure_date}&returnDate={return_date}&pa={seats}"
     )
-    html = fetch_page_content(url)
-    if html:
-        prices = parse_flight_prices(html)
-        return prices, url
-    else:
-        return [], url
+
+
+def flight_search_task(departure, destination, departure_date, return_date, seats):
+    return SearchTask(
+        site="esky",
+        url=build_flights_url(
+            departure, destination, departure_date, return_date, seats
+        ),
+        fetch=fetch_search_results,
+        parse=parse_flights,
+        params={
+            "departure": departure,
+            "destination": destination,
+            "departure_date": departure_date,
+            "return_date": return_date,
+            "seats": seats,
+        },
+        cache_key=cache_key(
+            "esky", departure, destination, departure_date, return_date or "", seats
+        ),
+    )
+
+
+def get_flight_prices(departure, destination, departure_date, return_date, seats):
+    task = flight_search_task(
+        departure, destination, departure_date, return_date, seats
+    )
+    result = get_engine().run_one(task)
+    return result.items, result.url
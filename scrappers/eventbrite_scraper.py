@@ -1,58 +1,279 @@
+import json
+import os
 import re
+import time
 from datetime import datetime
 
-from bs4 import BeautifulSoup
-from playwright.sync_api import sync_playwright
+from scrappers.cache import cache_key
+from scrappers.engine import Pagination, SearchTask, get_engine
+from scrappers.html_backend import parse_html
+from utils.metrics import metrics, timed
 
+EVENT_CARD_SELECTOR = "section[class*='event-card']"
+# Cards read per listing page, and listing pages crawled per search
+MAX_EVENT_CARDS = int(os.environ.get("TRAVEL_PLANNER_MAX_EVENT_CARDS", "100"))
+MAX_EVENT_PAGES = int(os.environ.get("TRAVEL_PLANNER_EVENT_PAGES", "5"))
+PARALLEL_PAGES = 3
+READY_DEADLINE = 15
+SCROLL_POLL_MS = 250
+STABLE_POLLS = 2
 
-def fetch_eventbrite_page(destination, start_date):
+SERVER_DATA_PATTERN = re.compile(r"window\.__SERVER_DATA__\s*=\s*")
+JSON_LD_PATTERN = re.compile(
+    r'<script type="application/ld\+json">(.*?)</script>', re.DOTALL
+)
+CARD_ID_PATTERN = re.compile(r'data-event-id="(\d+)"')
+CARD_PRICE_PATTERN = re.compile(r">[^<$]*(\$[\d,.]+)")
+
+
+def build_events_url(destination, start_date, end_date=None):
     formatted_destination = destination.lower().replace(" ", "-")
     url = f"https://www.eventbrite.com/d/{formatted_destination}/events/?start_date={start_date}"
+    if end_date:
+        url += f"&end_date={end_date}"
+    return url
+
+
+def events_page_url(url, number):
+    return url if number == 1 else f"{url}&page={number}"
+
+
+def event_key(event):
+    return event.get("event_id") or event["url"]
+
+
+async def _count_event_cards(page):
+    return await page.evaluate(
+        "(selector) => document.querySelectorAll(selector).length",
+        EVENT_CARD_SELECTOR,
+    )
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context()
-        page = context.new_page()
+
+@timed("eventbrite.fetch")
+async def fetch_eventbrite_page(page, url):
+    print(f"Fetching events from: {url}")
+    timings = {}
+    started = time.perf_counter()
+    deadline = started + READY_DEADLINE
+
+    await page.goto(url, timeout=60000, wait_until="domcontentloaded")
+    timings["goto"] = time.perf_counter() - started
+
+    phase_started = time.perf_counter()
+    remaining_ms = (deadline - phase_started) * 1000
+    if remaining_ms <= 0:
+        print("Page load used up the ready deadline, not waiting for event cards")
+    else:
         try:
-            # Adding timout to allow dynamic JS values to populate the HTML
-            print(f"Fetching events from: {url}")
-            page.goto(url, timeout=60000)
+            # Never 0, Playwright reads that as no timeout at all
+            await page.wait_for_selector(
+                EVENT_CARD_SELECTOR, timeout=max(remaining_ms, 1)
+            )
+        except Exception:
+            print("Event cards may not have loaded, continuing anyway...")
+    timings["cards"] = time.perf_counter() - phase_started
 
-            page.wait_for_load_state("networkidle")
+    # Scroll only while lazy-loaded cards keep appearing
+    phase_started = time.perf_counter()
+    card_count = await _count_event_cards(page)
+    stable_polls = 0
+    while card_count < MAX_EVENT_CARDS and time.perf_counter() < deadline:
+        await page.evaluate("window.scrollBy(0, 1000)")
+        await page.wait_for_timeout(SCROLL_POLL_MS)
 
-            try:
-                page.wait_for_selector(
-                    "[class*=price], [class*=cost], [class*=fee]", timeout=5000
-                )
-            except:
-                print("Price elements may not have loaded, continuing anyway...")
+        new_count = await _count_event_cards(page)
+        if new_count > card_count:
+            stable_polls = 0
+        else:
+            stable_polls += 1
+            if stable_polls >= STABLE_POLLS:
+                break
+        card_count = new_count
+    timings["scroll"] = time.perf_counter() - phase_started
 
-            page.evaluate("window.scrollBy(0, 1000)")
-            page.wait_for_timeout(2000)
+    phase_started = time.perf_counter()
+    html = await page.content()
+    timings["content"] = time.perf_counter() - phase_started
 
-            page.evaluate("window.scrollBy(0, 1000)")
-            page.wait_for_timeout(2000)
+    for name, seconds in timings.items():
+        metrics.observe(f"eventbrite.{name}", seconds)
+    phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+    print(f"Eventbrite page ready with {card_count} cards ({phases}): {url}")
 
-            return page.content(), url
-        except Exception as e:
-            print(f"Error fetching Eventbrite content: {e}")
-            return None, url
-        finally:
-            browser.close()
+    return html
 
 
-def parse_events(html):
-    if not html:
+def _event_id(event_url):
+    event_id_match = re.search(r"/e/([^/?]+)", event_url)
+    return event_id_match.group(1) if event_id_match else None
+
+
+def _format_start(start_date, start_time):
+    # Same shape as the card text, e.g. "Sat, Apr 19 • 10:30 PM"
+    if not start_date:
+        return "No date"
+    try:
+        start = datetime.strptime(start_date[:10], "%Y-%m-%d")
+        if start_time:
+            start = datetime.strptime(
+                f"{start_date[:10]} {start_time}", "%Y-%m-%d %H:%M"
+            )
+    except ValueError:
+        return start_date
+
+    day = f"{start:%a, %b} {start.day}"
+    if not start_time:
+        return day
+    return f"{day} • {start.hour % 12 or 12}:{start:%M %p}"
+
+
+def _card_prices(html):
+    # First "$x" text node between a card's event id and the next card
+    marks = [
+        (match.start(), match.group(1)) for match in CARD_ID_PATTERN.finditer(html)
+    ]
+    prices = {}
+
+    for i, (start, event_id) in enumerate(marks):
+        if event_id in prices:
+            continue
+        if i + 1 < len(marks):
+            end = marks[i + 1][0]
+        else:
+            end = html.find("<script", start)
+            end = end if end != -1 else len(html)
+
+        match = CARD_PRICE_PATTERN.search(html, start, end)
+        if match:
+            prices[event_id] = match.group(1)
+
+    return prices
+
+
+def _load_server_data(html):
+    match = SERVER_DATA_PATTERN.search(html)
+    if not match:
+        return None
+    try:
+        data, _ = json.JSONDecoder().raw_decode(html, match.end())
+    except ValueError:
+        return None
+    return data
+
+
+def _server_data_events(html):
+    data = _load_server_data(html)
+    if not data:
         return []
 
-    soup = BeautifulSoup(html, "html.parser")
+    try:
+        results = data["search_data"]["events"]["results"]
+    except (KeyError, TypeError):
+        return []
+
+    prices = None
+    events = []
+    for result in results:
+        venue = result.get("primary_venue") or {}
+        if result.get("is_online_event"):
+            location = "Online"
+        else:
+            location = venue.get("name") or "No location"
+
+        price = (
+            (result.get("ticket_availability") or {}).get("minimum_ticket_price") or {}
+        ).get("display")
+        if not price:
+            # The search payload usually omits ticket prices, the cards have them
+            if prices is None:
+                prices = _card_prices(html)
+            price = prices.get(result.get("eventbrite_event_id") or result.get("id"))
+
+        events.append(
+            {
+                "url": result.get("url"),
+                "title": result.get("name"),
+                "datetime": _format_start(
+                    result.get("start_date"), result.get("start_time")
+                ),
+                "location": location,
+                "price": price or "Unknown",
+            }
+        )
+
+    return events
+
+
+def _json_ld_events(html):
+    prices = None
+    events = []
+
+    for match in JSON_LD_PATTERN.finditer(html):
+        try:
+            data = json.loads(match.group(1))
+        except ValueError:
+            continue
+        if not isinstance(data, dict) or "itemListElement" not in data:
+            continue
+
+        for element in data["itemListElement"]:
+            item = element.get("item") or {}
+            if item.get("@type") != "Event":
+                continue
+            location = item.get("location") or {}
+            if prices is None:
+                prices = _card_prices(html)
+            numeric_id = re.search(r"(\d+)(?:[?#]|$)", item.get("url") or "")
+            events.append(
+                {
+                    "url": item.get("url"),
+                    "title": item.get("name"),
+                    "datetime": _format_start(item.get("startDate"), None),
+                    "location": location.get("name") or "No location",
+                    "price": (numeric_id and prices.get(numeric_id.group(1)))
+                    or "Unknown",
+                }
+            )
+
+    return events
+
+
+@timed("eventbrite.parse_json")
+def parse_events_json(html):
+    raw_events = _server_data_events(html) or _json_ld_events(html)
+
     events_data = []
     seen_urls = set()
+    for event in raw_events[:MAX_EVENT_CARDS]:
+        event_url = event["url"]
+        if not event_url or not event["title"] or event_url in seen_urls:
+            continue
+        seen_urls.add(event_url)
 
-    event_cards = soup.select("section[class*='event-card']")
+        events_data.append(
+            {
+                "url": event_url,
+                "event_id": _event_id(event_url),
+                "title": event["title"],
+                "datetime": event["datetime"],
+                "location": event["location"],
+                "price": event["price"],
+            }
+        )
+
+    return events_data
+
+
+@timed("eventbrite.parse_cards")
+def parse_event_cards(html, backend=None):
+    soup = parse_html(html, tag="section", class_contains="event-card", backend=backend)
+    events_data = []
+    seen_urls = set()
+
+    event_cards = soup.select(EVENT_CARD_SELECTOR)
     print(f"Found {len(event_cards)} event cards")
 
-    for card in event_cards[:100]:
+    for card in event_cards[:MAX_EVENT_CARDS]:
         try:
             event = {}
 
@@ -70,8 +291,7 @@ def parse_events(html):
             seen_urls.add(event_url)
 
             event["url"] = event_url
-            event_id_match = re.search(r"/e/([^/?]+)", event_url)
-            event["event_id"] = event_id_match.group(1) if event_id_match else None
+            event["event_id"] = _event_id(event_url)
 
             # Title
             title = card.select_one("h3") or card.select_one("h2")
@@ -120,15 +340,49 @@ def parse_events(html):
     return events_data
 
 
+def parse_events(html, backend=None):
+    if not html:
+        return []
+
+    # Embedded search payload first, card DOM heuristics only as a fallback
+    events = parse_events_json(html)
+    if events:
+        print(f"Found {len(events)} events in embedded page data")
+        return events
+
+    return parse_event_cards(html, backend=backend)
+
+
+def event_search_task(
+    destination, start_date, end_date=None, max_pages=MAX_EVENT_PAGES, known_ids=None
+):
+    # known_ids: event ids already saved for the city, a listing page with
+    # nothing else on it ends the crawl
+    window = [start_date, end_date] if end_date else [start_date]
+    return SearchTask(
+        site="eventbrite",
+        url=build_events_url(destination, start_date, end_date),
+        fetch=fetch_eventbrite_page,
+        parse=parse_events,
+        params={
+            "destination": destination,
+            "start_date": start_date,
+            "end_date": end_date,
+        },
+        cache_key=cache_key("eventbrite", destination, *window),
+        pagination=Pagination(
+            page_url=events_page_url,
+            item_id=event_key,
+            max_pages=max_pages,
+            parallel=PARALLEL_PAGES,
+            known_ids=set(known_ids or ()),
+        ),
+    )
+
+
 def get_events(destination, start_date):
-    html, url = fetch_eventbrite_page(destination, start_date)
-    if html:
-        with open("page.html", "w", encoding="utf-8") as file:
-            file.write(html)
-
-        events = parse_events(html)
-        return events, url
-    return [], url
+    result = get_engine().run_one(event_search_task(destination, start_date))
+    return result.items, result.url
 
 
 if __name__ == "__main__":
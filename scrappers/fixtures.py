@@ -0,0 +1,126 @@
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "fixtures")
+MANIFEST_FILE = "manifest.json"
+
+_manifest_lock = threading.Lock()
+
+
+def fixture_key(url):
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]
+
+
+def _manifest_path(fixtures_dir):
+    return os.path.join(fixtures_dir, MANIFEST_FILE)
+
+
+def load_manifest(fixtures_dir=FIXTURES_DIR):
+    try:
+        with open(_manifest_path(fixtures_dir), encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {"snapshots": []}
+
+
+def _write_manifest(manifest, fixtures_dir):
+    path = _manifest_path(fixtures_dir)
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+        file.write("\n")
+    os.replace(path + ".tmp", path)
+
+
+def save_snapshot(site, url, html, fixtures_dir=FIXTURES_DIR):
+    data = html.encode("utf-8")
+    key = fixture_key(url)
+
+    with _manifest_lock:
+        manifest = load_manifest(fixtures_dir)
+        versions = [
+            entry["version"]
+            for entry in manifest["snapshots"]
+            if entry["site"] == site and entry["key"] == key
+        ]
+        version = max(versions, default=0) + 1
+        path = os.path.join(site, f"{key}-v{version}.html.gz")
+
+        os.makedirs(os.path.join(fixtures_dir, site), exist_ok=True)
+        # mtime=0 keeps the compressed bytes stable for identical captures
+        with open(os.path.join(fixtures_dir, path), "wb") as file:
+            file.write(gzip.compress(data, compresslevel=9, mtime=0))
+
+        entry = {
+            "site": site,
+            "key": key,
+            "url": url,
+            "version": version,
+            "path": path.replace(os.sep, "/"),
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "size": len(data),
+            "captured_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        manifest["snapshots"].append(entry)
+        _write_manifest(manifest, fixtures_dir)
+
+    return entry
+
+
+def list_snapshots(site=None, fixtures_dir=FIXTURES_DIR):
+    return [
+        entry
+        for entry in load_manifest(fixtures_dir)["snapshots"]
+        if site is None or entry["site"] == site
+    ]
+
+
+def read_snapshot(entry, fixtures_dir=FIXTURES_DIR):
+    with open(os.path.join(fixtures_dir, entry["path"]), "rb") as file:
+        return gzip.decompress(file.read()).decode("utf-8")
+
+
+def find_snapshot(site, url, version=None, fixtures_dir=FIXTURES_DIR):
+    key = fixture_key(url)
+    matches = [
+        entry
+        for entry in list_snapshots(site, fixtures_dir)
+        if entry["key"] == key and (version is None or entry["version"] == version)
+    ]
+    return max(matches, key=lambda entry: entry["version"], default=None)
+
+
+def load_snapshot(site, url, version=None, fixtures_dir=FIXTURES_DIR):
+    entry = find_snapshot(site, url, version, fixtures_dir)
+    return read_snapshot(entry, fixtures_dir) if entry else None
+
+
+def latest_snapshots(site, fixtures_dir=FIXTURES_DIR):
+    # Newest version of every captured URL for a site
+    latest = {}
+    for entry in list_snapshots(site, fixtures_dir):
+        if entry["version"] > latest.get(entry["key"], {"version": 0})["version"]:
+            latest[entry["key"]] = entry
+    return list(latest.values())
+
+
+if __name__ == "__main__":
+    # python -m scrappers.fixtures import <site> <url> <file.html>
+    # python -m scrappers.fixtures list [site]
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+
+    if command == "import":
+        site, url, path = sys.argv[2:5]
+        with open(path, encoding="utf-8") as file:
+            entry = save_snapshot(site, url, file.read())
+        print(f"Saved {entry['path']} ({entry['size']} bytes)")
+    else:
+        for entry in list_snapshots(sys.argv[2] if len(sys.argv) > 2 else None):
+            print(
+                f"{entry['site']:<12} v{entry['version']:<3} {entry['captured_at']}  "
+                f"{entry['url']}"
+            )
@@ -0,0 +1,83 @@
+import os
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import lxml  # noqa: F401
+
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+# Force one backend with TRAVEL_PLANNER_HTML_BACKEND, otherwise the fastest wins
+BACKEND_ENV = "TRAVEL_PLANNER_HTML_BACKEND"
+
+
+def available_backends():
+    backends = []
+    if LexborHTMLParser is not None:
+        backends.append("selectolax")
+    if HAS_LXML:
+        backends.append("lxml")
+    backends.append("html.parser")
+    return backends
+
+
+def default_backend():
+    forced = os.environ.get(BACKEND_ENV)
+    if forced:
+        if forced not in available_backends():
+            raise ValueError(f"HTML backend {forced!r} is not installed")
+        return forced
+    return available_backends()[0]
+
+
+class _LexborNode:
+    # Just enough of the BeautifulSoup Tag API for the scrapers
+    __slots__ = ("node",)
+
+    def __init__(self, node):
+        self.node = node
+
+    def select(self, selector):
+        return [_LexborNode(node) for node in self.node.css(selector)]
+
+    def select_one(self, selector):
+        node = self.node.css_first(selector)
+        return _LexborNode(node) if node is not None else None
+
+    def get_text(self, strip=False):
+        return self.node.text(deep=True, separator="", strip=strip)
+
+    @property
+    def text(self):
+        return self.node.text(deep=True)
+
+    def get(self, name, default=None):
+        return self.node.attributes.get(name, default)
+
+    def __getitem__(self, name):
+        return self.node.attributes[name]
+
+
+def _strainer(tag, class_contains):
+    if class_contains is None:
+        return SoupStrainer(tag)
+    return SoupStrainer(tag, class_=lambda value: value and class_contains in value)
+
+
+def parse_html(html, tag=None, class_contains=None, backend=None):
+    # tag / class_contains limit the tree to the sections the parser reads
+    backend = backend or default_backend()
+
+    if backend == "selectolax":
+        return _LexborNode(LexborHTMLParser(html).root)
+
+    parse_only = _strainer(tag, class_contains) if tag else None
+    features = "lxml" if backend == "lxml" else "html.parser"
+    return BeautifulSoup(html, features, parse_only=parse_only)
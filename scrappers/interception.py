@@ -0,0 +1,103 @@
+from urllib.parse import urlsplit
+
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font", "stylesheet"}
+
+TRACKER_DOMAINS = (
+    "googletagmanager.com",
+    "google-analytics.com",
+    "doubleclick.net",
+    "branch.io",
+    "transcend.io",
+    "cdntranscend.eventbrite.com",
+    "synctranscend.eventbrite.com",
+    "facebook.net",
+    "hotjar.com",
+    "heapanalytics.com",
+    "statsig.com",
+    "criteo.com",
+)
+
+# Rough transfer sizes, used to estimate what an aborted request would cost
+ESTIMATED_BYTES = {
+    "image": 60_000,
+    "media": 250_000,
+    "font": 40_000,
+    "stylesheet": 30_000,
+    "script": 50_000,
+    "xhr": 5_000,
+    "fetch": 5_000,
+}
+DEFAULT_ESTIMATED_BYTES = 10_000
+
+SITE_PROFILES = {
+    "esky": {
+        "block_types": BLOCKED_RESOURCE_TYPES,
+        "deny": TRACKER_DOMAINS + ("esky.com/_analytics", "adservice"),
+        "allow": ("esky.com/api", "esky.com/flights/search"),
+    },
+    "eventbrite": {
+        "block_types": BLOCKED_RESOURCE_TYPES,
+        "deny": TRACKER_DOMAINS + ("eventbrite.com/ajax/track",),
+        "allow": ("eventbrite.com/api/v3/destination",),
+    },
+}
+DEFAULT_PROFILE = {"block_types": BLOCKED_RESOURCE_TYPES, "deny": TRACKER_DOMAINS}
+
+
+class InterceptionStats:
+    def __init__(self):
+        self.allowed_requests = 0
+        self.blocked_requests = 0
+        self.estimated_bytes_saved = 0
+        self.blocked_by_type = {}
+
+    def record_block(self, resource_type):
+        self.blocked_requests += 1
+        self.estimated_bytes_saved += ESTIMATED_BYTES.get(
+            resource_type, DEFAULT_ESTIMATED_BYTES
+        )
+        self.blocked_by_type[resource_type] = (
+            self.blocked_by_type.get(resource_type, 0) + 1
+        )
+
+    def as_dict(self):
+        return {
+            "allowed_requests": self.allowed_requests,
+            "blocked_requests": self.blocked_requests,
+            "estimated_bytes_saved": self.estimated_bytes_saved,
+            "blocked_by_type": dict(self.blocked_by_type),
+        }
+
+
+def should_block(url, resource_type, profile):
+    # Allow patterns win over everything, then resource types, then deny list
+    if any(pattern in url for pattern in profile.get("allow", ())):
+        return False
+    if resource_type in profile.get("block_types", ()):
+        return True
+
+    parts = urlsplit(url)
+    target = parts.netloc + parts.path
+    return any(pattern in target for pattern in profile.get("deny", ()))
+
+
+async def install_interception(page, site, profile=None):
+    return await install_context_interception(page.context, site, profile)
+
+
+async def install_context_interception(context, site, profile=None):
+    # Covers every tab opened in the context
+    profile = profile or SITE_PROFILES.get(site, DEFAULT_PROFILE)
+    stats = InterceptionStats()
+
+    async def handle(route):
+        request = route.request
+        if should_block(request.url, request.resource_type, profile):
+            stats.record_block(request.resource_type)
+            await route.abort()
+        else:
+            stats.allowed_requests += 1
+            await route.continue_()
+
+    await context.route("**/*", handle)
+    return stats
@@ -0,0 +1,184 @@
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import replace
+from itertools import islice
+from multiprocessing.util import Finalize
+
+from scrappers.engine import REPLAY, ScrapeEngine, persist
+from scrappers.rate_limit import DOMAIN_RATES
+from utils.metrics import enable_metrics, metrics
+
+# Searches a fetch process runs at once on its browser
+FETCH_BATCH = 4
+
+_fetch_engine = None
+
+
+def default_processes():
+    return os.cpu_count() or 1
+
+
+def _split_rates(processes):
+    # The per-domain limits hold for the whole pool, not for each process
+    return {
+        domain: (rate / processes, max(1, burst // processes))
+        for domain, (rate, burst) in DOMAIN_RATES.items()
+    }
+
+
+def _quiet():
+    sys.stdout = open(os.devnull, "w")
+
+
+def _init_fetcher(replay, processes, quiet, collect_metrics):
+    # Each fetch process drives its own browser through its own engine.
+    # Results skip the search cache, they are not parsed yet.
+    global _fetch_engine
+    if quiet:
+        _quiet()
+    enable_metrics(collect_metrics)
+    _fetch_engine = ScrapeEngine(
+        replay=replay, cache=False, rate_limits=_split_rates(processes)
+    )
+    Finalize(_fetch_engine, _fetch_engine.close, exitpriority=10)
+
+
+def _init_parser(quiet, collect_metrics):
+    if quiet:
+        _quiet()
+    enable_metrics(collect_metrics)
+
+
+def _metrics_delta():
+    # What this process recorded since the last call, merged by the parent
+    return metrics.snapshot(reset=True) if metrics.enabled else None
+
+
+def _raw_page(html):
+    return html
+
+
+def _parse_page(parse, raw):
+    return parse(raw), _metrics_delta()
+
+
+def _fetch_batch(tasks):
+    # Returns (result, raw page) pairs and the batch's metrics. A crawl needs every page parsed to
+    # know when to stop, so it is parsed here and comes back with raw None.
+    # Results are saved by the parent, the only process writing to SQLite.
+    fetch_tasks = []
+    for task in tasks:
+        pagination = task.pagination
+        fetch_task = replace(task, on_fetched=None)
+        if pagination is None or pagination.max_pages <= 1:
+            url = pagination.page_url(task.url, 1) if pagination else task.url
+            fetch_task = replace(fetch_task, url=url, parse=_raw_page, pagination=None)
+        fetch_tasks.append(fetch_task)
+
+    pairs = []
+    for task, result in zip(tasks, _fetch_engine.run_many(fetch_tasks)):
+        raw = None
+        if result.task.parse is _raw_page:
+            raw = result.items if result.ok else None
+            result.items = []
+        result.task = task
+        pairs.append((result, raw))
+    return pairs, _metrics_delta()
+
+
+class ScrapePipeline:
+    # Fetch processes, each with its own browser, hand raw pages to a pool
+    # of parser processes; finished results are yielded in the calling
+    # process, which stays the only one writing to SQLite. Tasks cross
+    # process boundaries, so their fetch/parse callables must be module level.
+    def __init__(
+        self,
+        fetch_processes=None,
+        parse_processes=None,
+        replay=REPLAY,
+        batch_size=FETCH_BATCH,
+        quiet=False,
+    ):
+        self.fetch_processes = fetch_processes or default_processes()
+        self.parse_processes = parse_processes or default_processes()
+        self.batch_size = batch_size
+        context = multiprocessing.get_context("spawn")
+        self.fetchers = ProcessPoolExecutor(
+            self.fetch_processes,
+            mp_context=context,
+            initializer=_init_fetcher,
+            initargs=(replay, self.fetch_processes, quiet, metrics.enabled),
+        )
+        self.parsers = ProcessPoolExecutor(
+            self.parse_processes,
+            mp_context=context,
+            initializer=_init_parser,
+            initargs=(quiet, metrics.enabled),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.fetchers.shutdown()
+        self.parsers.shutdown()
+
+    def iter_results(self, tasks):
+        tasks = iter(tasks)
+        fetching = set()
+        parsing = {}
+        exhausted = False
+
+        while True:
+            # Fetching stops running ahead once the parsers fall behind
+            while (
+                not exhausted
+                and len(fetching) < self.fetch_processes * 2
+                and len(parsing) < self.parse_processes * 4
+            ):
+                batch = list(islice(tasks, self.batch_size))
+                if not batch:
+                    exhausted = True
+                    break
+                fetching.add(self.fetchers.submit(_fetch_batch, batch))
+
+            if not fetching and not parsing:
+                break
+
+            done, _ = wait(fetching | parsing.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in fetching:
+                    fetching.remove(future)
+                    pairs, fetch_metrics = future.result()
+                    metrics.merge(fetch_metrics)
+                    for result, raw in pairs:
+                        if raw is None:
+                            yield persist(result)
+                            continue
+                        parse = self.parsers.submit(_parse_page, result.task.parse, raw)
+                        parsing[parse] = (result, time.perf_counter())
+                    continue
+
+                result, started = parsing.pop(future)
+                try:
+                    result.items, parse_metrics = future.result()
+                    metrics.merge(parse_metrics)
+                    metrics.count(
+                        "scrape.items", len(result.items), site=result.task.site
+                    )
+                except Exception as e:
+                    result.ok = False
+                    result.error = f"Parsing failed: {e}"
+                result.elapsed += time.perf_counter() - started
+                yield persist(result)
+
+
+def iter_pipeline(tasks, fetch_processes=None, parse_processes=None, **options):
+    with ScrapePipeline(fetch_processes, parse_processes, **options) as pipeline:
+        yield from pipeline.iter_results(tasks)
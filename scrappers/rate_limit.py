@@ -0,0 +1,64 @@
+import asyncio
+import random
+import time
+from urllib.parse import urlsplit
+
+# Requests per second and burst size per domain, anything else gets the default
+DOMAIN_RATES = {
+    "www.eventbrite.com": (0.5, 3),
+    "www.esky.com": (2.0, 8),
+}
+DEFAULT_RATE = (1.0, 4)
+
+SITE_RETRIES = {"esky": 2, "eventbrite": 3}
+DEFAULT_RETRIES = 2
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+
+def backoff_delay(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    # "Full jitter": anywhere between 0 and the exponential step, so retries
+    # from many tasks that failed together do not come back in lockstep
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class TokenBucket:
+    # Lives on the engine loop, one per domain
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        # The lock makes waiters take tokens in arrival order
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class RateLimiter:
+    def __init__(self, rates=None):
+        self.rates = dict(DOMAIN_RATES, **(rates or {}))
+        self._buckets = {}
+        self.waited = 0.0
+
+    def bucket(self, url):
+        domain = urlsplit(url).netloc.lower()
+        if domain not in self._buckets:
+            self._buckets[domain] = TokenBucket(*self.rates.get(domain, DEFAULT_RATE))
+        return self._buckets[domain]
+
+    async def acquire(self, url):
+        started = time.monotonic()
+        await self.bucket(url).acquire()
+        self.waited += time.monotonic() - started
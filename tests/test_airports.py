@@ -0,0 +1,27 @@
+import pytest
+
+from utils.airports import expand_airports, get_airport_code
+
+
+@pytest.mark.parametrize(
+    "query, code",
+    [("Riga", "RIX"), ("MALAGA", "AGP"), ("Málaga", "AGP"), ("lhr", "LHR")],
+)
+def test_exact_names_and_codes_resolve(query, code):
+    assert get_airport_code(query) == code
+
+
+def test_metro_expands_to_its_airports():
+    assert get_airport_code("London") == "LON"
+    assert "LHR" in expand_airports("London")
+
+
+@pytest.mark.parametrize("query", ["york", "barcel", "Amsterdm"])
+def test_inexact_matches_are_suggested_not_used(query):
+    with pytest.raises(ValueError, match="did you mean"):
+        get_airport_code(query)
+
+
+def test_unknown_place_is_rejected():
+    with pytest.raises(ValueError, match="Unknown city or airport"):
+        get_airport_code("Qqqqzz")
@@ -0,0 +1,63 @@
+import pytest
+
+from scrappers.cache import SearchCache
+from scrappers.engine import ScrapeEngine, SearchTask
+from utils.db_connection import close_connection, set_db_file
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    set_db_file(str(tmp_path / "cache.db"))
+    # Every cached entry is stale straight away, so each hit starts a refresh
+    engine = ScrapeEngine(
+        intercept=False, cache=SearchCache(ttls={"test": 0}, stale_ttls={"test": 3600})
+    )
+    pages = iter(range(100))
+
+    async def fetch_live(task, url, result, context=None):
+        return f"page {next(pages)}"
+
+    monkeypatch.setattr(engine, "_fetch_live", fetch_live)
+    yield engine
+    engine.close()
+    close_connection()
+
+
+def search(saved):
+    return SearchTask(
+        "test",
+        "https://example.com/search",
+        fetch=None,
+        parse=lambda html: [html],
+        cache_key="test:search",
+        on_fetched=lambda result: saved.append(result.items) or len(saved),
+    )
+
+
+def test_live_and_refreshed_results_are_saved(engine):
+    saved = []
+    first = engine.run_one(search(saved))
+    assert not first.cached
+    assert first.saved == 1
+
+    stale = engine.run_one(search(saved))
+    assert stale.cached
+    assert stale.refreshing
+    assert stale.items == ["page 0"]
+
+    # Shutting down lets the refresh finish and save
+    engine.close()
+    assert saved == [["page 0"], ["page 1"]]
+
+
+def test_failed_save_is_a_failed_search(engine):
+    def broken(result):
+        raise OSError("disk full")
+
+    task = search([])
+    task.on_fetched = broken
+    result = engine.run_one(task)
+    assert not result.ok
+    assert result.error == "Saving failed: disk full"
+    # Nothing was cached, so the next search loads the page again
+    assert not engine.run_one(search([])).cached
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from scrappers import esky_scraper
+from scrappers.esky_scraper import (
+    API_SOURCE,
+    TIME_PATTERN,
+    fetch_search_results,
+    parse_flights,
+    parse_search_results,
+)
+from scrappers.fixtures import latest_snapshots, read_snapshot
+from utils.database import get_saved_flights, initialize_db, save_flight_prices
+from utils.db_connection import close_connection, set_db_file
+
+
+def api_document(results, html=""):
+    return json.dumps(
+        {
+            "source": API_SOURCE,
+            "url": "https://www.esky.com/flights/search",
+            "responses": [{"status": "Completed", "results": results}],
+            "html": html,
+        }
+    )
+
+
+def test_airport_objects_are_not_read_as_times():
+    offers = parse_search_results(
+        api_document(
+            [
+                {
+                    "totalPrice": {"amount": 120, "currency": "EUR"},
+                    "airlineName": "airBaltic",
+                    "departure": {"code": "RIX", "name": "Riga"},
+                    "arrival": {"code": "AGP", "dateTime": "2025-05-01T14:40"},
+                }
+            ]
+        )
+    )
+    assert offers == [
+        {
+            "price": "120 EUR",
+            "amount": 120,
+            "currency": "EUR",
+            "carrier": "airBaltic",
+            "departure_time": None,
+            "arrival_time": "2025-05-01T14:40",
+            "stops": None,
+            "duration_minutes": None,
+        }
+    ]
+
+
+def captured_documents():
+    return [
+        entry
+        for entry in latest_snapshots("esky")
+        if API_SOURCE in read_snapshot(entry)[:200]
+    ]
+
+
+@pytest.mark.skipif(
+    not captured_documents(),
+    reason="no eSky API capture stored, run a search with TRAVEL_PLANNER_CAPTURE=1",
+)
+@pytest.mark.parametrize("entry", captured_documents(), ids=lambda entry: entry["url"])
+def test_captured_responses_parse(entry):
+    offers = parse_search_results(read_snapshot(entry))
+    assert offers
+    for offer in offers:
+        assert offer["amount"] > 0
+        assert offer["currency"]
+        for key in ("departure_time", "arrival_time"):
+            assert offer[key] is None or TIME_PATTERN.search(offer[key])
+
+
+def test_unparsed_capture_falls_back_to_the_page():
+    page = (
+        '<so-fsr-flight-block><span class="amount">99</span>'
+        '<span class="currency">EUR</span></so-fsr-flight-block>'
+    )
+    document = api_document([{"status": "InProgress", "flightsCount": 12}], page)
+    assert parse_flights(document) == ["99 EUR"]
+
+
+def test_api_amounts_are_saved_as_numbers(tmp_path):
+    set_db_file(str(tmp_path / "prices.db"))
+    initialize_db()
+    try:
+        offers = parse_flights(
+            api_document([{"price": 1234.567, "currency": "EUR", "airline": "X"}])
+        )
+        saved = save_flight_prices(
+            "Riga", "RIX", "Malaga", "AGP", "2025-05-01", "", offers, 1
+        )
+        assert saved["rows"] == 1
+        assert get_saved_flights()[0]["price"] == 1234.567
+    finally:
+        close_connection()
+
+
+class IdlePage:
+    # A results page that makes no search API call and goes idle quickly
+    def __init__(self, idle_after):
+        self.idle_after = idle_after
+
+    def on(self, event, handler):
+        pass
+
+    async def goto(self, url, **kwargs):
+        pass
+
+    async def wait_for_load_state(self, state):
+        await asyncio.sleep(self.idle_after)
+
+    async def content(self):
+        return "<html></html>"
+
+
+def test_page_fallback_does_not_wait_for_the_api_deadline(monkeypatch):
+    monkeypatch.setattr(esky_scraper, "FIRST_RESPONSE_DEADLINE", 5)
+    started = time.perf_counter()
+    html = asyncio.run(fetch_search_results(IdlePage(0.05), "https://www.esky.com"))
+    assert html == "<html></html>"
+    assert time.perf_counter() - started < 1
@@ -0,0 +1,65 @@
+import pytest
+
+from utils import job_queue
+from utils.database import initialize_db
+from utils.db_connection import close_connection, get_connection, set_db_file
+from utils.job_queue import submit_job
+
+FLIGHT = {
+    "departure_city": "Riga",
+    "departure_code": "RIX",
+    "destination_city": "Malaga",
+    "destination_code": "AGP",
+    "departure_date": "2025-05-01",
+    "return_date": None,
+    "seats": 1,
+}
+
+
+@pytest.fixture(autouse=True)
+def database(tmp_path):
+    set_db_file(str(tmp_path / "jobs.db"))
+    initialize_db()
+    yield
+    close_connection()
+
+
+def test_same_search_with_different_spelling_is_one_job():
+    job_id, created = submit_job("flights", FLIGHT)
+    assert created
+    same = {**FLIGHT, "departure_city": "riga", "return_date": "", "seats": "1"}
+    assert submit_job("flights", same) == (job_id, False)
+
+    job_id, created = submit_job(
+        "events", {"city": "Riga", "start_date": "2025-05-01", "end_date": None}
+    )
+    assert created
+    same = {"city": " riga ", "start_date": "2025-05-01", "end_date": ""}
+    assert submit_job("events", same) == (job_id, False)
+
+
+class FinishingConnection:
+    # Marks the pending job done right before submit_job looks it up, as a
+    # worker on another connection could
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self.conn.__exit__(*exc)
+
+    def execute(self, sql, params=()):
+        if sql.startswith("SELECT id FROM scrape_jobs"):
+            self.conn.execute("UPDATE scrape_jobs SET status = 'done'")
+        return self.conn.execute(sql, params)
+
+
+def test_job_finishing_during_submit_is_queued_again(monkeypatch):
+    finished_id, _ = submit_job("flights", FLIGHT)
+    conn = FinishingConnection(get_connection())
+    monkeypatch.setattr(job_queue, "get_connection", lambda: conn)
+    job_id, created = submit_job("flights", FLIGHT)
+    assert created
+    assert job_id != finished_id
@@ -0,0 +1,27 @@
+import sqlite3
+
+from utils.migrations import migrate, schema_version
+
+
+def test_event_full_text_search_is_dropped():
+    # A database migrated while step 4 still built the FTS index
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    conn.executescript("""
+    CREATE VIRTUAL TABLE events_fts USING fts5(
+        title, location, content='events', content_rowid='id'
+    );
+    CREATE TRIGGER events_fts_update AFTER UPDATE OF title, location ON events
+    BEGIN
+        INSERT INTO events_fts (rowid, title, location)
+        VALUES (new.id, new.title, new.location);
+    END;
+    PRAGMA user_version = 11;
+    """)
+
+    assert migrate(conn) == ["drop event full text search"]
+    assert schema_version(conn) == 12
+    leftovers = conn.execute(
+        "SELECT name FROM sqlite_master WHERE name LIKE 'events_fts%'"
+    ).fetchall()
+    assert leftovers == []
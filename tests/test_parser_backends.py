@@ -0,0 +1,60 @@
+import os
+from contextlib import redirect_stdout
+from io import StringIO
+
+import pytest
+from bs4 import BeautifulSoup
+
+from benchmarks.parser_backends import FLIGHTS_HTML
+from benchmarks.suite import synthetic_flights_html
+from scrappers import esky_scraper, eventbrite_scraper
+from scrappers.html_backend import available_backends
+
+PAGE_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "page.html")
+
+
+@pytest.fixture(scope="module")
+def page_html():
+    with open(PAGE_FILE, encoding="utf-8") as file:
+        return file.read()
+
+
+def unstrained(monkeypatch, parse, html):
+    # What the scrapers returned before backends and strainers existed:
+    # the whole document through html.parser
+    for module in (eventbrite_scraper, esky_scraper):
+        monkeypatch.setattr(
+            module, "parse_html", lambda html, **_: BeautifulSoup(html, "html.parser")
+        )
+    with redirect_stdout(StringIO()):
+        expected = parse(html)
+    monkeypatch.undo()
+    return expected
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_event_cards_match_unstrained_html_parser(monkeypatch, page_html, backend):
+    expected = unstrained(monkeypatch, eventbrite_scraper.parse_event_cards, page_html)
+    with redirect_stdout(StringIO()):
+        events = eventbrite_scraper.parse_event_cards(page_html, backend=backend)
+    assert expected
+    assert events == expected
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_parse_events_fallback_matches_unstrained_html_parser(
+    monkeypatch, page_html, backend
+):
+    # page.html carries embedded JSON, without it parse_events reads the cards
+    expected = unstrained(monkeypatch, eventbrite_scraper.parse_event_cards, page_html)
+    monkeypatch.setattr(eventbrite_scraper, "parse_events_json", lambda html: [])
+    with redirect_stdout(StringIO()):
+        events = eventbrite_scraper.parse_events(page_html, backend=backend)
+    assert events == expected
+
+
+@pytest.mark.parametrize("html", [FLIGHTS_HTML, synthetic_flights_html()])
+@pytest.mark.parametrize("backend", available_backends())
+def test_flight_prices_match_unstrained_html_parser(monkeypatch, html, backend):
+    expected = unstrained(monkeypatch, esky_scraper.parse_flight_prices, html)
+    assert esky_scraper.parse_flight_prices(html, backend=backend) == expected
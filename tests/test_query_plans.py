@@ -0,0 +1,38 @@
+import sqlite3
+
+import pytest
+
+from utils.migrations import PLAN_CHECKS, check_query_plans, explain_query_plan, migrate
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize(
+    "query, params, expected", PLAN_CHECKS, ids=[check[2] for check in PLAN_CHECKS]
+)
+def test_query_uses_its_index(conn, query, params, expected):
+    plan = explain_query_plan(conn, query, params)
+    assert any(expected in step for step in plan), plan
+
+
+def test_query_plans_survive_analyze(conn):
+    # Statistics can steer the planner away from an index an empty table uses
+    conn.execute("ANALYZE")
+    assert check_query_plans(conn) == []
+
+
+def test_dropped_index_is_reported(conn):
+    conn.execute("DROP INDEX flight_tickets_route_day")
+    failures = [query for query, _ in check_query_plans(conn)]
+    assert failures == [
+        query
+        for query, _, expected in PLAN_CHECKS
+        if expected.startswith("flight_tickets_route_day")
+    ]
+    assert failures
@@ -0,0 +1,194 @@
+import csv
+import difflib
+import os
+import re
+import sys
+import threading
+import unicodedata
+from bisect import bisect_left
+from dataclasses import dataclass
+from functools import lru_cache
+
+AIRPORTS_FILE = os.path.join(os.path.dirname(__file__), "airports.csv")
+FUZZY_CUTOFF = 0.8
+FUZZY_LENGTH_SLACK = 3
+
+_index = None
+_index_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class Airport:
+    # kind is "airport" or "metro", a metro code covers all airports of a city
+    code: str
+    kind: str
+    name: str
+    city: str
+    country: str
+    metro: str = ""
+
+
+class AirportIndex:
+    def __init__(self, airports, aliases):
+        self.airports = {airport.code: airport for airport in airports}
+        self.members = {}
+        self.places = {}
+
+        for airport in airports:
+            if airport.metro:
+                self.members.setdefault(airport.metro, []).append(airport.code)
+
+        # Metros come first in the file, so "london" resolves to LON before
+        # any single London airport
+        for airport, names in zip(airports, aliases):
+            for key in {
+                airport.city,
+                airport.name,
+                f"{airport.city} {airport.name}",
+                *names,
+            }:
+                self._add(key, airport.code)
+        for airport in airports:
+            self._add(airport.code, airport.code)
+
+        self.keys = sorted(self.places)
+        self.by_initial = {}
+        for key in self.keys:
+            self.by_initial.setdefault(key[0], []).append(key)
+
+    def _add(self, text, code):
+        codes = self.places.setdefault(normalize_place(text), [])
+        if code not in codes:
+            codes.append(code)
+
+    def exact(self, key):
+        return self.places.get(key)
+
+    def prefix(self, key):
+        # Keys sharing the prefix sit next to each other in the sorted list
+        start = bisect_left(self.keys, key)
+        end = bisect_left(self.keys, key + "\U0010ffff", start)
+        return sorted(self.keys[start:end], key=len)
+
+    def fuzzy(self, key, limit):
+        # Typos rarely hit the first letter or change the length much, so
+        # only those keys are scored unless none of them is close enough
+        candidates = [
+            candidate
+            for candidate in self.by_initial.get(key[0], ())
+            if abs(len(candidate) - len(key)) <= FUZZY_LENGTH_SLACK
+        ]
+        return difflib.get_close_matches(
+            key, candidates, limit, FUZZY_CUTOFF
+        ) or difflib.get_close_matches(key, self.keys, limit, FUZZY_CUTOFF)
+
+
+def normalize_place(text):
+    # "Málaga", "MALAGA " and "malaga" are the same place, so are "St.-Tropez"
+    # and "st tropez"
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.sub(r"[^\w]+", " ", text.casefold()).split())
+
+
+def load_airports(path=AIRPORTS_FILE):
+    airports = []
+    aliases = []
+    with open(path, newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            aliases.append([alias for alias in row.pop("aliases").split("|") if alias])
+            airports.append(Airport(**row))
+    return airports, aliases
+
+
+def get_index():
+    # Built on the first lookup, so commands that never resolve a city do
+    # not pay for reading the dataset
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = AirportIndex(*load_airports())
+    return _index
+
+
+@lru_cache(maxsize=4096)
+def _match(query, limit):
+    # Returns (how, [codes per matched place]) for the best kind of match
+    index = get_index()
+    key = normalize_place(query)
+    if not key:
+        return "none", ()
+
+    codes = index.exact(key)
+    if codes:
+        return "exact", (tuple(codes),)
+
+    keys = index.prefix(key) or index.fuzzy(key, limit)
+    how = "prefix" if keys and keys[0].startswith(key) else "fuzzy"
+    places = []
+    for match in keys:
+        codes = tuple(index.exact(match))
+        if codes not in places:
+            places.append(codes)
+    return (how, tuple(places[:limit])) if places else ("none", ())
+
+
+def find_airports(query, limit=5):
+    # Exact name/code/alias matches first, then prefix, then fuzzy matches
+    index = get_index()
+    _, places = _match(query, limit)
+    codes = dict.fromkeys(code for place in places for code in place)
+    return [index.airports[code] for code in list(codes)[:limit]]
+
+
+def describe(code):
+    airport = get_index().airports[code]
+    if airport.kind == "metro":
+        return f"{airport.city} ({code}, all airports)"
+    if airport.city in airport.name:
+        return f"{airport.name} ({code})"
+    return f"{airport.city} {airport.name} ({code})"
+
+
+def resolve_place(query):
+    # The codes one city, alias or code stands for. Only exact names, codes
+    # and aliases are accepted: a typo or prefix that happens to match one
+    # place ("york" -> Cork) would search the wrong route, so those raise
+    # with the matches as suggestions.
+    how, places = _match(query, 5)
+    if how == "exact":
+        return places[0]
+    if places:
+        options = ", ".join(describe(place[0]) for place in places)
+        raise ValueError(f"Unknown city {query!r}, did you mean: {options}")
+    raise ValueError(f"Unknown city or airport {query!r}")
+
+
+def get_airport_code(city):
+    # Metro code for cities with several airports ("London" -> LON), the
+    # main airport otherwise
+    return resolve_place(city)[0]
+
+
+def expand_airports(place):
+    # Every airport a city, metro or airport code stands for, so a search
+    # can be fanned out across LHR, LGW, STN... for "London"
+    members = get_index().members
+    codes = []
+    for code in resolve_place(place):
+        for airport in members.get(code, [code]):
+            if airport not in codes:
+                codes.append(airport)
+    return codes
+
+
+if __name__ == "__main__":
+    # python -m utils.airports <city, airport or code>
+    query = " ".join(sys.argv[1:])
+    for airport in find_airports(query, limit=10):
+        print(f"{airport.code}  {airport.kind:<7} {describe(airport.code)}")
+    try:
+        print("Expands to:", ", ".join(expand_airports(query)))
+    except ValueError as e:
+        print(e)
@@ -0,0 +1,324 @@
+import math
+import sqlite3
+import statistics
+import sys
+from itertools import groupby
+
+from utils.db_connection import get_connection
+from utils.migrations import migrate
+
+# A search at least this much cheaper than the previous one raises an alert
+ALERT_DROP = 0.10
+ROLLING_DAYS = 7
+
+ROUTE_COLUMNS = (
+    "departure_code",
+    "destination_code",
+    "departure_date",
+    "return_date",
+    "seats",
+    "currency",
+)
+
+
+def route_key(departure_code, destination_code, departure_date, return_date, seats):
+    # The summary keys are NOT NULL, one-way trips use ""
+    return (
+        departure_code,
+        destination_code,
+        departure_date,
+        return_date or "",
+        int(seats or 1),
+    )
+
+
+def _aggregate(prices):
+    return (
+        min(prices),
+        max(prices),
+        math.fsum(prices),
+        len(prices),
+        statistics.median(prices),
+    )
+
+
+def _day_prices(cursor, key, currency, day):
+    # A range on the flight_tickets_route_day index, only the day's rows
+    rows = cursor.execute(
+        """
+        SELECT price FROM flight_tickets
+        WHERE departure_code = ? AND destination_code = ? AND departure_date = ?
+            AND return_date = ? AND seats = ? AND currency = ?
+            AND search_date >= ? AND search_date < date(?, '+1 day')
+        """,
+        (*key, currency, day, day),
+    )
+    return [price for (price,) in rows]
+
+
+def update_price_summaries(cursor, key, prices_by_currency, search_date):
+    # Called inside save_flight_prices' transaction with the prices of one
+    # search. Only the touched route/day row is recomputed, from the rows the
+    # search just wrote plus the earlier ones of the same day.
+    day = search_date[:10]
+    alerts = []
+
+    for currency, prices in prices_by_currency.items():
+        currency = currency or ""
+        day_prices = _day_prices(cursor, key, currency, day) or prices
+        cursor.execute(
+            """
+            INSERT OR REPLACE INTO route_price_daily
+            (departure_code, destination_code, departure_date, return_date, seats,
+            currency, search_day, min_price, max_price, total_price, observations,
+            median_price)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (*key, currency, day, *_aggregate(day_prices)),
+        )
+
+        alert = _update_latest(cursor, key, currency, min(prices), search_date)
+        if alert:
+            alerts.append(alert)
+
+    return alerts
+
+
+def _update_latest(cursor, key, currency, price, search_date):
+    previous = cursor.execute(
+        """
+        SELECT last_price, lowest_price FROM route_price_latest
+        WHERE departure_code = ? AND destination_code = ? AND departure_date = ?
+            AND return_date = ? AND seats = ? AND currency = ?
+        """,
+        (*key, currency),
+    ).fetchone()
+
+    cursor.execute(
+        """
+        INSERT INTO route_price_latest
+        (departure_code, destination_code, departure_date, return_date, seats,
+        currency, last_price, last_search_date, lowest_price, lowest_search_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT DO UPDATE SET
+            last_price = excluded.last_price,
+            last_search_date = excluded.last_search_date,
+            lowest_search_date = CASE WHEN excluded.lowest_price < lowest_price
+                THEN excluded.lowest_search_date ELSE lowest_search_date END,
+            lowest_price = MIN(lowest_price, excluded.lowest_price)
+        """,
+        (*key, currency, price, search_date, price, search_date),
+    )
+
+    if previous is None or not previous[0]:
+        return None
+    drop = (previous[0] - price) / previous[0]
+    if drop < ALERT_DROP:
+        return None
+
+    alert = dict(zip(ROUTE_COLUMNS, (*key, currency)))
+    alert.update(
+        {
+            "previous_price": previous[0],
+            "price": price,
+            "drop": drop,
+            "lowest_ever": price < previous[1],
+            "search_date": search_date,
+        }
+    )
+    cursor.execute(
+        """
+        INSERT INTO price_alerts
+        (departure_code, destination_code, departure_date, return_date, seats,
+        currency, previous_price, price, drop_ratio, search_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (*key, currency, previous[0], price, drop, search_date),
+    )
+    return alert
+
+
+def rebuild_price_summaries(conn=None):
+    # One pass over the stored history, used when the summary tables are new.
+    # Rows arrive grouped, so only one route/day is held in memory at a time.
+    conn = conn or get_connection()
+    cursor = conn.cursor()
+    rows = conn.execute("""
+        SELECT departure_code, destination_code, departure_date,
+            COALESCE(return_date, ''), COALESCE(seats, 1), COALESCE(currency, ''),
+            substr(search_date, 1, 10), search_date, price
+        FROM flight_tickets
+        WHERE price IS NOT NULL
+        ORDER BY 1, 2, 3, 4, 5, 6, 8
+    """)
+
+    groups = 0
+    with conn:
+        cursor.execute("DELETE FROM route_price_daily")
+        cursor.execute("DELETE FROM route_price_latest")
+        for (*key, currency), route_rows in groupby(rows, lambda row: row[:6]):
+            searches = [
+                (search_date, [row[8] for row in search_rows])
+                for search_date, search_rows in groupby(route_rows, lambda row: row[7])
+            ]
+            for day, day_searches in groupby(searches, lambda search: search[0][:10]):
+                prices = [price for _, search in day_searches for price in search]
+                cursor.execute(
+                    """
+                    INSERT INTO route_price_daily
+                    (departure_code, destination_code, departure_date, return_date,
+                    seats, currency, search_day, min_price, max_price, total_price,
+                    observations, median_price)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (*key, currency, day, *_aggregate(prices)),
+                )
+                groups += 1
+
+            lowest_date, lowest = min(
+                ((date, min(prices)) for date, prices in searches),
+                key=lambda search: search[1],
+            )
+            cursor.execute(
+                """
+                INSERT INTO route_price_latest
+                (departure_code, destination_code, departure_date, return_date,
+                seats, currency, last_price, last_search_date, lowest_price,
+                lowest_search_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    *key,
+                    currency,
+                    min(searches[-1][1]),
+                    searches[-1][0],
+                    lowest,
+                    lowest_date,
+                ),
+            )
+
+    print(f"Rebuilt price summaries for {groups} route days")
+    return groups
+
+
+def get_price_history(
+    departure_code, destination_code, departure_date=None, window=ROLLING_DAYS
+):
+    # Daily aggregates for a route with rolling averages over the last
+    # `window` search days, read from the summary table only
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+
+    query = f"""
+        SELECT *,
+            total_price / observations AS avg_price,
+            AVG(min_price) OVER route_window AS rolling_min_price,
+            SUM(total_price) OVER route_window
+                / SUM(observations) OVER route_window AS rolling_avg_price
+        FROM route_price_daily
+        WHERE departure_code = ? AND destination_code = ?
+            {"AND departure_date = ?" if departure_date else ""}
+        WINDOW route_window AS (
+            PARTITION BY departure_date, return_date, seats, currency
+            ORDER BY search_day
+            ROWS BETWEEN {int(window) - 1} PRECEDING AND CURRENT ROW
+        )
+        ORDER BY departure_date, return_date, seats, currency, search_day
+    """
+    params = [departure_code, destination_code]
+    if departure_date:
+        params.append(departure_date)
+
+    cursor.execute(query, params)
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def get_route_trends(departure_code=None, destination_code=None, limit=10):
+    # Latest and lowest price per route, biggest drops from the lowest first
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+
+    conditions = []
+    params = []
+    if departure_code:
+        conditions.append("departure_code = ?")
+        params.append(departure_code)
+    if destination_code:
+        conditions.append("destination_code = ?")
+        params.append(destination_code)
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+
+    cursor.execute(
+        f"""
+        SELECT *, last_price - lowest_price AS above_lowest
+        FROM route_price_latest{where}
+        ORDER BY last_search_date DESC, last_price ASC
+        LIMIT ?
+        """,
+        (*params, limit),
+    )
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def get_price_calendar(
+    departure_code, destination_code, departure_from, departure_to, seats=1
+):
+    # Last known price per departure/return date pair, keyed like the
+    # flexible search grid ("" is one-way)
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+
+    cursor.execute(
+        """
+        SELECT departure_date, return_date, currency, last_price,
+            last_search_date, lowest_price
+        FROM route_price_latest
+        WHERE departure_code = ? AND destination_code = ?
+            AND departure_date BETWEEN ? AND ? AND seats = ?
+        ORDER BY last_search_date
+        """,
+        (departure_code, destination_code, departure_from, departure_to, seats),
+    )
+    return {
+        (row["departure_date"], row["return_date"]): dict(row)
+        for row in cursor.fetchall()
+    }
+
+
+def get_price_alerts(limit=10):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+
+    cursor.execute(
+        "SELECT * FROM price_alerts ORDER BY search_date DESC, drop_ratio DESC "
+        "LIMIT ?",
+        (limit,),
+    )
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def format_alert(alert):
+    trip = alert["departure_date"]
+    if alert["return_date"]:
+        trip += f" - {alert['return_date']}"
+    return (
+        f"Price drop {alert['departure_code']} -> {alert['destination_code']} "
+        f"{trip}: {alert['previous_price']:,.2f} -> {alert['price']:,.2f} "
+        f"{alert['currency']} (-{alert['drop']:.0%})"
+    )
+
+
+if __name__ == "__main__":
+    # python -m utils.analytics <from code> <to code> [departure date]
+    migrate(get_connection())
+    for day in get_price_history(*sys.argv[1:4]):
+        print(
+            f"{day['departure_date']} {day['return_date'] or 'one-way':<10} "
+            f"{day['search_day']}  min {day['min_price']:>9,.2f}  "
+            f"median {day['median_price']:>9,.2f}  max {day['max_price']:>9,.2f}  "
+            f"{ROLLING_DAYS}d avg {day['rolling_avg_price']:>9,.2f} {day['currency']}"
+        )
@@ -0,0 +1,282 @@
+import csv
+import json
+import time
+from datetime import datetime, timedelta
+from functools import partial
+from itertools import product
+
+from scrappers.engine import get_engine
+from scrappers.esky_scraper import flight_search_task
+from scrappers.eventbrite_scraper import event_search_task
+from scrappers.multiprocess import iter_pipeline
+from utils.airports import get_airport_code
+from utils.database import (
+    get_known_event_ids,
+    save_fetched_events,
+    save_fetched_flights,
+)
+
+
+def _date_list(value):
+    # Either an explicit list or {"start": ..., "end": ...} / {"start": ..., "days": n}
+    if isinstance(value, list):
+        return value
+
+    start = datetime.strptime(value["start"], "%Y-%m-%d").date()
+    if "end" in value:
+        end = datetime.strptime(value["end"], "%Y-%m-%d").date()
+        days = (end - start).days + 1
+    else:
+        days = value["days"]
+    return [(start + timedelta(days=i)).isoformat() for i in range(days)]
+
+
+def expand_grid(spec):
+    departure_dates = _date_list(spec["departure_dates"])
+    trip_lengths = spec.get("trip_lengths") or [None]
+    seats = spec.get("seats", 1)
+
+    for origin, destination, departure_date, length in product(
+        spec["origins"], spec["destinations"], departure_dates, trip_lengths
+    ):
+        if origin == destination:
+            continue
+
+        return_date = ""
+        if length is not None:
+            departure = datetime.strptime(departure_date, "%Y-%m-%d").date()
+            return_date = (departure + timedelta(days=length)).isoformat()
+
+        yield {
+            "departure_city": origin,
+            "destination_city": destination,
+            "departure_date": departure_date,
+            "return_date": return_date,
+            "seats": seats,
+        }
+
+
+def load_queries(path):
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as file:
+            return list(csv.DictReader(file))
+
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+
+    if isinstance(data, dict):
+        return list(expand_grid(data))
+    return data
+
+
+def normalize_query(query):
+    departure_city = query["departure_city"].strip()
+    destination_city = query["destination_city"].strip()
+
+    return {
+        "departure_city": departure_city,
+        "departure_code": query.get("departure_code")
+        or get_airport_code(departure_city),
+        "destination_city": destination_city,
+        "destination_code": query.get("destination_code")
+        or get_airport_code(destination_city),
+        "departure_date": query["departure_date"].strip(),
+        "return_date": (query.get("return_date") or "").strip(),
+        "seats": int(query.get("seats") or 1),
+    }
+
+
+def dedupe_queries(queries):
+    seen = set()
+    unique = []
+
+    for query in queries:
+        try:
+            query = normalize_query(query)
+        except ValueError as e:
+            # An unknown city would only cost a failed browser search
+            print(f"Skipping search: {e}")
+            continue
+        key = (
+            query["departure_code"],
+            query["destination_code"],
+            query["departure_date"],
+            query["return_date"],
+            query["seats"],
+        )
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(query)
+
+    return unique
+
+
+def _results(tasks, max_parallel, processes, parse_processes):
+    # processes: run in that many fetch processes with a parser pool instead
+    # of the shared in-process engine, results are still saved from here
+    if processes:
+        return iter_pipeline(tasks, processes, parse_processes)
+    return get_engine().iter_results(tasks, max_parallel=max_parallel)
+
+
+def run_batch(queries, max_parallel=16, processes=None, parse_processes=None):
+    queries = dedupe_queries(queries)
+    print(f"\nRunning {len(queries)} unique flight searches...")
+
+    def tasks():
+        for query in queries:
+            task = flight_search_task(
+                query["departure_code"],
+                query["destination_code"],
+                query["departure_date"],
+                query["return_date"],
+                query["seats"],
+            )
+            task.params["query"] = query
+            task.on_fetched = partial(save_fetched_flights, query)
+            yield task
+
+    stats = {
+        "searches": 0,
+        "failed": 0,
+        "empty": 0,
+        "prices_saved": 0,
+        "rows_written": 0,
+        "db_seconds": 0.0,
+        "cache_hits": 0,
+        "requests_blocked": 0,
+        "bytes_saved": 0,
+        "price_alerts": 0,
+    }
+    started = time.perf_counter()
+
+    for result in _results(tasks(), max_parallel, processes, parse_processes):
+        stats["searches"] += 1
+        # Live results are saved as soon as they are parsed, cached prices
+        # were saved by the search or refresh that fetched them
+        if result.cached:
+            stats["cache_hits"] += 1
+            continue
+        if result.traffic:
+            stats["requests_blocked"] += result.traffic["blocked_requests"]
+            stats["bytes_saved"] += result.traffic["estimated_bytes_saved"]
+        if not result.ok:
+            stats["failed"] += 1
+            continue
+        if not result.items:
+            stats["empty"] += 1
+            continue
+
+        saved = result.saved
+        stats["prices_saved"] += saved["rows"]
+        stats["rows_written"] += saved["written"]
+        stats["db_seconds"] += saved["seconds"]
+        stats["price_alerts"] += len(saved["alerts"])
+
+    elapsed = time.perf_counter() - started
+    stats["elapsed"] = elapsed
+    stats["searches_per_minute"] = stats["searches"] / elapsed * 60 if elapsed else 0.0
+    stats["failure_rate"] = (
+        stats["failed"] / stats["searches"] if stats["searches"] else 0.0
+    )
+
+    print(f"\nSearches: {stats['searches']} in {elapsed:.1f}s")
+    print(f"Throughput: {stats['searches_per_minute']:.1f} searches/minute")
+    print(f"Failed: {stats['failed']} ({stats['failure_rate']:.1%})")
+    print(f"No results: {stats['empty']}")
+    print(f"Served from cache: {stats['cache_hits']}")
+    saved_searches = (
+        stats["searches"] - stats["failed"] - stats["empty"] - stats["cache_hits"]
+    )
+    print(
+        f"Prices saved: {stats['prices_saved']} ({stats['rows_written']} new rows, "
+        f"{stats['prices_saved'] / max(saved_searches, 1):.1f} per batch, "
+        f"{stats['db_seconds']:.2f}s in SQLite)"
+    )
+    print(f"Price drop alerts: {stats['price_alerts']}")
+    print(
+        f"Requests blocked: {stats['requests_blocked']} "
+        f"(~{stats['bytes_saved'] / 1024 / 1024:.1f} MiB saved)"
+    )
+
+    return stats
+
+
+def run_event_batch(
+    cities,
+    start_date,
+    end_date=None,
+    max_parallel=8,
+    processes=None,
+    parse_processes=None,
+):
+    # Same city spelled twice is one search
+    unique = {}
+    for city in cities:
+        city = " ".join(city.split())
+        unique.setdefault(city.casefold(), city)
+    cities = list(unique.values())
+    print(f"\nSearching events in {len(cities)} cities...")
+    # Looked up here, the task generator itself runs on the engine loop
+    known_ids = {city: get_known_event_ids(city) for city in cities}
+
+    def tasks():
+        for city in cities:
+            task = event_search_task(
+                city, start_date, end_date, known_ids=known_ids[city]
+            )
+            task.on_fetched = partial(save_fetched_events, city)
+            yield task
+
+    stats = {
+        "cities": 0,
+        "failed": 0,
+        "empty": 0,
+        "retries": 0,
+        "events_saved": 0,
+        "rows_written": 0,
+        "cache_hits": 0,
+    }
+    started = time.perf_counter()
+    rate_limiter = None if processes else get_engine().rate_limiter
+    waited_before = rate_limiter.waited if rate_limiter else 0.0
+
+    for result in _results(tasks(), max_parallel, processes, parse_processes):
+        city = result.task.params["destination"]
+        stats["cities"] += 1
+        stats["retries"] += result.attempts - 1
+        if result.cached:
+            stats["cache_hits"] += 1
+            continue
+        if not result.ok:
+            stats["failed"] += 1
+            continue
+        if not result.items:
+            stats["empty"] += 1
+            continue
+
+        saved = result.saved
+        stats["events_saved"] += saved["rows"]
+        stats["rows_written"] += saved["written"]
+        print(f"{city}: {saved['rows']} events")
+
+    elapsed = time.perf_counter() - started
+    stats["elapsed"] = elapsed
+    # Each fetch process keeps its own limiter, only in-process waits are known
+    stats["rate_limit_wait"] = (
+        rate_limiter.waited - waited_before if rate_limiter else None
+    )
+
+    print(f"\nCities: {stats['cities']} in {elapsed:.1f}s")
+    print(f"Failed: {stats['failed']}, no events: {stats['empty']}")
+    print(f"Retries: {stats['retries']}")
+    print(f"Served from cache: {stats['cache_hits']}")
+    print(f"Events saved: {stats['events_saved']} ({stats['rows_written']} rows)")
+    if rate_limiter:
+        print(
+            f"Waiting on rate limits: {stats['rate_limit_wait']:.1f}s "
+            "summed over cities"
+        )
+
+    return stats
@@ -1,63 +1,138 @@
 import re
 
+CURRENCY_SYMBOLS = {
+    "US$": "USD",
+    "$": "USD",
+    "€": "EUR",
+    "£": "GBP",
+    "¥": "JPY",
+    "₽": "RUB",
+    "₹": "INR",
+    "zł": "PLN",
+    "Kč": "CZK",
+}
+CURRENCY_CODES = {"USD", "EUR", "GBP", "JPY", "RUB", "INR", "PLN", "CZK", "SEK", "NOK"}
+FREE_WORDS = {"free"}
+MISSING_WORDS = {"", "unknown", "no price"}
+
+SYMBOL_PATTERN = "(" + "|".join(re.escape(symbol) for symbol in CURRENCY_SYMBOLS) + ")"
+CODE_PATTERN = r"\b(" + "|".join(sorted(CURRENCY_CODES)) + r")\b"
+# NBSP and narrow NBSP are common thousands separators in European prices
+SPACE_PATTERN = "[\\s\u00a0\u202f]"
+NUMBER_PATTERN = r"(\d(?:\d|" + SPACE_PATTERN + r"|[.,])*)"
+# Thousands groups, then an optional 1-2 digit fraction: 1,234.56 / 1.234,56 / 12,5
+SPLIT_PATTERN = r"^(\d+(?:[.,]\d+)*?)(?:[.,](\d{1,2}))?$"
+
+_symbol_re = re.compile(SYMBOL_PATTERN)
+_code_re = re.compile(CODE_PATTERN)
+_number_re = re.compile(NUMBER_PATTERN)
+_split_re = re.compile(SPLIT_PATTERN)
+
+
+def _parse_number(text):
+    digits = re.sub(SPACE_PATTERN, "", text).rstrip(".,")
+    match = _split_re.match(digits)
+    if not match:
+        return None
+    whole, fraction = match.groups()
+    return float(re.sub(r"[.,]", "", whole) + "." + (fraction or "0"))
+
+
+def normalize_price(price_text):
+    # "From $30.44" -> (30.44, "USD"), "1 234 EUR" -> (1234.0, "EUR")
+    if price_text is None:
+        return None, None
+    text = str(price_text).strip()
+    lowered = text.lower()
+    if lowered in MISSING_WORDS:
+        return None, None
+    if lowered in FREE_WORDS:
+        return 0.0, None
+
+    code = _code_re.search(text)
+    symbol = _symbol_re.search(text)
+    currency = code.group(1) if code else None
+    if currency is None and symbol:
+        currency = CURRENCY_SYMBOLS[symbol.group(1)]
+
+    number = _number_re.search(text)
+    amount = _parse_number(number.group(1)) if number else None
+    return amount, currency
+
+
+def normalize_prices(price_texts):
+    # Scraped lists repeat the same strings a lot, parse each one once
+    seen = {}
+    results = []
+    for text in price_texts:
+        if text not in seen:
+            seen[text] = normalize_price(text)
+        results.append(seen[text])
+    return results
+
+
+def normalize_offer_prices(items):
+    # (offer, amount, currency) for scraped flight items. API offers carry the
+    # amount as a number, only "123 EUR" strings from the page are parsed.
+    offers = [{"price": item} if isinstance(item, str) else item for item in items]
+    parsed = iter(
+        normalize_prices(
+            [offer.get("price") for offer in offers if offer.get("amount") is None]
+        )
+    )
+    results = []
+    for offer in offers:
+        if offer.get("amount") is None:
+            amount, currency = next(parsed)
+        else:
+            amount, currency = float(offer["amount"]), offer.get("currency")
+            currency = CURRENCY_SYMBOLS.get(currency, currency) or None
+        results.append((offer, amount, currency))
+    return results
+
+
+def normalize_price_series(series):
+    # Batch version of normalize_price for a pandas Series, returns
+    # "amount"/"currency" columns. Only distinct strings go through the regexes,
+    # pandas' own str.extract is a Python loop per row anyway.
+    import numpy as np
+    import pandas as pd
+
+    codes, uniques = pd.factorize(series.astype(object), use_na_sentinel=True)
+    parsed = normalize_prices(list(uniques)) + [(None, None)]
+    amounts = np.array(
+        [np.nan if amount is None else amount for amount, _ in parsed], dtype="float64"
+    )
+    currencies = np.array([currency for _, currency in parsed], dtype=object)
+
+    # The sentinel -1 picks the trailing (None, None) entry for missing values
+    return pd.DataFrame(
+        {
+            "amount": amounts[codes],
+            "currency": pd.Series(currencies[codes], index=series.index, dtype=object),
+        },
+        index=series.index,
+    )
+
 
 def clean_price(price_text):
     # Clean price strings and convert to float.
-    if not price_text or price_text.lower() in ["free", "unknown", "no price"]:
-        return 0.0
-
-    # Remove currency symbols except decimal points
-    cleaned = re.sub(r"[^\d.,]", "", price_text)
-
-    # Handle comma or period
-    if "," in cleaned and "." in cleaned:
-        cleaned = cleaned.replace(",", "")
-    elif "," in cleaned:
-        cleaned = cleaned.replace(",", ".")
-
-    try:
-        return float(cleaned)
-    except ValueError:
-        return 0.0
+    amount, _ = normalize_price(price_text)
+    return amount or 0.0
 
 
 def clean_currency(price_text):
-    # Remove currency symbol, depending on format
-    if not price_text or price_text.lower() in ["free", "unknown", "no price"]:
-        return ""
-
-    currency_map = {
-        "$": "USD",
-        "€": "EUR",
-        "£": "GBP",
-        "¥": "JPY",
-        "₽": "RUB",
-        "₹": "INR",
-    }
-
-    currency_match = re.search(r"[\$€£¥₽₹]", price_text)
-    if currency_match:
-        symbol = currency_match.group(0)
-        return currency_map.get(symbol, symbol)
-
-    # Find currency code
-    currency_code_match = re.search(r"\b(USD|EUR|GBP|JPY|RUB|INR)\b", price_text)
-    if currency_code_match:
-        return currency_code_match.group(1)
-
-    return ""
+    _, currency = normalize_price(price_text)
+    return currency or ""
 
 
 def process_flight_prices(price_list):
     processed_prices = []
 
-    for price_str in price_list:
-        price = clean_price(price_str)
-        currency = clean_currency(price_str)
-
-        if price > 0:
+    for price_str, (price, currency) in zip(price_list, normalize_prices(price_list)):
+        if price:
             processed_prices.append(
-                {"price": price, "currency": currency, "original": price_str}
+                {"price": price, "currency": currency or "", "original": price_str}
             )
 
     processed_prices.sort(key=lambda x: x["price"])
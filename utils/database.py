@@ -1,47 +1,66 @@
 import sqlite3
+import time
 from datetime import datetime, timedelta
 
-DB_FILE = "travel_planner.db"
-
-
-def initialize_db():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS flight_tickets (
-        id INTEGER PRIMARY KEY,
-        departure_city TEXT,
-        departure_code TEXT,
-        destination_city TEXT, 
-        destination_code TEXT,
-        departure_date TEXT,
-        return_date TEXT,
-        price REAL,
-        currency TEXT,
-        seats INTEGER,
-        search_date TEXT
-    )
-    """)
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS events (
-        id INTEGER PRIMARY KEY,
-        city TEXT,
-        event_id TEXT,
-        title TEXT,
-        datetime TEXT,
-        location TEXT,
-        price TEXT,
-        url TEXT,
-        search_date TEXT
+from utils.analytics import (
+    format_alert,
+    rebuild_price_summaries,
+    route_key,
+    update_price_summaries,
+)
+from utils.data_processing import (
+    CURRENCY_SYMBOLS,
+    normalize_offer_prices,
+    normalize_prices,
+)
+from utils.db_connection import get_connection
+from utils.metrics import metrics, timed
+from utils.migrations import migrate, normalize_city, schema_version
+
+BATCH_SIZE = 500
+PRICE_COLUMNS_VERSION = 6
+PRICE_SUMMARY_VERSION = 7
+
+
+def _has_saved_rows(conn):
+    # Databases from before the migrations have user_version 0 but already
+    # hold searches, those are the ones that need backfilling
+    tables = {
+        name
+        for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name IN ('flight_tickets', 'events')"
+        )
+    }
+    return any(
+        conn.execute(f"SELECT EXISTS (SELECT 1 FROM {table})").fetchone()[0]
+        for table in tables
     )
-    """)
-
-    conn.commit()
-    conn.close()
 
 
+def initialize_db():
+    conn = get_connection()
+    previous_version = schema_version(conn)
+    had_rows = _has_saved_rows(conn)
+    applied = migrate(conn)
+    current_version = schema_version(conn)
+    # Fresh databases have no rows to backfill
+    if had_rows and previous_version < PRICE_COLUMNS_VERSION <= current_version:
+        backfill_prices()
+    if had_rows and previous_version < PRICE_SUMMARY_VERSION <= current_version:
+        rebuild_price_summaries(conn)
+    return applied
+
+
+def _executemany(cursor, sql, rows, batch_size=BATCH_SIZE):
+    changed = 0
+    for start in range(0, len(rows), batch_size):
+        cursor.executemany(sql, rows[start : start + batch_size])
+        changed += cursor.rowcount
+    return changed
+
+
+@timed("db.save_flights")
 def save_flight_prices(
     departure_city,
     departure_code,
@@ -52,51 +71,128 @@ def save_flight_prices(
     prices,
     seats,
 ):
-    from datetime import datetime
-
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    started = time.perf_counter()
     search_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # Stored the way the summaries key a route, one-way is "" and seats an int
+    key = route_key(
+        departure_code, destination_code, departure_date, return_date, seats
+    )
+    rows = []
+    prices_by_currency = {}
+    # Items are "123 EUR" strings from the page or offer dicts from the API
+    for offer, price, currency in normalize_offer_prices(prices):
+        if price is None:
+            print(f"Could not parse price: {offer.get('price')}")
+            continue
+        prices_by_currency.setdefault(currency, []).append(price)
+        rows.append(
+            (
+                departure_city,
+                departure_code,
+                destination_city,
+                destination_code,
+                departure_date,
+                key[3],
+                price,
+                currency or "",
+                key[4],
+                search_date,
+                normalize_city(departure_city),
+                normalize_city(destination_city),
+                offer.get("carrier"),
+                offer.get("departure_time"),
+                offer.get("arrival_time"),
+                offer.get("stops"),
+                offer.get("duration_minutes"),
+            )
+        )
 
-    for price_str in prices:
-        try:
-            # Parse the price string
-            parts = price_str.strip().split()
-            if len(parts) >= 2:
-                price = float(parts[0].replace(",", ""))
-                currency = parts[1]
-
-                cursor.execute(
-                    """
-                INSERT INTO flight_tickets 
-                (departure_city, departure_code, destination_city, destination_code, 
-                departure_date, return_date, price, currency, seats, search_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                    (
-                        departure_city,
-                        departure_code,
-                        destination_city,
-                        destination_code,
-                        departure_date,
-                        return_date,
-                        price,
-                        currency,
-                        seats,
-                        search_date,
-                    ),
-                )
-        except (ValueError, IndexError) as e:
-            print(f"Could not parse price: {price_str} - Error: {e}")
+    conn = get_connection()
+    with conn:
+        cursor = conn.cursor()
+        inserted = _executemany(
+            cursor,
+            """
+            INSERT INTO flight_tickets
+            (departure_city, departure_code, destination_city, destination_code,
+            departure_date, return_date, price, currency, seats, search_date,
+            departure_city_norm, destination_city_norm, carrier, departure_time,
+            arrival_time, stops, duration_minutes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT DO NOTHING
+            """,
+            rows,
+        )
+        # Keep the per-route summaries in step with the rows just written
+        alerts = update_price_summaries(
+            cursor,
+            key,
+            prices_by_currency,
+            search_date,
+        )
 
-    conn.commit()
-    conn.close()
+    for alert in alerts:
+        print(format_alert(alert))
+    metrics.count("db.rows_written", inserted, table="flight_tickets")
+    metrics.count("db.price_alerts", len(alerts))
+
+    return {
+        "rows": len(rows),
+        "written": inserted,
+        "seconds": time.perf_counter() - started,
+        "alerts": alerts,
+    }
+
+
+def backfill_prices(chunk_size=BATCH_SIZE):
+    # Rows saved before the numeric price columns existed, one short
+    # transaction per chunk so scrapers can keep writing
+    conn = get_connection()
+    updated = 0
+    last_id = 0
+
+    while True:
+        chunk = conn.execute(
+            """
+            SELECT id, price FROM events
+            WHERE id > ? AND price IS NOT NULL AND price_amount IS NULL
+            ORDER BY id
+            LIMIT ?
+            """,
+            (last_id, chunk_size),
+        ).fetchall()
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+
+        prices = normalize_prices([price for _, price in chunk])
+        with conn:
+            conn.executemany(
+                "UPDATE events SET price_amount = ?, price_currency = ? WHERE id = ?",
+                [
+                    (amount, currency, event_id)
+                    for (event_id, _), (amount, currency) in zip(chunk, prices)
+                    if amount is not None
+                ],
+            )
+        updated += len(chunk)
+
+    # Flight prices were already numeric, only symbols like "€" need mapping.
+    # OR REPLACE drops rows that become duplicates of an existing observation.
+    with conn:
+        conn.executemany(
+            "UPDATE OR REPLACE flight_tickets SET currency = ? WHERE currency = ?",
+            [(code, symbol) for symbol, code in CURRENCY_SYMBOLS.items()],
+        )
+
+    print(f"Backfilled prices for {updated} events")
+    return updated
 
 
 def get_saved_flights(limit=10):
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
+    conn = get_connection()
     cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
 
     cursor.execute(
         """
@@ -108,56 +204,100 @@ def get_saved_flights(limit=10):
     )
 
     results = [dict(row) for row in cursor.fetchall()]
-    conn.close()
 
     return results
 
 
+@timed("db.save_events")
 def save_events(city, events):
     if not events:
-        return
+        return {"rows": 0, "written": 0, "seconds": 0.0}
 
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    started = time.perf_counter()
     search_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    for event in events:
-        cursor.execute(
+    prices = normalize_prices([event.get("price") for event in events])
+    rows = [
+        (
+            city,
+            event.get("event_id"),
+            event.get("title"),
+            event.get("datetime"),
+            event.get("location"),
+            event.get("price"),
+            price_amount,
+            price_currency,
+            event.get("url"),
+            search_date,
+            normalize_city(city),
+        )
+        for event, (price_amount, price_currency) in zip(events, prices)
+    ]
+
+    conn = get_connection()
+    with conn:
+        # Rescraping a city refreshes known events instead of duplicating them
+        written = _executemany(
+            conn.cursor(),
             """
-            INSERT INTO events 
-            (city, event_id, title, datetime, location, price, url, search_date)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO events
+            (city, event_id, title, datetime, location, price, price_amount,
+            price_currency, url, search_date, city_norm)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (city_norm, event_id) DO UPDATE SET
+                city = excluded.city,
+                title = excluded.title,
+                datetime = excluded.datetime,
+                location = excluded.location,
+                price = excluded.price,
+                price_amount = excluded.price_amount,
+                price_currency = excluded.price_currency,
+                url = excluded.url,
+                search_date = excluded.search_date
             """,
-            (
-                city,
-                event.get("event_id"),
-                event.get("title"),
-                event.get("datetime"),
-                event.get("location"),
-                event.get("price"),
-                event.get("url"),
-                search_date,
-            ),
+            rows,
         )
+    metrics.count("db.rows_written", written, table="events")
+
+    return {
+        "rows": len(rows),
+        "written": written,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def save_fetched_flights(query, result):
+    # SearchTask.on_fetched for a flight search, bind query with partial
+    return save_flight_prices(
+        query["departure_city"],
+        query["departure_code"],
+        query["destination_city"],
+        query["destination_code"],
+        query["departure_date"],
+        query["return_date"],
+        result.items,
+        query["seats"],
+    )
 
-    conn.commit()
-    conn.close()
+
+def save_fetched_events(city, result):
+    # SearchTask.on_fetched for an event search
+    return save_events(city, result.items)
 
 
 def get_saved_events(city=None, limit=10):
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
+    conn = get_connection()
     cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
 
     if city:
         cursor.execute(
             """
             SELECT * FROM events
-            WHERE city = ?
+            WHERE city_norm = ?
             ORDER BY search_date DESC
             LIMIT ?
             """,
-            (city, limit),
+            (normalize_city(city), limit),
         )
     else:
         cursor.execute(
@@ -170,28 +310,36 @@ def get_saved_events(city=None, limit=10):
         )
 
     results = [dict(row) for row in cursor.fetchall()]
-    conn.close()
 
     return results
 
 
+def get_known_event_ids(city):
+    # Answered from the (city_norm, event_id) unique index alone
+    conn = get_connection()
+    rows = conn.execute(
+        "SELECT event_id FROM events WHERE city_norm = ? AND event_id IS NOT NULL",
+        (normalize_city(city),),
+    )
+    return {event_id for (event_id,) in rows}
+
+
 def get_flights_by_destination(destination_city, limit=10):
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
+    conn = get_connection()
     cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
 
     cursor.execute(
         """
         SELECT * FROM flight_tickets
-        WHERE destination_city = ?
+        WHERE destination_city_norm = ?
         ORDER BY search_date DESC, price ASC
         LIMIT ?
         """,
-        (destination_city, limit),
+        (normalize_city(destination_city), limit),
     )
 
     results = [dict(row) for row in cursor.fetchall()]
-    conn.close()
 
     return results
 
@@ -199,7 +347,7 @@ def get_flights_by_destination(destination_city, limit=10):
 def delete_old_data(days=30):
     cutoff_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
 
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute(
@@ -209,6 +357,7 @@ def delete_old_data(days=30):
         """,
         (cutoff_date,),
     )
+    deleted_rows = cursor.rowcount
 
     cursor.execute(
         """
@@ -217,9 +366,25 @@ def delete_old_data(days=30):
         """,
         (cutoff_date,),
     )
+    deleted_rows += cursor.rowcount
+
+    # route_price_daily / route_price_latest keep the long-term trends
+    cursor.execute(
+        """
+        DELETE FROM price_alerts
+        WHERE search_date < ?
+        """,
+        (cutoff_date,),
+    )
+
+    cursor.execute(
+        """
+        DELETE FROM search_cache
+        WHERE fetched_at < ?
+        """,
+        ((datetime.now() - timedelta(days=days)).timestamp(),),
+    )
 
     conn.commit()
-    deleted_rows = conn.total_changes
-    conn.close()
 
     return deleted_rows
@@ -0,0 +1,50 @@
+import os
+import sqlite3
+import threading
+
+DB_FILE = os.environ.get("TRAVEL_PLANNER_DB", "travel_planner.db")
+
+CACHE_SIZE_KIB = 64 * 1024
+MMAP_SIZE = 256 * 1024 * 1024
+BUSY_TIMEOUT_MS = 5000
+
+_local = threading.local()
+
+
+def set_db_file(path):
+    # Connections opened for the old file are replaced on next use
+    global DB_FILE
+    DB_FILE = path
+
+
+def _open(db_file):
+    conn = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT_MS / 1000)
+    # WAL lets readers keep going while a scraper thread writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def get_connection():
+    # One long-lived connection per thread, sqlite3 objects are not shared
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.db_file != DB_FILE:
+        conn.close()
+        conn = None
+
+    if conn is None:
+        conn = _open(DB_FILE)
+        _local.conn = conn
+        _local.db_file = DB_FILE
+    return conn
+
+
+def close_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
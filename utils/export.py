@@ -0,0 +1,249 @@
+import csv
+import json
+import os
+import time
+
+from utils.db_connection import get_connection
+from utils.migrations import normalize_city
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+CHUNK_ROWS = 10_000
+PROGRESS_SECONDS = 1.0
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".parquet": "parquet"}
+
+# Everything except the internal *_norm lookup columns
+EXPORT_COLUMNS = {
+    "flight_tickets": [
+        "id",
+        "departure_city",
+        "departure_code",
+        "destination_city",
+        "destination_code",
+        "departure_date",
+        "return_date",
+        "price",
+        "currency",
+        "seats",
+        "search_date",
+        "carrier",
+        "departure_time",
+        "arrival_time",
+        "stops",
+        "duration_minutes",
+    ],
+    "events": [
+        "id",
+        "city",
+        "event_id",
+        "title",
+        "datetime",
+        "location",
+        "price",
+        "price_amount",
+        "price_currency",
+        "url",
+        "search_date",
+    ],
+}
+TABLES = {"flights": "flight_tickets", "events": "events"}
+
+
+def available_formats():
+    return [name for name in FORMATS.values() if name != "parquet" or pa is not None]
+
+
+def format_for_path(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(
+            f"Unknown export format for {path!r}, use .csv/.jsonl/.parquet"
+        )
+    return FORMATS[extension]
+
+
+def _place_filter(code_column, norm_column, place):
+    # Either an airport code ("RIX") or a city name ("Riga")
+    return f"({code_column} = ? OR {norm_column} = ?)", [
+        place.strip().upper(),
+        normalize_city(place),
+    ]
+
+
+def build_export_query(
+    dataset,
+    origin=None,
+    destination=None,
+    city=None,
+    departure_from=None,
+    departure_to=None,
+    searched_from=None,
+    searched_to=None,
+):
+    table = TABLES[dataset]
+    conditions = []
+    params = []
+
+    if dataset == "flights":
+        for column, place in (("departure", origin), ("destination", destination)):
+            if place:
+                condition, values = _place_filter(
+                    f"{column}_code", f"{column}_city_norm", place
+                )
+                conditions.append(condition)
+                params.extend(values)
+        if departure_from:
+            conditions.append("departure_date >= ?")
+            params.append(departure_from)
+        if departure_to:
+            conditions.append("departure_date <= ?")
+            params.append(departure_to)
+    elif city:
+        conditions.append("city_norm = ?")
+        params.append(normalize_city(city))
+
+    # search_date holds a time too, the end of the window is the whole day
+    if searched_from:
+        conditions.append("search_date >= ?")
+        params.append(searched_from)
+    if searched_to:
+        conditions.append("search_date < date(?, '+1 day')")
+        params.append(searched_to)
+
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    # Rowid order streams straight off the table without a sort
+    query = f"SELECT {', '.join(EXPORT_COLUMNS[table])} FROM {table}{where} ORDER BY id"
+    count_query = f"SELECT COUNT(*) FROM {table}{where}"
+    return query, count_query, params
+
+
+def iter_chunks(conn, query, params, chunk_size=CHUNK_ROWS):
+    cursor = conn.execute(query, params)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+
+def _arrow_schema(conn, table):
+    types = {"INTEGER": pa.int64(), "REAL": pa.float64()}
+    declared = {
+        row[1]: row[2].upper() for row in conn.execute(f"PRAGMA table_info({table})")
+    }
+    return pa.schema(
+        [
+            (column, types.get(declared[column], pa.string()))
+            for column in EXPORT_COLUMNS[table]
+        ]
+    )
+
+
+class _CsvWriter:
+    def __init__(self, path, columns):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class _JsonLinesWriter:
+    def __init__(self, path, columns):
+        self.file = open(path, "w", encoding="utf-8")
+        self.columns = columns
+
+    def write(self, rows):
+        self.file.writelines(
+            json.dumps(dict(zip(self.columns, row)), ensure_ascii=False) + "\n"
+            for row in rows
+        )
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetWriter:
+    # One row group per chunk, so only a chunk is ever held in memory
+    def __init__(self, path, schema):
+        self.schema = schema
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, rows):
+        arrays = [
+            pa.array([row[index] for row in rows], type=field.type)
+            for index, field in enumerate(self.schema)
+        ]
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def _open_writer(export_format, path, conn, table):
+    if export_format == "csv":
+        return _CsvWriter(path, EXPORT_COLUMNS[table])
+    if export_format == "jsonl":
+        return _JsonLinesWriter(path, EXPORT_COLUMNS[table])
+    if export_format == "parquet":
+        if pa is None:
+            raise ValueError("Parquet export needs pyarrow installed")
+        return _ParquetWriter(path, _arrow_schema(conn, table))
+    raise ValueError(f"Unknown export format {export_format!r}")
+
+
+def _print_progress(rows, total, elapsed, end=""):
+    rate = rows / elapsed if elapsed else 0.0
+    percent = f" ({rows / total:.0%})" if total else ""
+    print(f"\rExported {rows}/{total} rows{percent}, {rate:,.0f} rows/s", end=end)
+
+
+def export_data(dataset, path, export_format=None, chunk_size=CHUNK_ROWS, **filters):
+    # Streams the filtered rows to path chunk by chunk, memory use does not
+    # grow with the number of rows
+    export_format = export_format or format_for_path(path)
+    conn = get_connection()
+    table = TABLES[dataset]
+    query, count_query, params = build_export_query(dataset, **filters)
+    total = conn.execute(count_query, params).fetchone()[0]
+
+    started = time.perf_counter()
+    last_report = started
+    rows_written = 0
+    temp_path = path + ".tmp"
+    writer = _open_writer(export_format, temp_path, conn, table)
+
+    try:
+        for rows in iter_chunks(conn, query, params, chunk_size):
+            writer.write(rows)
+            rows_written += len(rows)
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_SECONDS:
+                _print_progress(rows_written, total, now - started)
+                last_report = now
+        writer.close()
+    except BaseException:
+        writer.close()
+        os.remove(temp_path)
+        raise
+    os.replace(temp_path, path)
+
+    elapsed = time.perf_counter() - started
+    _print_progress(rows_written, total, elapsed, end="\n")
+    print(f"Wrote {path} ({export_format}, {os.path.getsize(path) / 1024:.0f} KiB)")
+
+    return {
+        "rows": rows_written,
+        "path": path,
+        "format": export_format,
+        "seconds": elapsed,
+        "rows_per_second": rows_written / elapsed if elapsed else 0.0,
+    }
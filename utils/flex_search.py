@@ -0,0 +1,162 @@
+import time
+from datetime import datetime, timedelta
+from functools import partial
+
+import pandas as pd
+
+from scrappers.engine import DEFAULT_SESSION_TABS, get_engine
+from scrappers.esky_scraper import flight_search_task
+from utils.airports import get_airport_code
+from utils.analytics import get_price_calendar
+from utils.data_processing import normalize_offer_prices
+from utils.database import save_fetched_flights
+
+CHEAPEST_CELLS = 5
+
+
+def _shift(date, days):
+    day = datetime.strptime(date, "%Y-%m-%d").date()
+    return (day + timedelta(days=days)).isoformat()
+
+
+def date_window(date, days):
+    return [_shift(date, offset) for offset in range(-days, days + 1)]
+
+
+def calendar_cells(departure_date, return_date=None, days=3):
+    # Every departure/return pair in the window, one-way when no return date
+    departures = date_window(departure_date, days)
+    if not return_date:
+        return [(departure, "") for departure in departures]
+    return [
+        (departure, back)
+        for departure in departures
+        for back in date_window(return_date, days)
+        if back >= departure
+    ]
+
+
+def _cheapest(items):
+    priced = [
+        (amount, currency, offer)
+        for offer, amount, currency in normalize_offer_prices(items)
+        if amount is not None
+    ]
+    return min(priced, key=lambda cell: cell[0], default=(None, None, None))
+
+
+def _freshness(age):
+    if age is None:
+        return "live"
+    if age < 60:
+        return f"{age:.0f}s old"
+    if age < 3600:
+        return f"{age / 60:.0f}m old"
+    return f"{age / 3600:.1f}h old"
+
+
+def flexible_search(
+    departure_city,
+    destination_city,
+    departure_date,
+    return_date=None,
+    days=3,
+    seats=1,
+    tabs=DEFAULT_SESSION_TABS,
+):
+    departure_code = get_airport_code(departure_city)
+    destination_code = get_airport_code(destination_city)
+    cells = calendar_cells(departure_date, return_date, days)
+    print(
+        f"\nSearching {len(cells)} date combinations {departure_code} -> "
+        f"{destination_code} around {departure_date}..."
+    )
+
+    tasks = []
+    for departure, back in cells:
+        task = flight_search_task(
+            departure_code, destination_code, departure, back, seats
+        )
+        # Every fetched cell is saved by the engine, cached ones already were
+        task.on_fetched = partial(
+            save_fetched_flights,
+            {
+                "departure_city": departure_city,
+                "departure_code": departure_code,
+                "destination_city": destination_city,
+                "destination_code": destination_code,
+                "departure_date": departure,
+                "return_date": back,
+                "seats": seats,
+            },
+        )
+        tasks.append(task)
+    started = time.perf_counter()
+    results = get_engine().run_many_in_session(tasks, tabs)
+    elapsed = time.perf_counter() - started
+
+    # Cells that failed now fall back to the last price the database has
+    stored = get_price_calendar(
+        departure_code, destination_code, cells[0][0], cells[-1][0], seats
+    )
+    now = datetime.now()
+    rows = []
+    for (departure, back), result in zip(cells, results):
+        price, currency, offer = _cheapest(result.items if result.ok else [])
+        age = result.age if result.cached else None
+        source = "cache" if result.cached else "live"
+        if price is None and (departure, back) in stored:
+            known = stored[(departure, back)]
+            price, currency = known["last_price"], known["currency"]
+            searched = datetime.strptime(known["last_search_date"], "%Y-%m-%d %H:%M:%S")
+            age = (now - searched).total_seconds()
+            source = "database"
+        elif price is None:
+            source = None
+        rows.append(
+            {
+                "departure_date": departure,
+                "return_date": back or "One-way",
+                "price": price,
+                "currency": currency,
+                "carrier": (offer or {}).get("carrier"),
+                "offers": len(result.items) if result.ok else 0,
+                "source": source,
+                "age_seconds": age or 0.0,
+                "freshness": _freshness(age) if source else "-",
+            }
+        )
+
+    cells_df = pd.DataFrame(rows)
+    matrix = cells_df.pivot(
+        index="departure_date", columns="return_date", values="price"
+    )
+    cheapest = (
+        cells_df.dropna(subset=["price"])
+        .sort_values(["price", "departure_date"])
+        .head(CHEAPEST_CELLS)
+    )
+
+    fetched = sum(1 for result in results if result.ok and not result.cached)
+    print(
+        f"{len(cells)} cells in {elapsed:.1f}s ({fetched} fetched, "
+        f"{sum(1 for result in results if result.cached)} from cache, "
+        f"{sum(1 for result in results if not result.ok)} failed)"
+    )
+
+    return {"matrix": matrix, "cells": cells_df, "cheapest": cheapest}
+
+
+def display_price_calendar(calendar):
+    matrix = calendar["matrix"]
+    if calendar["cheapest"].empty:
+        print("No prices found for any date combination.")
+        return
+
+    currency = calendar["cheapest"].iloc[0]["currency"]
+    print(f"\nPrice calendar ({currency}, rows: departure, columns: return):")
+    print(matrix.to_string(na_rep="-", float_format=lambda x: f"{x:,.0f}"))
+
+    print("\nCheapest dates:")
+    columns = ["departure_date", "return_date", "price", "currency", "freshness"]
+    print(calendar["cheapest"][columns].to_string(index=False))
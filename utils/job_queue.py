@@ -0,0 +1,300 @@
+import json
+import sqlite3
+import time
+
+from scrappers.rate_limit import backoff_delay
+from utils.analytics import route_key
+from utils.db_connection import get_connection
+from utils.migrations import normalize_city
+
+JOB_KINDS = ("flights", "events")
+STATUSES = ("queued", "running", "done", "failed")
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY = 30.0
+RETRY_MAX_DELAY = 15 * 60.0
+
+# Jobs are leased rather than locked: a worker owns a running job until
+# lease_expires and keeps extending it while the search runs. A worker that
+# dies stops renewing, and the next claim puts its jobs back in the queue.
+# Every update a worker makes is conditional on it still holding the lease,
+# so a worker that stalled past its lease cannot overwrite the new owner.
+
+
+def _dedupe_key(kind, params):
+    # Built from what the search actually fetches, so "Riga" and "riga" or a
+    # missing and an empty return date are the same pending job
+    if kind == "flights":
+        fields = route_key(
+            params["departure_code"],
+            params["destination_code"],
+            params["departure_date"],
+            params.get("return_date"),
+            params.get("seats"),
+        )
+    else:
+        fields = (
+            normalize_city(params["city"]),
+            params["start_date"],
+            params.get("end_date") or "",
+        )
+    return kind + ":" + json.dumps(fields, ensure_ascii=False)
+
+
+def submit_job(kind, params, priority=0, max_attempts=MAX_ATTEMPTS):
+    # Returns (job id, created). Submitting a search that is already waiting
+    # or running returns the pending job instead of queueing a second one.
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind {kind!r}")
+
+    key = _dedupe_key(kind, params)
+    conn = get_connection()
+    while True:
+        with conn:
+            cursor = conn.execute(
+                """
+                INSERT OR IGNORE INTO scrape_jobs
+                (kind, params, dedupe_key, priority, max_attempts, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (kind, json.dumps(params), key, priority, max_attempts, time.time()),
+            )
+            if cursor.rowcount:
+                return cursor.lastrowid, True
+
+            row = conn.execute(
+                "SELECT id FROM scrape_jobs WHERE dedupe_key = ? "
+                "AND status IN ('queued', 'running')",
+                (key,),
+            ).fetchone()
+        if row:
+            return row[0], False
+        # The pending job finished between the insert and the lookup, the
+        # next insert goes through
+
+
+def _requeue_expired(cursor, now):
+    cursor.execute(
+        """
+        UPDATE scrape_jobs SET
+            status = CASE WHEN attempts >= max_attempts
+                THEN 'failed' ELSE 'queued' END,
+            error = 'Lease expired, worker ' || lease_owner || ' stopped renewing',
+            lease_owner = NULL,
+            lease_expires = NULL
+        WHERE status = 'running' AND lease_expires < ?
+        """,
+        (now,),
+    )
+    return cursor.rowcount
+
+
+def claim_jobs(worker_id, limit, lease_seconds=LEASE_SECONDS):
+    # BEGIN IMMEDIATE takes the write lock before reading, so two workers
+    # can never pick the same queued rows
+    if limit <= 0:
+        return []
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    now = time.time()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        expired = _requeue_expired(cursor, now)
+        cursor.execute(
+            """
+            UPDATE scrape_jobs SET
+                status = 'running',
+                attempts = attempts + 1,
+                lease_owner = ?,
+                lease_expires = ?,
+                started_at = ?
+            WHERE id IN (
+                SELECT id FROM scrape_jobs
+                WHERE status = 'queued' AND run_after <= ?
+                ORDER BY priority DESC, id
+                LIMIT ?
+            )
+            RETURNING id, kind, params, attempts, max_attempts
+            """,
+            (worker_id, now + lease_seconds, now, now, limit),
+        )
+        jobs = [dict(row) for row in cursor.fetchall()]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    if expired:
+        print(f"Requeued {expired} jobs with expired leases")
+    for job in jobs:
+        job["params"] = json.loads(job["params"])
+    return sorted(jobs, key=lambda job: job["id"])
+
+
+def renew_leases(worker_id, job_ids, lease_seconds=LEASE_SECONDS):
+    # Returns the ids this worker still holds
+    if not job_ids:
+        return set()
+
+    conn = get_connection()
+    with conn:
+        rows = conn.execute(
+            f"""
+            UPDATE scrape_jobs SET lease_expires = ?
+            WHERE lease_owner = ? AND status = 'running'
+                AND id IN ({", ".join("?" * len(job_ids))})
+            RETURNING id
+            """,
+            (time.time() + lease_seconds, worker_id, *job_ids),
+        ).fetchall()
+    return {job_id for (job_id,) in rows}
+
+
+def complete_job(job_id, worker_id, rows, duration):
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(
+            """
+            UPDATE scrape_jobs SET
+                status = 'done',
+                finished_at = ?,
+                duration = ?,
+                rows = ?,
+                error = NULL,
+                lease_owner = NULL,
+                lease_expires = NULL
+            WHERE id = ? AND lease_owner = ? AND status = 'running'
+            """,
+            (time.time(), duration, rows, job_id, worker_id),
+        )
+    return cursor.rowcount == 1
+
+
+def fail_job(job_id, worker_id, error, duration, retry=True):
+    # Back in the queue after a growing delay until max_attempts is reached
+    conn = get_connection()
+    now = time.time()
+    with conn:
+        row = conn.execute(
+            "SELECT attempts FROM scrape_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        delay = backoff_delay(row[0] if row else 0, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+        cursor = conn.execute(
+            """
+            UPDATE scrape_jobs SET
+                status = CASE WHEN ? AND attempts < max_attempts
+                    THEN 'queued' ELSE 'failed' END,
+                run_after = ?,
+                finished_at = ?,
+                duration = ?,
+                error = ?,
+                lease_owner = NULL,
+                lease_expires = NULL
+            WHERE id = ? AND lease_owner = ? AND status = 'running'
+            """,
+            (retry, now + delay, now, duration, error, job_id, worker_id),
+        )
+    return cursor.rowcount == 1
+
+
+def release_jobs(worker_id):
+    # A worker shutting down hands its unfinished jobs back without
+    # counting the interrupted attempt
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(
+            """
+            UPDATE scrape_jobs SET
+                status = 'queued',
+                attempts = MAX(attempts - 1, 0),
+                lease_owner = NULL,
+                lease_expires = NULL
+            WHERE lease_owner = ? AND status = 'running'
+            """,
+            (worker_id,),
+        )
+    return cursor.rowcount
+
+
+def get_queue_status(limit=10):
+    conn = get_connection()
+    now = time.time()
+    counts = dict(
+        conn.execute("SELECT status, COUNT(*) FROM scrape_jobs GROUP BY status")
+    )
+    oldest, workers = conn.execute("""
+        SELECT
+            (SELECT MIN(created_at) FROM scrape_jobs WHERE status = 'queued'),
+            (SELECT COUNT(DISTINCT lease_owner) FROM scrape_jobs
+                WHERE status = 'running')
+    """).fetchone()
+    average = conn.execute("""
+        SELECT AVG(duration) FROM (
+            SELECT duration FROM scrape_jobs WHERE status = 'done'
+            ORDER BY id DESC LIMIT 100
+        )
+    """).fetchone()[0]
+
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute(
+        """
+        SELECT id, kind, params, status, attempts, max_attempts, lease_owner,
+            created_at, duration, rows, error
+        FROM scrape_jobs ORDER BY id DESC LIMIT ?
+        """,
+        (limit,),
+    )
+    return {
+        "counts": {status: counts.get(status, 0) for status in STATUSES},
+        "oldest_queued_seconds": now - oldest if oldest else None,
+        "workers": workers,
+        "average_duration": average,
+        "recent": [dict(row) for row in cursor.fetchall()],
+    }
+
+
+def describe_job(job):
+    params = job["params"]
+    if isinstance(params, str):
+        params = json.loads(params)
+    if job["kind"] == "flights":
+        trip = params["departure_date"]
+        if params.get("return_date"):
+            trip += f" - {params['return_date']}"
+        return (
+            f"{params['departure_code']} -> {params['destination_code']} {trip}, "
+            f"{params['seats']} seats"
+        )
+    window = params["start_date"]
+    if params.get("end_date"):
+        window += f" - {params['end_date']}"
+    return f"events in {params['city']} {window}"
+
+
+def display_queue_status(status):
+    counts = status["counts"]
+    print(", ".join(f"{count} {name}" for name, count in counts.items()))
+    if status["oldest_queued_seconds"] is not None:
+        print(f"Oldest queued job waiting {status['oldest_queued_seconds']:.0f}s")
+    if status["workers"]:
+        print(f"{status['workers']} workers running jobs")
+    if status["average_duration"] is not None:
+        print(f"Average job duration {status['average_duration']:.1f}s")
+
+    for job in status["recent"]:
+        line = (
+            f"#{job['id']:<5} {job['status']:<8} "
+            f"{job['attempts']}/{job['max_attempts']}  {describe_job(job)}"
+        )
+        if job["duration"] is not None:
+            line += f"  {job['duration']:.1f}s"
+        if job["rows"] is not None:
+            line += f"  {job['rows']} rows"
+        if job["status"] == "running":
+            line += f"  on {job['lease_owner']}"
+        elif job["error"]:
+            line += f"  ({job['error']})"
+        print(line)
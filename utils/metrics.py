@@ -0,0 +1,322 @@
+import functools
+import inspect
+import json
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Directory for the per-run JSON summary and the Prometheus text file,
+# instrumentation is off unless this or main.py --metrics is set
+METRICS_ENV = "TRAVEL_PLANNER_METRICS"
+PROMETHEUS_FILE = "travel_planner.prom"
+PREFIX = "travel_planner"
+# Upper bounds in seconds, from a parser call to a whole Eventbrite crawl
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Spans and counters are keyed by (name, sorted label pairs). While disabled
+# every call returns after a single attribute check, so the hooks stay in
+# the hot paths permanently.
+
+
+class _Span:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+    def merge(self, data):
+        self.count += data["count"]
+        self.total += data["total"]
+        self.max = max(self.max, data["max"])
+        self.buckets = [a + b for a, b in zip(self.buckets, data["buckets"])]
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "max": self.max,
+            "buckets": list(self.buckets),
+        }
+
+
+class Metrics:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.spans = {}
+            self.counters = {}
+            self.started = time.time()
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            span = self.spans.get(key)
+            if span is None:
+                span = self.spans[key] = _Span()
+            span.add(seconds)
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def span(self, name, **labels):
+        if not self.enabled:
+            return _NOOP_SPAN
+        return self._timed_span(name, labels)
+
+    @contextmanager
+    def _timed_span(self, name, labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self, reset=False):
+        # Picklable copy, for handing a worker process's numbers to its parent
+        with self._lock:
+            data = {
+                "spans": [
+                    (name, labels, span.as_dict())
+                    for (name, labels), span in self.spans.items()
+                ],
+                "counters": [
+                    (name, labels, value)
+                    for (name, labels), value in self.counters.items()
+                ],
+            }
+            if reset:
+                self.spans = {}
+                self.counters = {}
+        return data
+
+    def merge(self, data):
+        if not data:
+            return
+        with self._lock:
+            for name, labels, values in data["spans"]:
+                key = (name, tuple(labels))
+                span = self.spans.get(key)
+                if span is None:
+                    span = self.spans[key] = _Span()
+                span.merge(values)
+            for name, labels, value in data["counters"]:
+                key = (name, tuple(labels))
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def summary(self, **extra):
+        data = self.snapshot()
+        spans = {}
+        for name, labels, values in sorted(data["spans"]):
+            spans[_series(name, labels)] = {
+                "count": values["count"],
+                "total_seconds": round(values["total"], 6),
+                "mean_seconds": round(values["total"] / values["count"], 6),
+                "max_seconds": round(values["max"], 6),
+                "p50_seconds": _quantile(values, 0.5),
+                "p95_seconds": _quantile(values, 0.95),
+            }
+        return {
+            **extra,
+            "started": datetime.fromtimestamp(self.started).isoformat(
+                timespec="seconds"
+            ),
+            "elapsed_seconds": round(time.time() - self.started, 3),
+            "spans": spans,
+            "counters": {
+                _series(name, labels): value
+                for name, labels, value in sorted(data["counters"])
+            },
+        }
+
+    def prometheus(self):
+        data = self.snapshot()
+        lines = [
+            f"# HELP {PREFIX}_span_seconds Time spent in instrumented code",
+            f"# TYPE {PREFIX}_span_seconds histogram",
+        ]
+        for name, labels, values in sorted(data["spans"]):
+            labels = (("span", name),) + labels
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), values["buckets"]):
+                cumulative += count
+                lines.append(
+                    f"{PREFIX}_span_seconds_bucket"
+                    f"{_labels(labels + (('le', str(bound)),))} {cumulative}"
+                )
+            lines.append(
+                f"{PREFIX}_span_seconds_sum{_labels(labels)} {values['total']}"
+            )
+            lines.append(
+                f"{PREFIX}_span_seconds_count{_labels(labels)} {values['count']}"
+            )
+
+        names = sorted({name for name, _, _ in data["counters"]})
+        for name in names:
+            metric = f"{PREFIX}_{_metric_name(name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for counter, labels, value in sorted(data["counters"]):
+                if counter == name:
+                    lines.append(f"{metric}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+metrics = Metrics(enabled=bool(os.environ.get(METRICS_ENV)))
+
+
+def _series(name, labels):
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{key}={value}" for key, value in labels) + "}"
+
+
+def _metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _quantile(values, q):
+    # Upper bound of the bucket holding the quantile, the largest value seen
+    # when it falls past the last bound
+    rank = q * values["count"]
+    seen = 0
+    for bound, count in zip(BUCKETS, values["buckets"]):
+        seen += count
+        if seen >= rank:
+            return round(min(bound, values["max"]), 6)
+    return round(values["max"], 6)
+
+
+def span(name, **labels):
+    return metrics.span(name, **labels)
+
+
+def timed(name):
+    # Times every call of the decorated function, sync or async
+    def decorate(function):
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                if not metrics.enabled:
+                    return await function(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    metrics.observe(name, time.perf_counter() - started)
+
+        else:
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not metrics.enabled:
+                    return function(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    metrics.observe(name, time.perf_counter() - started)
+
+        return wrapper
+
+    return decorate
+
+
+def enable_metrics(enabled=True):
+    metrics.enabled = enabled
+    if enabled:
+        metrics.reset()
+
+
+def metrics_dir():
+    return os.environ.get(METRICS_ENV) or None
+
+
+def _write_atomic(path, text):
+    # The node exporter textfile collector must never see a half-written file
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        f.write(text)
+    os.replace(temporary, path)
+
+
+def write_metrics(directory, command=None):
+    # Prometheus text file (overwritten every run) plus a JSON summary per run
+    os.makedirs(directory, exist_ok=True)
+    _write_atomic(os.path.join(directory, PROMETHEUS_FILE), metrics.prometheus())
+    stamp = datetime.fromtimestamp(metrics.started).strftime("%Y%m%d-%H%M%S")
+    summary_path = os.path.join(
+        directory, f"run-{stamp}-{command or 'search'}-{os.getpid()}.json"
+    )
+    _write_atomic(
+        summary_path, json.dumps(metrics.summary(command=command), indent=2) + "\n"
+    )
+    return summary_path
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    # /metrics endpoint for long-running commands such as the worker
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(
+        target=server.serve_forever, name="metrics-http", daemon=True
+    ).start()
+    return server
@@ -0,0 +1,462 @@
+import sqlite3
+import sys
+
+
+def normalize_city(city):
+    return " ".join(city.split()).casefold() if city else ""
+
+
+def prefix_bounds(prefix):
+    # [prefix, prefix + max char) lets an index range scan replace LIKE 'x%'
+    prefix = normalize_city(prefix)
+    return prefix, prefix + "\U0010ffff"
+
+
+def _create_base_tables(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS flight_tickets (
+        id INTEGER PRIMARY KEY,
+        departure_city TEXT,
+        departure_code TEXT,
+        destination_city TEXT,
+        destination_code TEXT,
+        departure_date TEXT,
+        return_date TEXT,
+        price REAL,
+        currency TEXT,
+        seats INTEGER,
+        search_date TEXT
+    )
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY,
+        city TEXT,
+        event_id TEXT,
+        title TEXT,
+        datetime TEXT,
+        location TEXT,
+        price TEXT,
+        url TEXT,
+        search_date TEXT
+    )
+    """)
+
+
+def _add_unique_keys(cursor):
+    # Older databases have duplicates from rescrapes, drop them before the
+    # unique keys go on
+    cursor.execute("""
+    DELETE FROM events
+    WHERE event_id IS NOT NULL AND id NOT IN (
+        SELECT MAX(id) FROM events WHERE event_id IS NOT NULL GROUP BY city, event_id
+    )
+    """)
+    cursor.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS events_city_event_id
+    ON events (city, event_id)
+    """)
+
+    cursor.execute("""
+    DELETE FROM flight_tickets
+    WHERE id NOT IN (
+        SELECT MIN(id) FROM flight_tickets
+        GROUP BY departure_code, destination_code, departure_date, return_date,
+            seats, price, currency, search_date
+    )
+    """)
+    cursor.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS flight_tickets_observation
+    ON flight_tickets (
+        departure_code, destination_code, departure_date, return_date,
+        seats, price, currency, search_date
+    )
+    """)
+
+
+def _add_city_indexes(cursor):
+    cursor.execute("ALTER TABLE flight_tickets ADD COLUMN departure_city_norm TEXT")
+    cursor.execute("ALTER TABLE flight_tickets ADD COLUMN destination_city_norm TEXT")
+    cursor.execute("ALTER TABLE events ADD COLUMN city_norm TEXT")
+
+    cursor.execute("""
+    UPDATE flight_tickets SET
+        departure_city_norm = normalize_city(departure_city),
+        destination_city_norm = normalize_city(destination_city)
+    """)
+    cursor.execute("UPDATE events SET city_norm = normalize_city(city)")
+
+    # "New york" and "New York" are the same city for event de-duplication
+    cursor.execute("DROP INDEX events_city_event_id")
+    cursor.execute("""
+    DELETE FROM events
+    WHERE event_id IS NOT NULL AND id NOT IN (
+        SELECT MAX(id) FROM events WHERE event_id IS NOT NULL
+        GROUP BY city_norm, event_id
+    )
+    """)
+    cursor.execute("""
+    CREATE UNIQUE INDEX events_city_norm_event_id ON events (city_norm, event_id)
+    """)
+
+    # Filters on a city prefix, newest searches first, cheapest first
+    cursor.execute("""
+    CREATE INDEX flight_tickets_destination_search
+    ON flight_tickets (destination_city_norm, search_date DESC, price)
+    """)
+    cursor.execute("""
+    CREATE INDEX flight_tickets_departure_search
+    ON flight_tickets (departure_city_norm, search_date DESC, price)
+    """)
+    # Unfiltered listing and delete_old_data cut-offs
+    cursor.execute("""
+    CREATE INDEX flight_tickets_search
+    ON flight_tickets (search_date DESC, price)
+    """)
+
+    cursor.execute("""
+    CREATE INDEX events_city_search ON events (city_norm, search_date DESC)
+    """)
+    cursor.execute("CREATE INDEX events_search ON events (search_date DESC)")
+
+
+def _retired(cursor):
+    # Keeps the version number of a step removed before it was released
+    pass
+
+
+def _add_search_cache(cursor):
+    cursor.execute("""
+    CREATE TABLE search_cache (
+        cache_key TEXT PRIMARY KEY,
+        site TEXT NOT NULL,
+        url TEXT,
+        items TEXT NOT NULL,
+        fetched_at REAL NOT NULL
+    )
+    """)
+    cursor.execute("CREATE INDEX search_cache_fetched ON search_cache (fetched_at)")
+
+
+def _add_price_columns(cursor):
+    # Filled in chunks by utils.database.backfill_prices after the migration
+    cursor.execute("ALTER TABLE events ADD COLUMN price_amount REAL")
+    cursor.execute("ALTER TABLE events ADD COLUMN price_currency TEXT")
+
+
+def _add_price_summaries(cursor):
+    # Maintained by utils.analytics on every save_flight_prices call
+    route = """
+        departure_code TEXT NOT NULL,
+        destination_code TEXT NOT NULL,
+        departure_date TEXT NOT NULL,
+        return_date TEXT NOT NULL,
+        seats INTEGER NOT NULL,
+        currency TEXT NOT NULL,
+    """
+    cursor.execute(f"""
+    CREATE TABLE route_price_daily (
+        {route}
+        search_day TEXT NOT NULL,
+        min_price REAL NOT NULL,
+        max_price REAL NOT NULL,
+        total_price REAL NOT NULL,
+        observations INTEGER NOT NULL,
+        median_price REAL,
+        PRIMARY KEY (
+            departure_code, destination_code, departure_date, return_date, seats,
+            currency, search_day
+        )
+    ) WITHOUT ROWID
+    """)
+    cursor.execute(f"""
+    CREATE TABLE route_price_latest (
+        {route}
+        last_price REAL NOT NULL,
+        last_search_date TEXT NOT NULL,
+        lowest_price REAL NOT NULL,
+        lowest_search_date TEXT NOT NULL,
+        PRIMARY KEY (
+            departure_code, destination_code, departure_date, return_date, seats,
+            currency
+        )
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+    CREATE INDEX route_price_latest_search
+    ON route_price_latest (last_search_date DESC, last_price)
+    """)
+    cursor.execute(f"""
+    CREATE TABLE price_alerts (
+        id INTEGER PRIMARY KEY,
+        {route}
+        previous_price REAL NOT NULL,
+        price REAL NOT NULL,
+        drop_ratio REAL NOT NULL,
+        search_date TEXT NOT NULL
+    )
+    """)
+    cursor.execute("CREATE INDEX price_alerts_search ON price_alerts (search_date)")
+
+
+def _add_flight_details(cursor):
+    # Filled from the eSky search API, NULL for rows read from the page
+    cursor.execute("ALTER TABLE flight_tickets ADD COLUMN carrier TEXT")
+    cursor.execute("ALTER TABLE flight_tickets ADD COLUMN departure_time TEXT")
+    cursor.execute("ALTER TABLE flight_tickets ADD COLUMN arrival_time TEXT")
+    cursor.execute("ALTER TABLE flight_tickets ADD COLUMN stops INTEGER")
+    cursor.execute("ALTER TABLE flight_tickets ADD COLUMN duration_minutes INTEGER")
+
+    # Two offers at the same price are different flights now
+    cursor.execute("DROP INDEX flight_tickets_observation")
+    cursor.execute("""
+    CREATE UNIQUE INDEX flight_tickets_observation
+    ON flight_tickets (
+        departure_code, destination_code, departure_date, return_date,
+        seats, price, currency, search_date,
+        COALESCE(carrier, ''), COALESCE(departure_time, '')
+    )
+    """)
+
+
+def _add_job_queue(cursor):
+    # Worked off by utils.worker, see utils.job_queue for the lease protocol
+    cursor.execute("""
+    CREATE TABLE scrape_jobs (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        params TEXT NOT NULL,
+        dedupe_key TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        priority INTEGER NOT NULL DEFAULT 0,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        run_after REAL NOT NULL DEFAULT 0,
+        lease_owner TEXT,
+        lease_expires REAL,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        duration REAL,
+        rows INTEGER,
+        error TEXT
+    )
+    """)
+    cursor.execute("""
+    CREATE INDEX scrape_jobs_queue ON scrape_jobs (status, priority DESC, id)
+    """)
+    cursor.execute("""
+    CREATE INDEX scrape_jobs_lease ON scrape_jobs (status, lease_expires)
+    """)
+    # The same search cannot be waiting or running twice
+    cursor.execute("""
+    CREATE UNIQUE INDEX scrape_jobs_pending ON scrape_jobs (dedupe_key)
+    WHERE status IN ('queued', 'running')
+    """)
+
+
+def _add_monitoring(cursor):
+    # Written by utils.monitor on every scheduling pass
+    cursor.execute("""
+    CREATE TABLE route_freshness (
+        departure_code TEXT NOT NULL,
+        destination_code TEXT NOT NULL,
+        departure_date TEXT NOT NULL,
+        return_date TEXT NOT NULL,
+        seats INTEGER NOT NULL,
+        departure_city TEXT,
+        destination_city TEXT,
+        last_search_date TEXT,
+        age_hours REAL,
+        target_hours REAL,
+        volatility REAL,
+        stable_streak INTEGER NOT NULL DEFAULT 0,
+        priority REAL,
+        last_scheduled TEXT,
+        updated_at TEXT NOT NULL,
+        PRIMARY KEY (
+            departure_code, destination_code, departure_date, return_date, seats
+        )
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+    CREATE INDEX route_freshness_priority ON route_freshness (priority DESC)
+    """)
+    cursor.execute("""
+    CREATE TABLE scrape_budget (
+        hour TEXT PRIMARY KEY,
+        budget INTEGER NOT NULL,
+        used INTEGER NOT NULL DEFAULT 0,
+        due INTEGER NOT NULL DEFAULT 0,
+        skipped_stable INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """)
+
+
+def _add_route_day_index(cursor):
+    # One-way trips, default seats and unknown currencies are stored as "", 1
+    # and "" like in the summary tables, so lookups compare the raw columns.
+    # OR REPLACE drops rows that become duplicates of an existing observation.
+    cursor.execute(
+        "UPDATE OR REPLACE flight_tickets SET return_date = '' "
+        "WHERE return_date IS NULL"
+    )
+    cursor.execute("UPDATE OR REPLACE flight_tickets SET seats = 1 WHERE seats IS NULL")
+    cursor.execute(
+        "UPDATE OR REPLACE flight_tickets SET currency = '' WHERE currency IS NULL"
+    )
+    # The observation index has price before currency and search_date, so a
+    # route/day lookup there scans every search of the route
+    cursor.execute("""
+    CREATE INDEX flight_tickets_route_day
+    ON flight_tickets (
+        departure_code, destination_code, departure_date, return_date,
+        seats, currency, search_date
+    )
+    """)
+
+
+def _drop_event_search(cursor):
+    # Nothing searched it, yet every event rescrape rewrote its rows
+    for trigger in ("events_fts_insert", "events_fts_delete", "events_fts_update"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("DROP TABLE IF EXISTS events_fts")
+
+
+# Append only: (version, description, function). Never edit a released step.
+MIGRATIONS = [
+    (1, "base tables", _create_base_tables),
+    (2, "unique observation keys", _add_unique_keys),
+    (3, "normalized city columns and indexes", _add_city_indexes),
+    (4, "full text search on events (removed, see 12)", _retired),
+    (5, "persistent search result cache", _add_search_cache),
+    (6, "numeric event prices", _add_price_columns),
+    (7, "route price summaries and alerts", _add_price_summaries),
+    (8, "carrier, times, stops and duration on flights", _add_flight_details),
+    (9, "scrape job queue", _add_job_queue),
+    (10, "route freshness and scrape budget", _add_monitoring),
+    (11, "route/day price lookup index", _add_route_day_index),
+    (12, "drop event full text search", _drop_event_search),
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    conn.create_function("normalize_city", 1, normalize_city, deterministic=True)
+    current = schema_version(conn)
+    applied = []
+
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            # Another process may have migrated while we waited for the lock
+            if schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            step(cursor)
+            cursor.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(description)
+
+    return applied
+
+
+def explain_query_plan(conn, query, params=()):
+    return [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+
+
+# The hot read paths and the index each one has to use
+PLAN_CHECKS = [
+    (
+        "SELECT * FROM flight_tickets WHERE destination_city_norm >= ? "
+        "AND destination_city_norm < ? ORDER BY search_date DESC, price ASC LIMIT 10",
+        prefix_bounds("new york"),
+        "flight_tickets_destination_search",
+    ),
+    (
+        "SELECT * FROM flight_tickets WHERE departure_city_norm >= ? "
+        "AND departure_city_norm < ? ORDER BY search_date DESC, price ASC LIMIT 10",
+        prefix_bounds("riga"),
+        "flight_tickets_departure_search",
+    ),
+    (
+        "SELECT * FROM flight_tickets ORDER BY search_date DESC, price ASC LIMIT 10",
+        (),
+        "flight_tickets_search",
+    ),
+    (
+        "DELETE FROM flight_tickets WHERE search_date < ?",
+        ("2025-01-01",),
+        "flight_tickets_search",
+    ),
+    (
+        "SELECT * FROM events WHERE city_norm >= ? AND city_norm < ? "
+        "ORDER BY search_date DESC LIMIT 10",
+        prefix_bounds("new york"),
+        "USING INDEX events_city",
+    ),
+    (
+        "SELECT * FROM events WHERE city_norm = ? ORDER BY search_date DESC LIMIT 10",
+        ("new york",),
+        "events_city_search",
+    ),
+    (
+        "DELETE FROM events WHERE search_date < ?",
+        ("2025-01-01",),
+        "events_search",
+    ),
+    (
+        "SELECT price FROM flight_tickets WHERE departure_code = ? "
+        "AND destination_code = ? AND departure_date = ? AND return_date = ? "
+        "AND seats = ? AND currency = ? AND search_date >= ? AND search_date < ?",
+        ("RIX", "JFK", "2025-05-01", "", 1, "EUR", "2025-04-01", "2025-04-02"),
+        "flight_tickets_route_day (departure_code=? AND destination_code=? "
+        "AND departure_date=? AND return_date=? AND seats=? AND currency=? "
+        "AND search_date>? AND search_date<?)",
+    ),
+    (
+        "SELECT id FROM scrape_jobs WHERE status = 'queued' AND run_after <= ? "
+        "ORDER BY priority DESC, id LIMIT ?",
+        (0, 4),
+        "scrape_jobs_queue",
+    ),
+    (
+        "SELECT id FROM scrape_jobs WHERE status = 'running' AND lease_expires < ?",
+        (0,),
+        "scrape_jobs_lease",
+    ),
+]
+
+
+def check_query_plans(conn):
+    failures = []
+    for query, params, expected in PLAN_CHECKS:
+        plan = explain_query_plan(conn, query, params)
+        if not any(expected in step for step in plan):
+            failures.append((query, plan))
+    return failures
+
+
+if __name__ == "__main__":
+    # python -m utils.migrations [db_file]  migrates and verifies query plans
+    conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else ":memory:")
+    for description in migrate(conn):
+        print(f"Applied: {description}")
+    print(f"Schema version {schema_version(conn)}")
+
+    failures = check_query_plans(conn)
+    if not failures:
+        print("All query plans use their indexes")
+    for query, plan in failures:
+        print(f"Query does not use its index:\n  {query}\n  {plan}")
+    sys.exit(1 if failures else 0)
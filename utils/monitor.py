@@ -0,0 +1,339 @@
+import math
+import sqlite3
+import statistics
+import time
+from datetime import datetime
+from functools import partial
+from itertools import groupby
+
+from scrappers.engine import get_engine
+from scrappers.esky_scraper import flight_search_task
+from utils.database import initialize_db, save_fetched_flights
+from utils.db_connection import get_connection
+from utils.job_queue import submit_job
+
+HOURLY_BUDGET = 60
+# Hours a route's price may age before a re-scrape, by days left to departure
+FRESHNESS_TARGETS = [(3, 1.0), (14, 3.0), (60, 12.0), (None, 24.0)]
+HISTORY_SEARCHES = 10
+# A coefficient of variation of 0.1 across recent searches halves the target
+VOLATILITY_WEIGHT = 10.0
+# Searches that moved the price less than this count towards the stable
+# streak, each one doubles the target up to MAX_STABLE_DOUBLINGS times
+STABLE_CHANGE = 0.02
+MAX_STABLE_DOUBLINGS = 3
+MAX_JOB_PRIORITY = 10
+# A scheduled route that has no newer search yet is left alone this long
+PENDING_HOURS = 1.0
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _target_hours(days_left):
+    for limit, hours in FRESHNESS_TARGETS:
+        if limit is None or days_left <= limit:
+            return hours
+
+
+def load_route_history(conn, today):
+    # Cheapest price of each of the last HISTORY_SEARCHES searches for every
+    # route that has not departed yet, newest first
+    rows = conn.execute(
+        """
+        SELECT departure_code, destination_code, departure_date,
+            COALESCE(return_date, ''), COALESCE(seats, 1), search_date,
+            MIN(price), MAX(departure_city), MAX(destination_city)
+        FROM flight_tickets
+        WHERE departure_date >= ? AND price IS NOT NULL
+        GROUP BY 1, 2, 3, 4, 5, 6
+        ORDER BY 1, 2, 3, 4, 5, 6 DESC
+        """,
+        (today,),
+    )
+
+    routes = {}
+    for key, searches in groupby(rows, lambda row: row[:5]):
+        searches = list(searches)[:HISTORY_SEARCHES]
+        routes[key] = {
+            "departure_city": searches[0][7],
+            "destination_city": searches[0][8],
+            "searches": [(row[5], row[6]) for row in searches],
+        }
+    return routes
+
+
+def score_route(key, history, now):
+    searches = history["searches"]
+    prices = [price for _, price in searches]
+    last_search = datetime.strptime(searches[0][0], DATE_FORMAT)
+    departure = datetime.strptime(key[2], "%Y-%m-%d")
+
+    age = (now - last_search).total_seconds() / 3600
+    days_left = max((departure - now).total_seconds() / 86400, 0)
+    mean = statistics.fmean(prices)
+    volatility = statistics.pstdev(prices) / mean if len(prices) > 1 and mean else 0.0
+
+    stable_streak = 0
+    for newer, older in zip(prices, prices[1:]):
+        if not older or abs(newer - older) / older >= STABLE_CHANGE:
+            break
+        stable_streak += 1
+
+    base = _target_hours(days_left) / (1 + VOLATILITY_WEIGHT * volatility)
+    target = base * 2 ** min(stable_streak, MAX_STABLE_DOUBLINGS)
+    return {
+        "key": key,
+        "departure_city": history["departure_city"],
+        "destination_city": history["destination_city"],
+        "last_search_date": searches[0][0],
+        "age_hours": age,
+        "target_hours": target,
+        "volatility": volatility,
+        "stable_streak": stable_streak,
+        # How overdue the route is, anything at 1 or above is due
+        "priority": age / target,
+        # Due on the base target, only held back by a stable price
+        "stable_skip": age < target and age >= base,
+    }
+
+
+def _record_freshness(cursor, scores, scheduled, now):
+    updated_at = now.strftime(DATE_FORMAT)
+    cursor.executemany(
+        """
+        INSERT INTO route_freshness
+        (departure_code, destination_code, departure_date, return_date, seats,
+        departure_city, destination_city, last_search_date, age_hours,
+        target_hours, volatility, stable_streak, priority, last_scheduled,
+        updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT DO UPDATE SET
+            departure_city = excluded.departure_city,
+            destination_city = excluded.destination_city,
+            last_search_date = excluded.last_search_date,
+            age_hours = excluded.age_hours,
+            target_hours = excluded.target_hours,
+            volatility = excluded.volatility,
+            stable_streak = excluded.stable_streak,
+            priority = excluded.priority,
+            last_scheduled = COALESCE(excluded.last_scheduled, last_scheduled),
+            updated_at = excluded.updated_at
+        """,
+        [
+            (
+                *score["key"],
+                score["departure_city"],
+                score["destination_city"],
+                score["last_search_date"],
+                score["age_hours"],
+                score["target_hours"],
+                score["volatility"],
+                score["stable_streak"],
+                score["priority"],
+                updated_at if score["key"] in scheduled else None,
+                updated_at,
+            )
+            for score in scores
+        ],
+    )
+    cursor.execute(
+        "DELETE FROM route_freshness WHERE departure_date < ?",
+        (now.strftime("%Y-%m-%d"),),
+    )
+
+
+def _budget_left(cursor, hour, budget):
+    cursor.execute(
+        "INSERT OR IGNORE INTO scrape_budget (hour, budget) VALUES (?, ?)",
+        (hour, budget),
+    )
+    cursor.execute("UPDATE scrape_budget SET budget = ? WHERE hour = ?", (budget, hour))
+    used = cursor.execute(
+        "SELECT used FROM scrape_budget WHERE hour = ?", (hour,)
+    ).fetchone()[0]
+    return max(budget - used, 0)
+
+
+def _pending_routes(conn, now):
+    # Scheduled by an earlier pass (queued, or its search failed) and not
+    # searched since
+    since = datetime.fromtimestamp(now.timestamp() - PENDING_HOURS * 3600)
+    rows = conn.execute(
+        """
+        SELECT departure_code, destination_code, departure_date, return_date, seats
+        FROM route_freshness
+        WHERE last_scheduled >= ? AND last_scheduled > last_search_date
+        """,
+        (since.strftime(DATE_FORMAT),),
+    )
+    return set(rows)
+
+
+def plan_checks(budget=HOURLY_BUDGET, now=None):
+    # Scores every upcoming route, records its freshness and reserves this
+    # hour's budget for the most overdue ones. Returns (scheduled, stats).
+    now = now or datetime.now()
+    hour = now.strftime("%Y-%m-%d %H:00")
+    conn = get_connection()
+    scores = [
+        score_route(key, history, now)
+        for key, history in load_route_history(conn, now.strftime("%Y-%m-%d")).items()
+    ]
+    pending = _pending_routes(conn, now)
+    due = sorted(
+        (
+            score
+            for score in scores
+            if score["priority"] >= 1 and score["key"] not in pending
+        ),
+        key=lambda score: score["priority"],
+        reverse=True,
+    )
+    skipped_stable = sum(score["stable_skip"] for score in scores)
+
+    with conn:
+        cursor = conn.cursor()
+        # Reserved up front, so two passes in the same hour share one budget
+        scheduled = due[: _budget_left(cursor, hour, budget)]
+        cursor.execute(
+            """
+            UPDATE scrape_budget SET used = used + ?, due = MAX(due, ?),
+                skipped_stable = MAX(skipped_stable, ?)
+            WHERE hour = ?
+            """,
+            (len(scheduled), len(due), skipped_stable, hour),
+        )
+        _record_freshness(cursor, scores, {score["key"] for score in scheduled}, now)
+
+    stats = {
+        "routes": len(scores),
+        "due": len(due),
+        "scheduled": len(scheduled),
+        "over_budget": len(due) - len(scheduled),
+        "skipped_stable": skipped_stable,
+        "hour": hour,
+    }
+    return scheduled, stats
+
+
+def _query(score):
+    departure_code, destination_code, departure_date, return_date, seats = score["key"]
+    return {
+        "departure_city": score["departure_city"],
+        "departure_code": departure_code,
+        "destination_city": score["destination_city"],
+        "destination_code": destination_code,
+        "departure_date": departure_date,
+        "return_date": return_date,
+        "seats": seats,
+    }
+
+
+def _refund_budget(hour, unused):
+    # Fresh cache hits never opened a browser
+    if unused:
+        conn = get_connection()
+        with conn:
+            conn.execute(
+                "UPDATE scrape_budget SET used = MAX(used - ?, 0) WHERE hour = ?",
+                (unused, hour),
+            )
+
+
+def run_monitor(budget=HOURLY_BUDGET, enqueue=False, max_parallel=8):
+    # One scheduling pass, meant to run every few minutes from cron or a loop.
+    # enqueue hands the searches to the job queue workers instead.
+    initialize_db()
+    started = time.perf_counter()
+    scheduled, stats = plan_checks(budget)
+    print(
+        f"{stats['routes']} routes, {stats['due']} due, "
+        f"{stats['scheduled']} scheduled ({stats['over_budget']} over the "
+        f"hourly budget of {budget}), {stats['skipped_stable']} held back as stable"
+    )
+
+    if enqueue:
+        # Most overdue first, in the priority range used by submit --priority
+        for score in scheduled:
+            priority = min(math.ceil(score["priority"]), MAX_JOB_PRIORITY)
+            _, created = submit_job("flights", _query(score), priority=priority)
+            stats["queued"] = stats.get("queued", 0) + created
+        # A search that was already pending does not use the budget twice
+        _refund_budget(stats["hour"], len(scheduled) - stats.get("queued", 0))
+        print(f"Queued {stats.get('queued', 0)} searches")
+        return stats
+
+    tasks = []
+    for score in scheduled:
+        query = _query(score)
+        task = flight_search_task(
+            query["departure_code"],
+            query["destination_code"],
+            query["departure_date"],
+            query["return_date"],
+            query["seats"],
+        )
+        task.params["query"] = query
+        task.on_fetched = partial(save_fetched_flights, query)
+        tasks.append(task)
+
+    stats.update(
+        {"checked": 0, "failed": 0, "cached": 0, "refreshed": 0, "prices_saved": 0}
+    )
+    for result in get_engine().iter_results(tasks, max_parallel=max_parallel):
+        stats["checked"] += 1
+        if result.cached:
+            # A stale hit still loads the page, its refresh saves the prices
+            stats["cached"] += 1
+            stats["refreshed"] += result.refreshing
+            continue
+        if not result.ok or not result.items:
+            stats["failed"] += not result.ok
+            continue
+        stats["prices_saved"] += result.saved["rows"]
+
+    _refund_budget(stats["hour"], stats["cached"] - stats["refreshed"])
+    stats["elapsed"] = time.perf_counter() - started
+    print(
+        f"Checked {stats['checked']} routes in {stats['elapsed']:.1f}s: "
+        f"{stats['failed']} failed, {stats['cached']} from cache "
+        f"({stats['refreshed']} refreshing), "
+        f"{stats['prices_saved']} prices saved"
+    )
+    return stats
+
+
+def get_route_freshness(limit=20):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute(
+        "SELECT * FROM route_freshness ORDER BY priority DESC LIMIT ?", (limit,)
+    )
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def get_budget_usage(hours=24):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute("SELECT * FROM scrape_budget ORDER BY hour DESC LIMIT ?", (hours,))
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def display_monitor_status(limit=20, hours=6):
+    for usage in get_budget_usage(hours):
+        print(
+            f"{usage['hour']}  {usage['used']:>4}/{usage['budget']} searches, "
+            f"{usage['due']} due, {usage['skipped_stable']} held back as stable"
+        )
+    print()
+    for route in get_route_freshness(limit):
+        trip = route["departure_date"]
+        if route["return_date"]:
+            trip += f" - {route['return_date']}"
+        print(
+            f"{route['departure_code']} -> {route['destination_code']} {trip:<23} "
+            f"{route['age_hours']:6.1f}h old, target {route['target_hours']:5.1f}h, "
+            f"volatility {route['volatility']:.1%}, "
+            f"stable x{route['stable_streak']}, priority {route['priority']:.2f}"
+        )
@@ -1,15 +1,82 @@
-import sqlite3
-
+import numpy as np
 import pandas as pd
 
-DB_FILE = "travel_planner.db"
+from utils.db_connection import get_connection
+from utils.metrics import timed
+from utils.migrations import prefix_bounds
 
 
 def connect_to_db():
-    conn = sqlite3.connect(DB_FILE)
-    return conn
+    return get_connection()
+
+
+def format_thousands(values, decimals=2):
+    # Same text as f"{x:,.2f}" for a whole column at once
+    values = np.asarray(values, dtype="float64")
+    plain = np.char.mod(f"%.{decimals}f", values)
+    if values.size == 0:
+        return plain.astype(object)
+
+    digits, point, fraction = np.char.partition(
+        np.char.mod(f"%.{decimals}f", np.abs(values)), "."
+    ).T
+    groups = -(-max(np.char.str_len(digits).max(), 1) // 3)
+    width = groups * 3
+
+    # Right-align the integer part, cut it into 3-digit columns and join them
+    # with commas, then drop the padding
+    padded = np.char.rjust(digits, width).astype(f"<U{width}")
+    chars = padded.view("<U1").reshape(len(values), groups, 3)
+    commas = np.full((len(values), groups, 1), ",", dtype="<U1")
+    joined = np.concatenate([commas, chars], axis=2).reshape(len(values), -1)
+    grouped = np.char.lstrip(joined.view(f"<U{groups * 4}").ravel(), " ,")
+
+    formatted = np.char.add(np.char.add(grouped, point), fraction)
+    formatted = np.where(np.signbit(values), np.char.add("-", formatted), formatted)
+    return np.where(np.isfinite(values), formatted, plain).astype(object)
+
+
+def truncate_text(series, width):
+    # x[:width] + "..." for values longer than width
+    return series.mask(series.str.len() > width, series.str.slice(0, width) + "...")
+
+
+def format_dates(series, fmt):
+    # Scraped frames repeat the same few dates, parse and format each once
+    codes, uniques = pd.factorize(series)
+    formatted = pd.to_datetime(pd.Series(uniques)).dt.strftime(fmt).to_numpy(object)
+    # Missing values get code -1, which picks the NaN appended at the end
+    return pd.Series(np.append(formatted, np.nan)[codes], index=series.index)
+
+
+@timed("tables.format_flights")
+def format_flights(df):
+    df["return_date"] = df["return_date"].fillna("One-way")
+    df["price"] = format_thousands(df["price"])
+    df["full_price"] = df["price"] + " " + df["currency"].to_numpy(object).astype(str)
+
+    # Format dates
+    df["departure_date"] = format_dates(df["departure_date"], "%b %d, %Y")
+    df["search_date"] = format_dates(df["search_date"], "%b %d, %Y %H:%M")
+
+    mask = df["return_date"] != "One-way"
+    if mask.any():
+        df.loc[mask, "return_date"] = format_dates(
+            df.loc[mask, "return_date"], "%b %d, %Y"
+        )
+
+    return df
 
 
+@timed("tables.format_events")
+def format_events(df):
+    df["search_date"] = format_dates(df["search_date"], "%b %d, %Y %H:%M")
+    df["title"] = truncate_text(df["title"], 50)
+    df["location"] = truncate_text(df["location"], 30)
+    return df
+
+
+@timed("tables.flights")
 def get_flights_table(limit=10, destination=None, departure=None):
     conn = connect_to_db()
 
@@ -31,13 +98,14 @@ def get_flights_table(limit=10, destination=None, departure=None):
     conditions = []
     params = []
 
+    # Prefix matches on the normalized columns can use the city indexes
     if destination:
-        conditions.append("destination_city LIKE ?")
-        params.append(f"%{destination}%")
+        conditions.append("destination_city_norm >= ? AND destination_city_norm < ?")
+        params.extend(prefix_bounds(destination))
 
     if departure:
-        conditions.append("departure_city LIKE ?")
-        params.append(f"%{departure}%")
+        conditions.append("departure_city_norm >= ? AND departure_city_norm < ?")
+        params.extend(prefix_bounds(departure))
 
     if conditions:
         query += " WHERE " + " AND ".join(conditions)
@@ -48,30 +116,12 @@ def get_flights_table(limit=10, destination=None, departure=None):
     df = pd.read_sql_query(query, conn, params=params)
 
     if not df.empty:
-        df["return_date"] = df["return_date"].fillna("One-way")
-        df["price"] = df["price"].map(lambda x: f"{x:,.2f}")
-        df["full_price"] = df.apply(
-            lambda row: f"{row['price']} {row['currency']}", axis=1
-        )
+        df = format_flights(df)
 
-        # Format dates
-        df["departure_date"] = pd.to_datetime(df["departure_date"]).dt.strftime(
-            "%b %d, %Y"
-        )
-        df["search_date"] = pd.to_datetime(df["search_date"]).dt.strftime(
-            "%b %d, %Y %H:%M"
-        )
-
-        mask = df["return_date"] != "One-way"
-        if mask.any():
-            df.loc[mask, "return_date"] = pd.to_datetime(
-                df.loc[mask, "return_date"]
-            ).dt.strftime("%b %d, %Y")
-
-    conn.close()
     return df
 
 
+@timed("tables.events")
 def get_events_table(city=None, limit=10):
     conn = connect_to_db()
 
@@ -89,8 +139,8 @@ def get_events_table(city=None, limit=10):
 
     params = []
     if city:
-        query += " WHERE city LIKE ?"
-        params.append(f"%{city}%")
+        query += " WHERE city_norm >= ? AND city_norm < ?"
+        params.extend(prefix_bounds(city))
 
     query += " ORDER BY search_date DESC LIMIT ?"
     params.append(limit)
@@ -98,16 +148,8 @@ def get_events_table(city=None, limit=10):
     df = pd.read_sql_query(query, conn, params=params)
 
     if not df.empty:
-        df["search_date"] = pd.to_datetime(df["search_date"]).dt.strftime(
-            "%b %d, %Y %H:%M"
-        )
-
-        df["title"] = df["title"].apply(lambda x: x[:50] + "..." if len(x) > 50 else x)
-        df["location"] = df["location"].apply(
-            lambda x: x[:30] + "..." if len(x) > 30 else x
-        )
+        df = format_events(df)
 
-    conn.close()
     return df
 
 
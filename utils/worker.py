@@ -0,0 +1,144 @@
+import os
+import signal
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from functools import partial
+
+from scrappers.engine import get_engine
+from scrappers.esky_scraper import flight_search_task
+from scrappers.eventbrite_scraper import event_search_task
+from utils.database import (
+    get_known_event_ids,
+    initialize_db,
+    save_fetched_events,
+    save_fetched_flights,
+)
+from utils.job_queue import (
+    LEASE_SECONDS,
+    claim_jobs,
+    complete_job,
+    describe_job,
+    fail_job,
+    release_jobs,
+    renew_leases,
+)
+
+DEFAULT_SLOTS = 4
+POLL_SECONDS = 2.0
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def build_task(job):
+    # The engine saves what the search fetches, a failed save fails the job
+    params = job["params"]
+    if job["kind"] == "flights":
+        task = flight_search_task(
+            params["departure_code"],
+            params["destination_code"],
+            params["departure_date"],
+            params["return_date"],
+            params["seats"],
+        )
+        task.on_fetched = partial(save_fetched_flights, params)
+        return task
+    task = event_search_task(
+        params["city"],
+        params["start_date"],
+        params["end_date"],
+        known_ids=get_known_event_ids(params["city"]),
+    )
+    task.on_fetched = partial(save_fetched_events, params["city"])
+    return task
+
+
+def _finish(job, result, worker_id, duration):
+    if not result.ok:
+        fail_job(job["id"], worker_id, result.error, duration)
+        print(f"Job #{job['id']} failed ({job['attempts']}): {result.error}")
+        return
+
+    # Cached results were saved by whichever search fetched them
+    rows = result.saved["rows"] if result.saved else 0
+    if complete_job(job["id"], worker_id, rows, duration):
+        print(f"Job #{job['id']} done in {duration:.1f}s: {rows} rows")
+    else:
+        print(f"Job #{job['id']} finished after its lease was taken over")
+
+
+def run_worker(
+    slots=DEFAULT_SLOTS,
+    lease_seconds=LEASE_SECONDS,
+    poll_seconds=POLL_SECONDS,
+    once=False,
+):
+    # Keeps `slots` jobs running on the shared engine, so the browser stays
+    # warm between jobs. SIGTERM stops claiming and lets running jobs finish,
+    # Ctrl+C hands them back to the queue. once=True exits when the queue
+    # is empty.
+    initialize_db()
+    engine = get_engine()
+    worker_id = worker_name()
+    running = {}
+    stopping = False
+    stats = {"done": 0, "failed": 0}
+    last_renewal = time.monotonic()
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        print("Stopping after the running jobs finish...")
+
+    signal.signal(signal.SIGTERM, stop)
+    print(f"Worker {worker_id} running {slots} slots")
+
+    try:
+        while True:
+            if not stopping and len(running) < slots:
+                for job in claim_jobs(worker_id, slots - len(running), lease_seconds):
+                    try:
+                        task = build_task(job)
+                    except (KeyError, ValueError) as e:
+                        fail_job(job["id"], worker_id, f"Bad job: {e}", 0.0, False)
+                        print(f"Job #{job['id']} is malformed: {e}")
+                        continue
+                    print(f"Job #{job['id']} started: {describe_job(job)}")
+                    future = engine.submit(engine.run_task(task))
+                    running[future] = (job, time.perf_counter())
+
+            if not running:
+                if stopping or once:
+                    break
+                time.sleep(poll_seconds)
+                continue
+
+            done, _ = wait(running, timeout=poll_seconds, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, started = running.pop(future)
+                result = future.result()
+                _finish(job, result, worker_id, time.perf_counter() - started)
+                stats["done" if result.ok else "failed"] += 1
+
+            # Renewed well before expiry so one slow poll cannot lose a lease
+            if running and time.monotonic() - last_renewal > lease_seconds / 3:
+                held = renew_leases(
+                    worker_id, [job["id"] for job, _ in running.values()], lease_seconds
+                )
+                for future, (job, _) in list(running.items()):
+                    if job["id"] not in held:
+                        print(f"Job #{job['id']} lost its lease, dropping it")
+                        future.cancel()
+                        del running[future]
+                last_renewal = time.monotonic()
+    except KeyboardInterrupt:
+        released = release_jobs(worker_id)
+        print(f"\nInterrupted, {released} running jobs returned to the queue")
+
+    print(
+        f"Worker {worker_id} finished {stats['done']} jobs, "
+        f"{stats['failed']} attempts failed"
+    )
+    return stats